@@ -1,16 +1,21 @@
 # api_supabase.py
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse, JSONResponse, PlainTextResponse
 import uvicorn
 import os
+import sys
 import uuid
-import shutil
 import json
+import time
+import asyncio
 import numpy as np
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Dict, List
 from contextlib import asynccontextmanager
+from pydantic import BaseModel
 
 class NumpyEncoder(json.JSONEncoder):
     """Custom JSON encoder for numpy types"""
@@ -28,50 +33,256 @@ def convert_to_json_safe(data):
     return json.loads(json.dumps(data, cls=NumpyEncoder))
 
 from supabase_config import get_supabase_client, get_admin_client
-from supabase import Client
+import backend_path  # noqa: F401  (modules shared with backend/)
+from song_store import SupabaseSongStore, AsyncSongStore, encode_cursor, decode_cursor
+from upload_storage import (stream_upload, max_upload_bytes, StoredUpload,
+                            UploadTooLarge, UnsupportedAudioFormat)
+from response_cache import ResponseCache, etag_matches
+from health_monitor import HealthMonitor
+from metrics import Metrics, instrument_app, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from job_queue import JobQueue, AsyncJobRunner, watch_stage, JOB_STATES
 
-from direct_audio_test import extract_audio_features_direct
+import features_path  # noqa: F401  (scripts/features modules below)
+from direct_audio_test import extract_audio_features_direct, DEFAULT_DIRECT_EXCERPT
+from feature_cache import FeatureCache
+from audio_processor import PreviewFeatureExtractor, EXTRACTOR_VERSION
+from extraction_profiler import STAGE_HISTOGRAMS
 from integrated_analyzer import MusicMarketingAnalyzer
+from extraction_workers import ExtractionWorkerPool
 
 analyzer = None
+feature_cache = None
+preview_extractor = None
+extraction_pool = None
+job_queue = None
+job_runner = None
+song_store = None
+worker_store = None
+worker_queue = None
+analysis_cache = None
+health_monitor = None
+
+ANALYSIS_JOB = 'analyze_song'
+
+# Served at /metrics; stage timings from the extraction workers are sent
+# back with each job's result and recorded here
+metrics = Metrics()
+metrics.describe('stage_seconds', 'Time per analysis pipeline stage (decode, extract, '
+                                  'each model, db_write, total) and upload')
+metrics.describe('db_seconds', 'Supabase call latency from the API process, by method')
+metrics.describe('db_errors_total', 'Failed Supabase calls from the API process, by method')
+metrics.describe('batch_stage_seconds', 'Time per model for whole /api/analyze/batch requests')
+metrics.describe('upload_dedup_total', 'Uploads by whether an earlier analysis of the same audio was reused')
+metrics.describe('analysis_jobs_total', 'Finished analysis job attempts by result')
+
+def observe_db_call(method: str, seconds: float, failed: bool):
+    metrics.observe('db_seconds', seconds, method=method)
+    if failed:
+        metrics.inc('db_errors_total', method=method)
+
+def load_analyzer():
+    """Load the ML models; None if they cannot be loaded"""
+    print("Loading ML models...")
+    try:
+        loaded = MusicMarketingAnalyzer()
+        loaded.load_models()
+        
+        if loaded.models_loaded:
+            # The first prediction pays for lazy imports; keep that off requests
+            loaded.analyze_song({})
+            print("ML models loaded successfully!")
+        else:
+            print("ML models not fully loaded, will use basic analysis")
+        return loaded
+    except Exception as e:
+        print(f"Error loading ML models: {e}")
+        return None
+
+def current_analysis_version() -> str:
+    """What an analysis made now depends on: the models, the extractor and the excerpt
+    
+    Stored with each completed song; an upload of the same audio reuses a
+    prior analysis only if it has the same version. MODEL_VERSION overrides
+    the digest of the model files.
+    """
+    if analyzer is not None and getattr(analyzer, 'models_loaded', False):
+        models = os.getenv("MODEL_VERSION") or analyzer.model_version
+    else:
+        models = 'basic'
+    excerpt = os.getenv("ANALYSIS_EXCERPT") or DEFAULT_DIRECT_EXCERPT
+    return f"models={models};extractor={EXTRACTOR_VERSION};excerpt={excerpt}"
+
+def create_feature_cache():
+    """Feature cache for re-uploaded audio; None if unavailable"""
+    try:
+        cache = FeatureCache(
+            cache_dir=os.getenv("FEATURE_CACHE_DIR", "feature-cache"),
+            max_entries=int(os.getenv("FEATURE_CACHE_MAX_ENTRIES", "10000"))
+        )
+        print(f"Feature cache ready: {cache.stats()['entries']} entries")
+        return cache
+    except Exception as e:
+        print(f"Feature cache unavailable: {e}")
+        return None
+
+def create_analysis_cache():
+    """Cache of completed analysis responses
+    
+    Set ANALYSIS_CACHE_DB to a local file to share entries (and
+    invalidations) between the API and worker processes on this host.
+    """
+    return ResponseCache(
+        max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "2048")),
+        ttl=float(os.getenv("ANALYSIS_CACHE_TTL", "3600")),
+        shared_path=os.getenv("ANALYSIS_CACHE_DB") or None
+    )
+
+def init_extraction_worker():
+    """Runs once in each extraction worker process"""
+    global analyzer, feature_cache, analysis_cache
+    analyzer = load_analyzer()
+    feature_cache = create_feature_cache()
+    analysis_cache = create_analysis_cache()
+
+def get_worker_store() -> SupabaseSongStore:
+    """Synchronous store for analysis writes, one per process"""
+    global worker_store
+    if worker_store is None:
+        worker_store = SupabaseSongStore(get_admin_client())
+    return worker_store
+
+def create_job_queue():
+    """Durable analysis queue; put JOB_QUEUE_DB on a persistent volume"""
+    return JobQueue(
+        db_path=os.getenv("JOB_QUEUE_DB", "job_queue.db"),
+        visibility_timeout=int(os.getenv("JOB_VISIBILITY_TIMEOUT", "900")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    )
+
+def report_stage(song_id: str, stage: str):
+    """Publish the analysis stage for /api/songs/{id}/events; never fails the job"""
+    global worker_queue
+    try:
+        if worker_queue is None:
+            worker_queue = create_job_queue()
+        worker_queue.report_stage(song_id, stage)
+    except Exception as e:
+        print(f"Could not report stage {stage} for song {song_id}: {e}")
+
+def mark_song_failed(job: dict, error):
+    """Runs once a song's analysis job has used up its retries"""
+    song_id = job['payload']['song_id']
+    print(f"Analysis for song {song_id} failed permanently: {error}")
+    get_worker_store().update_song(song_id, {'processing_status': 'failed'})
+
+async def on_analysis_dead(job: dict, error):
+    metrics.inc('analysis_jobs_total', result='dead')
+    await asyncio.to_thread(mark_song_failed, job, error)
+
+async def run_analysis_job(job: dict):
+    """Job handler: run the analysis in the extraction worker pool"""
+    payload = job['payload']
+    # The worker invalidates too, but that only reaches this process
+    # through a shared cache file
+    analysis_cache.invalidate(payload['song_id'])
+    try:
+        timings = await extraction_pool.submit(payload['song_id'], payload['file_path'],
+                                               payload['metadata'])
+    except Exception:
+        metrics.inc('analysis_jobs_total', result='failed')
+        raise
+    finally:
+        analysis_cache.invalidate(payload['song_id'])
+    metrics.inc('analysis_jobs_total', result='succeeded')
+    metrics.observe_timings('stage_seconds', timings or {})
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan events"""
-    global analyzer
+    global analyzer, feature_cache, preview_extractor, extraction_pool, job_queue, job_runner
+    global song_store, analysis_cache, health_monitor
     
     print("Starting Music Marketing API with Supabase...")
     
+    # Database calls run on a small thread pool so they never block the
+    # event loop; the client and its connections are shared by all requests
+    song_store = AsyncSongStore(
+        SupabaseSongStore(get_supabase_client()),
+        max_concurrency=int(os.getenv("DB_MAX_CONCURRENCY", "8")),
+        on_call=observe_db_call
+    )
+    
+    # Opened before the health monitor, which reports its stats
+    job_queue = create_job_queue()
+    
+    # Probes read the monitor's results; it pings Supabase in the
+    # background and refreshes the detailed stats less often
+    health_monitor = HealthMonitor(
+        song_store,
+        ping_interval=float(os.getenv("DB_PING_INTERVAL", "10")),
+        stats_interval=float(os.getenv("HEALTH_STATS_INTERVAL", "60")),
+        stats={
+            'songs_in_db': song_store.count_songs,
+            'job_queue': job_queue.stats
+        }
+    )
+    
     # Test Supabase connection
-    try:
-        supabase = get_supabase_client()
-        result = supabase.table('songs').select('id').limit(1).execute()
+    if await health_monitor.check_database():
         print("Supabase connection successful!")
-    except Exception as e:
-        print(f"Supabase connection failed: {e}")
+    else:
+        print(f"Supabase connection failed: {health_monitor.db_error}")
         print("Make sure you've:")
         print("1. Created your Supabase project")
         print("2. Added credentials to .env file") 
         print("3. Created the database tables")
     
-    # Load ML models
-    print("Loading ML models...")
-    try:
-        analyzer = MusicMarketingAnalyzer()
-        analyzer.load_models()
-        
-        if analyzer.models_loaded:
-            print("ML models loaded successfully!")
-        else:
-            print("ML models not fully loaded, will use basic analysis")
-    except Exception as e:
-        print(f"Error loading ML models: {e}")
-        analyzer = None
+    analyzer = load_analyzer()
+    feature_cache = create_feature_cache()
+    analysis_cache = create_analysis_cache()
+    
+    # Fast preview tier for the upload UI
+    preview_extractor = PreviewFeatureExtractor(
+        cache=feature_cache,
+        excerpt=os.getenv("PREVIEW_EXCERPT", "preview")
+    )
+    
+    # Full analysis runs in worker processes; each loads its own models
+    workers = int(os.getenv("EXTRACTION_WORKERS", "0")) or None
+    max_pending = int(os.getenv("EXTRACTION_MAX_PENDING", "0")) or None
+    extraction_pool = ExtractionWorkerPool(
+        process_song_with_supabase,
+        max_workers=workers,
+        max_pending=max_pending,
+        initializer=init_extraction_worker
+    ).start()
+    print(f"Extraction workers: {extraction_pool.max_workers} "
+          f"(max {extraction_pool.max_pending} pending)")
+    
+    # Uploads are enqueued durably (job_queue, opened above); jobs left
+    # running by a previous process are picked up again once their lease
+    # expires. With JOB_DISPATCHER=false this process only enqueues and
+    # separate `python api_supabase.py worker` processes do the work.
+    if os.getenv("JOB_DISPATCHER", "true").lower() != "false":
+        job_runner = AsyncJobRunner(
+            job_queue, run_analysis_job,
+            concurrency=extraction_pool.max_workers,
+            kinds=[ANALYSIS_JOB],
+            on_dead=on_analysis_dead
+        ).start()
+    print(f"Job queue ready: {job_queue.stats()}")
+    
+    health_monitor.start()
     
     yield
     
-    # Shutdown
+    # Shutdown: unfinished jobs are handed back to the queue
     print("Shutting down API...")
+    await health_monitor.stop()
+    if job_runner:
+        await job_runner.stop()
+    await extraction_pool.shutdown()
+    song_store.close()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -88,10 +299,45 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument_app(app, metrics)
+
+def cache_counts(attribute: str) -> dict:
+    caches = {'analysis_response': analysis_cache, 'audio_features': feature_cache}
+    return {name: getattr(cache, attribute) for name, cache in caches.items() if cache is not None}
 
-def get_supabase() -> Client:
-    """Dependency to get Supabase client"""
-    return get_supabase_client()
+def cache_hit_ratios() -> dict:
+    hits, misses = cache_counts('hits'), cache_counts('misses')
+    return {name: hits[name] / (hits[name] + misses[name]) if hits[name] + misses[name] else 0.0
+            for name in hits}
+
+async def job_queue_depths():
+    if job_queue is None:
+        return None
+    stats = await asyncio.to_thread(job_queue.stats)
+    return {state: stats[state] for state in JOB_STATES}
+
+(metrics
+    .describe('jobs_in_flight', 'Analysis jobs running or waiting in the extraction workers')
+    .describe('job_queue_jobs', 'Jobs in the durable queue by state')
+    .describe('cache_hit_ratio', 'Hit ratio of the analysis response and audio feature caches')
+    .describe('extractor_stage_seconds', 'Extractor stage timings from profiled extractors in this process')
+    .collect('jobs_in_flight', lambda: extraction_pool.stats()['in_flight'] if extraction_pool else None)
+    .collect('job_queue_jobs', job_queue_depths, label='state')
+    .collect('cache_hits_total', lambda: cache_counts('hits'), kind='counter', label='cache')
+    .collect('cache_misses_total', lambda: cache_counts('misses'), kind='counter', label='cache')
+    .collect('cache_hit_ratio', cache_hit_ratios, label='cache')
+    .collect('extractor_stage_seconds', STAGE_HISTOGRAMS.snapshot, kind='histogram'))
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition of this process's metrics
+    
+    Covers pipeline stage and model timings (reported by the extraction
+    workers with each finished job), Supabase latency and errors, request
+    counts, queue depth, in-flight jobs and cache hit rates. Jobs run by
+    standalone `worker` processes are not included.
+    """
+    return PlainTextResponse(await metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 @app.get("/")
 async def root():
@@ -105,25 +351,57 @@ async def root():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is serving requests (no I/O)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 200 once models are loaded and Supabase answered recently
+    
+    Uses the background ping (see HealthMonitor), which must be no older
+    than DB_PING_MAX_AGE seconds; never queries the database itself. Set
+    READY_REQUIRES_MODELS=false to serve basic analysis without models.
+    """
+    models_loaded = analyzer is not None and getattr(analyzer, 'models_loaded', False)
+    models_ok = models_loaded or os.getenv("READY_REQUIRES_MODELS", "true").lower() == "false"
+    database_ok = health_monitor is not None and health_monitor.database_ready(
+        float(os.getenv("DB_PING_MAX_AGE", "30")))
+    ready = models_ok and database_ok
+    
+    return JSONResponse({
+        "status": "ready" if ready else "not_ready",
+        "models_loaded": models_loaded,
+        "database": "supabase-connected" if database_ok else "unavailable",
+        "db_ping_age": health_monitor.ping_age() if health_monitor else None
+    }, status_code=200 if ready else 503)
+
 @app.get("/health")
-async def health_check(supabase: Client = Depends(get_supabase)):
-    """Detailed health check"""
-    try:
-        songs_result = supabase.table('songs').select('id', count='exact').execute()
-        
-        return {
-            "status": "healthy",
-            "models_loaded": analyzer is not None and getattr(analyzer, 'models_loaded', False),
-            "database": "supabase-connected",
-            "songs_in_db": songs_result.count if hasattr(songs_result, 'count') else 0,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "database_error": str(e),
-            "timestamp": datetime.utcnow().isoformat()
-        }
+async def health_check():
+    """Detailed health check
+    
+    Song count and queue stats are gathered in the background every
+    HEALTH_STATS_INTERVAL seconds (``stats_updated_at``), so this does no
+    database I/O either.
+    """
+    monitor = health_monitor
+    response = {
+        "status": "healthy" if monitor.db_ok else "unhealthy",
+        "models_loaded": analyzer is not None and getattr(analyzer, 'models_loaded', False),
+        "database": "supabase-connected" if monitor.db_ok else "supabase-unavailable",
+        "db_latency": monitor.db_latency,
+        "db_ping_age": monitor.ping_age(),
+        "songs_in_db": monitor.stats.get('songs_in_db'),
+        "extraction_workers": extraction_pool.stats() if extraction_pool else None,
+        "job_queue": monitor.stats.get('job_queue'),
+        "stats_updated_at": (datetime.utcfromtimestamp(monitor.stats_updated_at).isoformat()
+                             if monitor.stats_updated_at else None),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    if monitor.db_error:
+        response["database_error"] = monitor.db_error
+    return response
 
 def validate_audio_file(file: UploadFile) -> tuple[bool, list[str]]:
     """Validate uploaded audio file"""
@@ -139,72 +417,102 @@ def validate_audio_file(file: UploadFile) -> tuple[bool, list[str]]:
     
     return len(errors) == 0, errors
 
-async def save_uploaded_file(upload_file: UploadFile, song_id: str) -> str:
-    """Save uploaded file locally (will move to Supabase Storage later)"""
-    upload_dir = "uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    file_extension = os.path.splitext(upload_file.filename)[1] if upload_file.filename else '.mp3'
-    safe_filename = f"{song_id}{file_extension}"
-    file_path = os.path.join(upload_dir, safe_filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
+async def save_uploaded_file(upload_file: UploadFile, song_id: str) -> StoredUpload:
+    """Stream the upload to disk (will move to Supabase Storage later)
+
+    The stored file is named after the song and the format sniffed from its
+    content; its size and SHA-256 are measured on the way through.
+    """
+    return await stream_upload(
+        upload_file, os.getenv("UPLOAD_DIR", "uploads"), song_id,
+        max_bytes=max_upload_bytes()
+    )
+
+async def discard_upload(file_path: str):
+    """Delete a stored upload that no song refers to"""
+    try:
+        await asyncio.to_thread(os.unlink, file_path)
+    except OSError as e:
+        print(f"Could not delete unused upload {file_path}: {e}")
+
+def build_analysis_row(song_id: str, features: dict, processing_time: float) -> dict:
+    """Row for the analysis table from extracted features
     
-    return file_path
+    feature_quality is 'preview' for the row stored at upload with
+    ?preview=true; the full analysis overwrites it (rows are keyed on
+    song_id) with 'full'.
+    """
+    return {
+        'song_id': song_id,
+        'danceability': float(features.get('danceability', 0)),
+        'energy': float(features.get('energy', 0)),
+        'valence': float(features.get('valence', 0)),
+        'acousticness': float(features.get('acousticness', 0)),
+        'instrumentalness': float(features.get('instrumentalness', 0)),
+        'liveness': float(features.get('liveness', 0)),
+        'speechiness': float(features.get('speechiness', 0)),
+        'tempo': float(features.get('tempo', 0)),
+        'loudness': float(features.get('loudness', 0)),
+        'key': int(features.get('key', 0)),
+        'mode': int(features.get('mode', 0)),
+        'time_signature': int(features.get('time_signature', 4)),
+        'audio_appeal': float(features.get('audio_appeal', 0)),
+        'feature_quality': features.get('feature_quality', 'full'),
+        'processing_time': processing_time,
+        'raw_features': convert_to_json_safe(features)
+    }
 
 def process_song_with_supabase(song_id: str, file_path: str, metadata: dict):
-    """Process song and save results to Supabase"""
+    """Process song and save results to Supabase
+    
+    Runs in an extraction worker process (see init_extraction_worker).
+    Errors are re-raised so the job queue can retry the song; the queue
+    marks it failed once retries are exhausted. Returns the seconds spent
+    in each stage, for the API process's metrics.
+    """
     global analyzer
     
-    supabase = get_admin_client()
+    store = get_worker_store()
+    timings = {}
+    stage_started = {}
+    
+    def on_stage(stage):
+        stage_started[stage] = time.perf_counter()
+        report_stage(song_id, stage)
     
     try:
         # Update status to processing
-        supabase.table('songs').update({
-            'processing_status': 'processing'
-        }).eq('id', song_id).execute()
+        store.update_song(song_id, {'processing_status': 'processing'})
+        analysis_cache.invalidate(song_id)
         
         print(f"Processing song {song_id}...")
         start_time = datetime.utcnow()
         
-        # Extract audio features
-        features = extract_audio_features_direct(file_path)
+        # Extract audio features (served from the cache for known audio)
+        features = extract_audio_features_direct(
+            file_path, cache=feature_cache, excerpt=os.getenv("ANALYSIS_EXCERPT"),
+            on_stage=on_stage
+        )
         
         if not features:
             raise Exception("Failed to extract audio features")
         
+        if 'extracting' in stage_started:
+            timings['decode'] = stage_started['extracting'] - stage_started['decoding']
+            timings['extract'] = time.perf_counter() - stage_started['extracting']
+        
         # Run marketing analysis
+        report_stage(song_id, 'modelling')
         if analyzer and getattr(analyzer, 'models_loaded', False):
-            analysis_result = analyzer.analyze_song(features, metadata)
+            analysis_result = analyzer.analyze_song(features, metadata, timings)
         else:
             analysis_result = create_basic_analysis(features, metadata)
         
         processing_time = (datetime.utcnow() - start_time).total_seconds()
         
-        # Save analysis to Supabase
-        analysis_data = {
-            'song_id': song_id,
-            'danceability': float(features.get('danceability', 0)),
-            'energy': float(features.get('energy', 0)),
-            'valence': float(features.get('valence', 0)),
-            'acousticness': float(features.get('acousticness', 0)),
-            'instrumentalness': float(features.get('instrumentalness', 0)),
-            'liveness': float(features.get('liveness', 0)),
-            'speechiness': float(features.get('speechiness', 0)),
-            'tempo': float(features.get('tempo', 0)),
-            'loudness': float(features.get('loudness', 0)),
-            'key': int(features.get('key', 0)),
-            'mode': int(features.get('mode', 0)),
-            'time_signature': int(features.get('time_signature', 4)),
-            'audio_appeal': float(features.get('audio_appeal', 0)),
-            'processing_time': processing_time,
-            'raw_features': convert_to_json_safe(features)
-        }
-        
-        supabase.table('analysis').insert(analysis_data).execute()
+        analysis_data = build_analysis_row(song_id, features, processing_time)
         
-        # Save marketing insights
+        insights_data = None
         if 'target_demographics' in analysis_result:
             insights_data = {
                 'song_id': song_id,
@@ -227,22 +535,24 @@ def process_song_with_supabase(song_id: str, file_path: str, metadata: dict):
                 'competitive_advantage': analysis_result['marketing_insights']['positioning']['competitive_advantage'],
                 'overall_confidence': analysis_result['confidence_scores']['platforms']
             }
-            
-            supabase.table('marketing_insights').insert(insights_data).execute()
         
-        # Update song status
-        supabase.table('songs').update({
+        # Analysis, insights and the completed status in one round trip
+        write_started = time.perf_counter()
+        store.save_analysis_results(song_id, analysis_data, insights_data, {
             'processing_status': 'completed',
-            'duration': features.get('duration')
-        }).eq('id', song_id).execute()
+            'duration': features.get('duration'),
+            'analysis_version': current_analysis_version()
+        })
+        timings['db_write'] = time.perf_counter() - write_started
+        analysis_cache.invalidate(song_id)
         
+        timings['total'] = (datetime.utcnow() - start_time).total_seconds()
         print(f"Song {song_id} processed successfully in {processing_time:.2f}s")
+        return timings
         
     except Exception as e:
         print(f"Error processing song {song_id}: {e}")
-        supabase.table('songs').update({
-            'processing_status': 'failed'
-        }).eq('id', song_id).execute()
+        raise
 
 def create_basic_analysis(features: dict, metadata: dict) -> dict:
     """Basic analysis fallback"""
@@ -287,21 +597,103 @@ def create_basic_analysis(features: dict, metadata: dict) -> dict:
         }
     }
 
+async def compute_preview_features(file_path: str) -> Optional[dict]:
+    """Preview-tier features off the event loop; None if extraction fails"""
+    if preview_extractor is None:
+        return None
+    try:
+        features = await run_in_threadpool(preview_extractor.extract_features, file_path)
+        return convert_to_json_safe(features)
+    except Exception as e:
+        print(f"Preview extraction failed for {file_path}: {e}")
+        return None
+
+async def store_preview_features(song_id: str, file_path: str) -> Optional[dict]:
+    """Compute preview features and save them as the song's analysis row
+    
+    The row is marked feature_quality='preview' so clients reading the
+    analysis table can show it until the full analysis overwrites it.
+    Failing to save only loses the stored copy; the features are still
+    returned.
+    """
+    started = time.perf_counter()
+    features = await compute_preview_features(file_path)
+    if features is None:
+        return None
+    try:
+        await song_store.save_analysis_results(
+            song_id, build_analysis_row(song_id, features, time.perf_counter() - started))
+    except Exception as e:
+        print(f"Could not store preview features for song {song_id}: {e}")
+    return features
+
+async def reuse_prior_analysis(song: dict) -> bool:
+    """Complete song with a copy of an earlier analysis of the same audio, if there is one
+    
+    Any failure here only means the song is analysed from scratch.
+    """
+    version = current_analysis_version()
+    try:
+        source = await song_store.find_analysed_song(song['content_hash'], version)
+        if source is None or source['id'] == song['id']:
+            metrics.inc('upload_dedup_total', result='miss')
+            return False
+        
+        fields = {
+            'processing_status': 'completed',
+            'duration': source.get('duration'),
+            'analysis_version': version
+        }
+        if source.get('file_path'):
+            # Same bytes, so the new song can share the earlier upload's file
+            fields['file_path'] = source['file_path']
+        if not await song_store.clone_analysis(source['id'], song['id'], fields):
+            metrics.inc('upload_dedup_total', result='miss')
+            return False
+    except Exception as e:
+        print(f"Could not reuse an analysis for song {song['id']}: {e}")
+        metrics.inc('upload_dedup_total', result='error')
+        return False
+    
+    metrics.inc('upload_dedup_total', result='reused')
+    song.update(fields, reused_analysis_from=source['id'])
+    return True
+
 @app.post("/api/songs/upload")
 async def upload_song(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     title: Optional[str] = None,
     artist_name: Optional[str] = None,
     genre: Optional[str] = None,
-    supabase: Client = Depends(get_supabase)
+    preview: bool = False,
+    force: bool = False
 ):
-    """Upload and analyze song"""
+    """Upload and analyze song
+    
+    With ``preview=true`` preview-quality features are computed from a short
+    excerpt (well under a second), returned in the response and stored as
+    the song's analysis row with feature_quality='preview'. The full
+    analysis still runs in the background and overwrites that row.
+    
+    If the same bytes were analysed before by the current models (see
+    current_analysis_version), that analysis is copied to the new song and
+    it is completed immediately (``reused_analysis_from`` names the source
+    song, whose stored file it shares, so the new copy is deleted);
+    ``force=true`` always runs the full analysis.
+    
+    Returns 503 with Retry-After when the analysis queue is full, 413 when
+    the file exceeds MAX_UPLOAD_MB and 415 when its content is not audio.
+    """
     
     is_valid, errors = validate_audio_file(file)
     if not is_valid:
         raise HTTPException(status_code=400, detail={"errors": errors})
     
+    max_depth = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "1000"))
+    if await run_in_threadpool(job_queue.depth) >= max_depth:
+        raise HTTPException(status_code=503, detail="Analysis queue is full",
+                            headers={"Retry-After": os.getenv("EXTRACTION_RETRY_AFTER", "10")})
+    
     song_id = str(uuid.uuid4())
     
     if not title and file.filename:
@@ -312,7 +704,9 @@ async def upload_song(
         genre = "pop"
     
     try:
-        file_path = await save_uploaded_file(file, song_id)
+        with metrics.time('stage_seconds', stage='upload'):
+            stored = await save_uploaded_file(file, song_id)
+        file_path = stored.path
         
         song_data = {
             'id': song_id,
@@ -320,12 +714,18 @@ async def upload_song(
             'artist_name': artist_name,
             'genre': genre,
             'file_path': file_path,
-            'file_size': getattr(file, 'size', 0),
+            'file_size': stored.size,
+            'content_hash': stored.sha256,
             'processing_status': 'pending',
             'user_id': None
         }
         
-        supabase.table('songs').insert(song_data).execute()
+        await song_store.insert_song(song_data)
+        
+        if not force and await reuse_prior_analysis(song_data):
+            if song_data['file_path'] != file_path:
+                await discard_upload(file_path)
+            return song_data
         
         metadata = {
             'track_name': title,
@@ -333,50 +733,140 @@ async def upload_song(
             'genre': genre
         }
         
-        background_tasks.add_task(process_song_with_supabase, song_id, file_path, metadata)
+        # Saved before the job is enqueued, so the full analysis always
+        # lands after the preview row and overwrites it
+        if preview:
+            song_data['preview_features'] = await store_preview_features(song_id, file_path)
+        
+        await run_in_threadpool(
+            job_queue.enqueue, ANALYSIS_JOB,
+            {'song_id': song_id, 'file_path': file_path, 'metadata': metadata},
+            dedupe_key=song_id
+        )
         
         return song_data
         
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedAudioFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-@app.get("/api/songs/{song_id}/status")
-async def get_song_status(song_id: str, supabase: Client = Depends(get_supabase)):
-    """Get song status"""
-    result = supabase.table('songs').select('*').eq('id', song_id).execute()
+class FeatureAnalysisRequest(BaseModel):
+    features: Dict[str, float]
+    metadata: Optional[dict] = None
+
+@app.post("/api/analyze/features")
+async def analyze_features(request: FeatureAnalysisRequest):
+    """Marketing analysis for an audio feature dict, returned inline
     
-    if not result.data:
-        raise HTTPException(status_code=404, detail="Song not found")
+    For clients that already have features (our cache, Spotify-style
+    metadata) and for interactive what-if changes: no upload, no queue and
+    no database writes, just the preloaded models (about 15 ms). Missing
+    features fall back to the analyzer's defaults.
+    """
+    if analyzer is None or not getattr(analyzer, 'models_loaded', False):
+        raise HTTPException(status_code=503, detail="Models not loaded")
     
-    return result.data[0]
+    timings = {}
+    result = await run_in_threadpool(analyzer.analyze_song, dict(request.features),
+                                     request.metadata, timings)
+    metrics.observe_timings('stage_seconds', timings)
+    # Serialised once here; FastAPI's own encoder walks the whole result again
+    return Response(json.dumps(result, cls=NumpyEncoder), media_type="application/json")
 
-@app.get("/api/songs/{song_id}/analysis")
-async def get_song_analysis(song_id: str, supabase: Client = Depends(get_supabase)):
-    """Get complete analysis"""
+class BatchAnalysisRequest(BaseModel):
+    songs: List[FeatureAnalysisRequest]
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """Marketing analysis for many feature dicts in one request
     
-    song_result = supabase.table('songs').select('*').eq('id', song_id).execute()
+    Each model runs once over all songs, so a catalogue of a few hundred
+    tracks takes well under a second instead of N single analyses. Results
+    come back in request order; at most ANALYZE_BATCH_MAX songs per call.
+    """
+    if analyzer is None or not getattr(analyzer, 'models_loaded', False):
+        raise HTTPException(status_code=503, detail="Models not loaded")
     
-    if not song_result.data:
-        raise HTTPException(status_code=404, detail="Song not found")
+    max_songs = int(os.getenv("ANALYZE_BATCH_MAX", "1000"))
+    if len(request.songs) > max_songs:
+        raise HTTPException(status_code=413,
+                            detail=f"{len(request.songs)} songs in one batch (max {max_songs})")
     
-    song = song_result.data[0]
+    timings = {}
+    results = await run_in_threadpool(
+        analyzer.analyze_batch,
+        [dict(song.features) for song in request.songs],
+        [song.metadata for song in request.songs],
+        timings
+    )
+    metrics.observe_timings('batch_stage_seconds', timings)
+    body = {"results": results, "count": len(results)}
+    return Response(json.dumps(body, cls=NumpyEncoder), media_type="application/json")
+
+@app.get("/api/songs/{song_id}/status")
+async def get_song_status(song_id: str):
+    """Get song status"""
+    song = await song_store.get_song(song_id)
     
-    if song['processing_status'] == "pending":
-        return {"id": song_id, "status": "pending", "message": "Analysis queued"}
-    elif song['processing_status'] == "processing":
-        return {"id": song_id, "status": "processing", "message": "Analysis in progress"}
-    elif song['processing_status'] == "failed":
-        raise HTTPException(status_code=422, detail="Analysis failed")
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
     
-    analysis_result = supabase.table('analysis').select('*').eq('song_id', song_id).execute()
-    insights_result = supabase.table('marketing_insights').select('*').eq('song_id', song_id).execute()
+    return song
+
+STATUS_STAGES = {'pending': 'queued', 'processing': 'running', 'completed': 'done', 'failed': 'failed'}
+
+def sse_event(event: str, data: dict, event_id: str = None) -> str:
+    """One server-sent event"""
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, cls=NumpyEncoder)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.get("/api/songs/{song_id}/events")
+async def song_events(song_id: str, request: Request):
+    """Server-sent events with the song's analysis stages, instead of polling /status
     
-    if not analysis_result.data:
-        raise HTTPException(status_code=500, detail="Analysis data not found")
+    Sends a ``stage`` event for the current stage and then for every
+    change (queued, running, decoding, extracting, modelling, done or
+    failed), and closes after done or failed. Stages come from the local
+    job queue that the workers report to, so an open stream costs no
+    Supabase queries; a song with no job there (e.g. analysed before its
+    job was purged) gets one event from its stored status.
+    """
+    def stream(events):
+        return StreamingResponse(events, media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    
+    if await run_in_threadpool(job_queue.latest_stage, song_id) is None:
+        song = await song_store.get_song(song_id, 'id,processing_status')
+        if not song:
+            raise HTTPException(status_code=404, detail="Song not found")
+        stage = STATUS_STAGES.get(song['processing_status'], song['processing_status'])
+        return stream(iter([sse_event('stage', {'song_id': song_id, 'stage': stage})]))
     
-    analysis = analysis_result.data[0]
-    insights = insights_result.data[0] if insights_result.data else None
+    async def events():
+        async for progress in watch_stage(job_queue, song_id,
+                                          poll_interval=float(os.getenv("EVENTS_POLL_INTERVAL", "0.5"))):
+            if await request.is_disconnected():
+                return
+            if progress is None:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_event('stage', {
+                'song_id': song_id,
+                'stage': progress['stage'],
+                'attempt': progress['attempts'],
+                'error': progress['last_error'] if progress['stage'] == 'failed' else None
+            }, event_id=f"{progress['job_id']}:{progress['stage']}")
     
+    return stream(events())
+
+def build_analysis_response(song_id: str, analysis: dict, insights: Optional[dict]) -> dict:
+    """Response body for a completed analysis"""
     response = {
         "song_id": song_id,
         "status": "completed",
@@ -428,12 +918,136 @@ async def get_song_analysis(song_id: str, supabase: Client = Depends(get_supabas
     
     return response
 
+@app.get("/api/songs/{song_id}/analysis")
+async def get_song_analysis(song_id: str, request: Request):
+    """Get complete analysis
+    
+    Completed analyses only change when a song is re-analysed, so their
+    serialised response is cached (see create_analysis_cache) and served
+    without touching Supabase. Responses carry an ETag; a client sending
+    it back in If-None-Match gets 304 Not Modified.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    cached = analysis_cache.get(song_id)
+    if cached is not None:
+        etag, body = cached
+        return analysis_response(body, etag, if_none_match)
+    
+    song = await song_store.get_song(song_id, 'id,processing_status')
+    
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    
+    if song['processing_status'] == "pending":
+        return {"id": song_id, "status": "pending", "message": "Analysis queued"}
+    elif song['processing_status'] == "processing":
+        return {"id": song_id, "status": "processing", "message": "Analysis in progress"}
+    elif song['processing_status'] == "failed":
+        raise HTTPException(status_code=422, detail="Analysis failed")
+    
+    analysis, insights = await song_store.get_analysis(song_id)
+    
+    if not analysis:
+        raise HTTPException(status_code=500, detail="Analysis data not found")
+    
+    body = json.dumps(build_analysis_response(song_id, analysis, insights),
+                      cls=NumpyEncoder).encode()
+    etag = analysis_cache.put(song_id, body)
+    return analysis_response(body, etag, if_none_match)
+
+def analysis_response(body: bytes, etag: str, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+# Columns a song listing may select; id and upload_timestamp are always
+# included because the page cursor is built from them
+SONG_LIST_FIELDS = ('id', 'title', 'artist_name', 'genre', 'file_path', 'file_size',
+                    'processing_status', 'upload_timestamp', 'duration', 'user_id')
+
+song_counts = {}
+
+async def cached_song_count(filters: dict) -> int:
+    """Song count for a filter set, refreshed at most every SONG_COUNT_TTL seconds"""
+    key = tuple(sorted(filters.items()))
+    now = time.monotonic()
+    cached = song_counts.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    
+    total = await song_store.count_songs(filters)
+    if len(song_counts) >= 256:
+        song_counts.clear()
+    song_counts[key] = (now + float(os.getenv("SONG_COUNT_TTL", "30")), total)
+    return total
+
 @app.get("/api/songs")
-async def list_songs(supabase: Client = Depends(get_supabase)):
-    """List all songs"""
-    result = supabase.table('songs').select('*').order('upload_timestamp', desc=True).execute()
-    return {"songs": result.data, "total": len(result.data)}
+async def list_songs(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    artist: Optional[str] = None,
+    genre: Optional[str] = None
+):
+    """List songs, newest first, one page at a time
+    
+    Pass the returned ``next_cursor`` as ``cursor`` for the next page (it
+    is null on the last one). ``fields`` is a comma-separated subset of
+    SONG_LIST_FIELDS; ``status``, ``artist`` and ``genre`` filter on exact
+    values. ``total`` counts all matching songs and may be up to
+    SONG_COUNT_TTL seconds old.
+    """
+    columns = '*'
+    if fields:
+        requested = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = sorted(set(requested) - set(SONG_LIST_FIELDS))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        columns = ','.join(dict.fromkeys(['id', 'upload_timestamp', *requested]))
+    
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filters = {column: value for column, value in (
+        ('processing_status', status), ('artist_name', artist), ('genre', genre)
+    ) if value is not None}
+    
+    # One extra row tells us whether another page follows
+    songs, total = await asyncio.gather(
+        song_store.list_songs(limit + 1, after, columns, filters),
+        cached_song_count(filters)
+    )
+    has_more = len(songs) > limit
+    songs = songs[:limit]
+    
+    return {
+        "songs": songs,
+        "total": total,
+        "next_cursor": encode_cursor(songs[-1]) if has_more else None
+    }
+
+async def run_standalone_worker():
+    """Consume the analysis queue in this process (no HTTP server)"""
+    init_extraction_worker()
+    queue = create_job_queue()
+    runner = AsyncJobRunner(
+        queue,
+        lambda job: asyncio.to_thread(process_song_with_supabase, job['payload']['song_id'],
+                                      job['payload']['file_path'], job['payload']['metadata']),
+        concurrency=int(os.getenv("JOB_WORKER_CONCURRENCY", "1")),
+        kinds=[ANALYSIS_JOB],
+        on_dead=on_analysis_dead
+    )
+    print(f"Analysis worker {runner.worker_id} consuming {queue.db_path}")
+    await runner.run()
 
 if __name__ == "__main__":
-    print("Starting Music Marketing AI with Supabase...")
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        asyncio.run(run_standalone_worker())
+    else:
+        print("Starting Music Marketing AI with Supabase...")
+        uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
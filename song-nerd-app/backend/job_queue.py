@@ -0,0 +1,452 @@
+# job_queue.py
+# Durable SQLite job queue with leases, retries and an async worker runner
+
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import asyncio
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_STATES = ('queued', 'running', 'succeeded', 'dead')
+
+# Progress reported for a job: the queue sets queued/running/done/failed,
+# handlers report the stages in between (see report_stage)
+TERMINAL_STAGES = ('done', 'failed')
+
+
+class JobQueue:
+    """Jobs persisted in SQLite so a restart never loses queued or running work.
+
+    A worker ``claim``s a job by taking a lease of ``visibility_timeout``
+    seconds; the claim runs in an IMMEDIATE transaction, so any number of
+    worker processes can share one database file without two of them
+    getting the same job. Long jobs extend the lease with ``heartbeat``.
+    If a worker dies, its lease runs out and the job becomes claimable
+    again. Failures are retried with exponential backoff until
+    ``max_attempts``, after which the job is dead-lettered.
+
+    Delivery is at-least-once: handlers should be safe to run twice for
+    the same job.
+    """
+
+    def __init__(self, db_path='job_queue.db', visibility_timeout=600, max_attempts=3,
+                 backoff_base=5.0, backoff_max=300.0):
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    dedupe_key TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    lease_expires_at REAL,
+                    worker_id TEXT,
+                    last_error TEXT,
+                    stage TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_claim '
+                         'ON jobs (status, available_at)')
+            # At most one live job per dedupe key (e.g. per song)
+            conn.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key)
+                WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running')
+            ''')
+            # Databases created before progress reporting lack the stage column
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'stage' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN stage TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_dedupe_key '
+                         'ON jobs (dedupe_key, created_at)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def enqueue(self, kind, payload, job_id=None, delay=0.0, max_attempts=None, dedupe_key=None):
+        """Add a job; returns its id (the existing live job's id for a duplicate dedupe_key)"""
+        now = time.time()
+        job_id = job_id or str(uuid.uuid4())
+        with self._connect() as conn:
+            try:
+                conn.execute('''
+                    INSERT INTO jobs (id, kind, payload, status, dedupe_key, max_attempts,
+                                      available_at, stage, created_at, updated_at)
+                    VALUES (?, ?, ?, 'queued', ?, ?, ?, 'queued', ?, ?)
+                ''', (job_id, kind, json.dumps(payload), dedupe_key,
+                      max_attempts or self.max_attempts, now + delay, now, now))
+            except sqlite3.IntegrityError:
+                if dedupe_key is None:
+                    raise
+                row = conn.execute('''
+                    SELECT id FROM jobs
+                    WHERE dedupe_key = ? AND status IN ('queued', 'running')
+                ''', (dedupe_key,)).fetchone()
+                if row is None:
+                    raise
+                return row['id']
+        return job_id
+
+    def claim(self, worker_id, kinds=None):
+        """Lease the next available job to worker_id; None if nothing is ready"""
+        now = time.time()
+        kind_filter = ''
+        params = [now, now]
+        if kinds:
+            kind_filter = f"AND kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Expired leases belong to crashed workers and are fair game
+            row = conn.execute(f'''
+                SELECT * FROM jobs
+                WHERE ((status = 'queued' AND available_at <= ?)
+                       OR (status = 'running' AND lease_expires_at <= ?
+                           AND attempts < max_attempts))
+                {kind_filter}
+                ORDER BY available_at
+                LIMIT 1
+            ''', params).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+
+            conn.execute('''
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, worker_id = ?,
+                    lease_expires_at = ?, stage = 'running', updated_at = ?
+                WHERE id = ?
+            ''', (worker_id, now + self.visibility_timeout, now, row['id']))
+            job = conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+            conn.execute('COMMIT')
+            return self._to_job(job)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend the lease; False if the job is no longer ours"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET lease_expires_at = ?, updated_at = ?
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+            ''', (now + self.visibility_timeout, now, job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id):
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = 'succeeded', lease_expires_at = NULL, last_error = NULL,
+                                stage = 'done', updated_at = ?
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+            ''', (time.time(), job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** max(0, attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def fail(self, job_id, worker_id, error):
+        """Record a failed attempt; returns 'queued' (will retry), 'dead' or None if not ours"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('''
+                SELECT attempts, max_attempts FROM jobs
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+            ''', (job_id, worker_id)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+
+            status = 'dead' if row['attempts'] >= row['max_attempts'] else 'queued'
+            conn.execute('''
+                UPDATE jobs
+                SET status = ?, available_at = ?, lease_expires_at = NULL, last_error = ?,
+                    stage = ?, updated_at = ?
+                WHERE id = ?
+            ''', (status, now + self._backoff(row['attempts']), str(error)[:2000],
+                  'failed' if status == 'dead' else 'queued', now, job_id))
+            conn.execute('COMMIT')
+            return status
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def release(self, job_id, worker_id):
+        """Hand a job back untouched (e.g. on shutdown); the attempt is not counted"""
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs
+                SET status = 'queued', attempts = MAX(0, attempts - 1), available_at = ?,
+                    lease_expires_at = NULL, worker_id = NULL, stage = 'queued', updated_at = ?
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+            ''', (time.time(), time.time(), job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def reap_expired(self):
+        """Dead-letter jobs whose last allowed attempt lost its lease; returns them"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('''
+                SELECT * FROM jobs
+                WHERE status = 'running' AND lease_expires_at <= ? AND attempts >= max_attempts
+            ''', (now,)).fetchall()
+            conn.executemany('''
+                UPDATE jobs
+                SET status = 'dead', lease_expires_at = NULL, stage = 'failed', updated_at = ?,
+                    last_error = COALESCE(last_error || '; ', '') || 'worker lost (lease expired)'
+                WHERE id = ?
+            ''', [(now, row['id']) for row in rows])
+            conn.execute('COMMIT')
+            return [self._to_job(row) for row in rows]
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def requeue(self, job_id):
+        """Give a dead job a fresh set of attempts"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, stage = 'queued',
+                                updated_at = ?
+                WHERE id = ? AND status = 'dead'
+            ''', (now, now, job_id))
+        return cursor.rowcount == 1
+
+    def report_stage(self, dedupe_key, stage):
+        """Record the running job's current stage (e.g. 'extracting'); False if none is running
+
+        Keyed on dedupe_key so code running inside a worker process can
+        report progress knowing only the song, not the job id.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                UPDATE jobs SET stage = ?, updated_at = ?
+                WHERE dedupe_key = ? AND status = 'running'
+            ''', (stage, time.time(), dedupe_key))
+        return cursor.rowcount == 1
+
+    def latest_stage(self, dedupe_key):
+        """Progress of the most recent job for dedupe_key; None if there is none"""
+        with self._connect() as conn:
+            row = conn.execute('''
+                SELECT id, status, stage, attempts, max_attempts, last_error, updated_at
+                FROM jobs WHERE dedupe_key = ?
+                ORDER BY created_at DESC LIMIT 1
+            ''', (dedupe_key,)).fetchone()
+        if row is None:
+            return None
+        progress = dict(row)
+        progress['job_id'] = progress.pop('id')
+        # Jobs from before progress reporting have no stage
+        progress['stage'] = progress['stage'] or {
+            'succeeded': 'done', 'dead': 'failed'}.get(progress['status'], progress['status'])
+        return progress
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_job(row)
+
+    def depth(self):
+        """Jobs waiting or running"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def purge(self, older_than_seconds=7 * 24 * 3600):
+        """Delete finished jobs last touched more than older_than_seconds ago"""
+        cutoff = time.time() - older_than_seconds
+        with self._connect() as conn:
+            cursor = conn.execute('''
+                DELETE FROM jobs WHERE status IN ('succeeded', 'dead') AND updated_at < ?
+            ''', (cutoff,))
+        return cursor.rowcount
+
+    def stats(self):
+        with self._connect() as conn:
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+            oldest = conn.execute(
+                "SELECT MIN(available_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        stats = {state: counts.get(state, 0) for state in JOB_STATES}
+        stats['oldest_queued_age'] = max(0.0, time.time() - oldest) if oldest else 0.0
+        return stats
+
+
+async def watch_stage(queue, dedupe_key, poll_interval=0.5, keepalive=15.0):
+    """Yield a job's progress each time its stage changes, until it is done or failed
+
+    Stages are written by whichever process runs the job, so this polls
+    the local database (a cheap indexed read, never the remote one). When
+    nothing has changed for ``keepalive`` seconds it yields None, which
+    lets a streaming response send a heartbeat. Yields nothing if there is
+    no job for the key.
+    """
+    last = None
+    quiet_since = time.monotonic()
+    while True:
+        progress = await asyncio.to_thread(queue.latest_stage, dedupe_key)
+        if progress is None:
+            return
+        current = (progress['job_id'], progress['stage'], progress['attempts'])
+        if current != last:
+            last = current
+            quiet_since = time.monotonic()
+            yield progress
+            if progress['stage'] in TERMINAL_STAGES:
+                return
+        elif time.monotonic() - quiet_since >= keepalive:
+            quiet_since = time.monotonic()
+            yield None
+        await asyncio.sleep(poll_interval)
+
+
+async def _maybe_await(result):
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+class AsyncJobRunner:
+    """Claims jobs from a JobQueue and runs them with an async handler.
+
+    ``concurrency`` claim loops run side by side; each holds at most one
+    lease, so jobs nobody has capacity for stay queued in the database
+    rather than in memory. Leases are extended while the handler runs and
+    handed back on shutdown. ``on_retry(job, error)`` and
+    ``on_dead(job, error)`` (sync or async) let the application reflect a
+    failed attempt, e.g. by marking the song as failed once retries are
+    exhausted; ``on_dead`` also fires for jobs whose worker was lost on
+    their final attempt.
+    """
+
+    def __init__(self, queue, handler, concurrency=1, poll_interval=1.0, kinds=None,
+                 worker_id=None, on_retry=None, on_dead=None):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.kinds = kinds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.on_retry = on_retry
+        self.on_dead = on_dead
+        self.active = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        await asyncio.gather(self._reap_loop(),
+                             *(self._claim_loop() for _ in range(self.concurrency)))
+
+    async def _reap_loop(self):
+        interval = max(self.poll_interval, self.queue.visibility_timeout / 4)
+        while True:
+            try:
+                for job in await asyncio.to_thread(self.queue.reap_expired):
+                    logger.warning(f"Job {job['id']} dead-lettered after its worker was lost")
+                    if self.on_dead:
+                        await _maybe_await(self.on_dead(job, job.get('last_error')))
+            except Exception as e:
+                logger.error(f"Reaping expired jobs failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def _heartbeat(self, job):
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not await asyncio.to_thread(self.queue.heartbeat, job['id'], self.worker_id):
+                logger.warning(f"Lost the lease on job {job['id']}")
+                return
+
+    async def _claim_loop(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id, self.kinds)
+            except Exception as e:
+                logger.error(f"Claiming a job failed: {e}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._run_job(job)
+
+    async def _run_job(self, job):
+        self.active += 1
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self.handler(job)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.queue.release, job['id'], self.worker_id)
+            raise
+        except Exception as e:
+            status = await asyncio.to_thread(self.queue.fail, job['id'], self.worker_id, e)
+            logger.error(f"Job {job['id']} attempt {job['attempts']} failed ({status}): {e}")
+            callback = self.on_dead if status == 'dead' else self.on_retry
+            if callback and status:
+                try:
+                    await _maybe_await(callback(job, e))
+                except Exception as callback_error:
+                    logger.error(f"Job {job['id']} failure callback failed: {callback_error}")
+        else:
+            await asyncio.to_thread(self.queue.complete, job['id'], self.worker_id)
+        finally:
+            heartbeat.cancel()
+            self.active -= 1
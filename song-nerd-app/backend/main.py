@@ -1,14 +1,22 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
-import httpx
+import json
+import time
 import asyncio
-import tempfile
+import uuid
+from contextlib import asynccontextmanager
 from supabase import create_client, Client
 import logging
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
+from job_queue import JobQueue, AsyncJobRunner, watch_stage, JOB_STATES
+from song_store import SupabaseSongStore, InMemorySongStore, AsyncSongStore
+from upload_storage import stream_upload, max_upload_bytes, UploadTooLarge, UnsupportedAudioFormat
+from audio_downloader import AudioDownloader
+from metrics import Metrics, instrument_app, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # Load environment variables
 load_dotenv()
@@ -17,7 +25,61 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Song Nerd API", version="1.0.0")
+# Durable analysis queue; JOB_QUEUE_DB and UPLOAD_DIR should live on a
+# persistent volume so queued songs survive a restart
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+job_queue = JobQueue(
+    db_path=os.getenv("JOB_QUEUE_DB", "job_queue.db"),
+    visibility_timeout=int(os.getenv("JOB_VISIBILITY_TIMEOUT", "900")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+)
+job_runner = None
+
+# Served at /metrics
+metrics = Metrics()
+metrics.describe("stage_seconds", "Time per analysis pipeline stage (upload, download, analysis)")
+metrics.describe("db_seconds", "Supabase call latency by method")
+metrics.describe("db_errors_total", "Failed Supabase calls by method")
+metrics.describe("analysis_jobs_total", "Finished analysis job attempts by result")
+
+def observe_db_call(method: str, seconds: float, failed: bool):
+    metrics.observe("db_seconds", seconds, method=method)
+    if failed:
+        metrics.inc("db_errors_total", method=method)
+
+# One pooled HTTP client for all downloads from storage URLs
+downloader = AudioDownloader(
+    max_connections=int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "20")),
+    per_host=int(os.getenv("DOWNLOAD_PER_HOST", "4")),
+    timeout=float(os.getenv("DOWNLOAD_TIMEOUT", "60")),
+    max_bytes=max_upload_bytes()
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global job_runner
+    
+    downloader.start()
+    
+    # Jobs left running by a previous process are reclaimed once their
+    # lease expires; JOB_DISPATCHER=false makes this process enqueue-only
+    if os.getenv("JOB_DISPATCHER", "true").lower() != "false":
+        job_runner = AsyncJobRunner(
+            job_queue, handle_analysis_job,
+            concurrency=int(os.getenv("JOB_WORKER_CONCURRENCY", "2")),
+            on_dead=on_analysis_dead
+        ).start()
+    logger.info(f"Job queue ready: {job_queue.stats()}")
+    
+    yield
+    
+    # Unfinished jobs are handed back to the queue
+    if job_runner:
+        await job_runner.stop()
+    await downloader.aclose()
+    song_store.close()
+
+app = FastAPI(title="Song Nerd API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware - Update with your Vercel URL
 app.add_middleware(
@@ -27,6 +89,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument_app(app, metrics)
 
 # Supabase client
 supabase_url = os.getenv("SUPABASE_URL")
@@ -38,6 +101,30 @@ if not supabase_url or not supabase_key:
 else:
     supabase: Client = create_client(supabase_url, supabase_key)
 
+# Database calls run on a small thread pool so they never block the event
+# loop; without Supabase an in-process store stands in (mock mode)
+song_store = AsyncSongStore(
+    SupabaseSongStore(supabase) if supabase else InMemorySongStore(),
+    max_concurrency=int(os.getenv("DB_MAX_CONCURRENCY", "8")),
+    on_call=observe_db_call
+)
+
+async def job_queue_depths():
+    stats = await asyncio.to_thread(job_queue.stats)
+    return {state: stats[state] for state in JOB_STATES}
+
+def download_counts():
+    stats = downloader.stats()
+    return {result: stats[result] for result in ("downloads", "resumed", "failed")}
+
+(metrics
+    .describe("jobs_in_flight", "Analysis jobs being run by this process")
+    .describe("job_queue_jobs", "Jobs in the durable queue by state")
+    .describe("downloads_total", "Audio downloads by result")
+    .collect("jobs_in_flight", lambda: job_runner.active if job_runner else 0)
+    .collect("job_queue_jobs", job_queue_depths, label="state")
+    .collect("downloads_total", download_counts, kind="counter", label="result"))
+
 class SongAnalysisRequest(BaseModel):
     song_id: str
     file_url: str
@@ -56,41 +143,96 @@ async def root():
         "endpoints": [
             "/api/songs/analyze",
             "/api/songs/upload",
+            "/api/songs/{song_id}/events",
+            "/metrics",
             "/health"
         ]
     }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition: stage and Supabase latency, jobs, downloads, requests"""
+    return PlainTextResponse(await metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy", 
         "service": "song-nerd-api",
-        "supabase_connected": supabase is not None
+        "supabase_connected": supabase is not None,
+        "job_queue": await asyncio.to_thread(job_queue.stats),
+        "downloads": downloader.stats()
     }
 
+async def enqueue_analysis(kind: str, song_id: str, payload: dict) -> str:
+    """Queue a song for analysis; a song already queued or running is not queued twice"""
+    return await asyncio.to_thread(
+        job_queue.enqueue, kind, {"song_id": song_id, **payload}, dedupe_key=song_id
+    )
+
+def sse_event(event: str, data: dict, event_id: str = None) -> str:
+    """One server-sent event"""
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.get("/api/songs/{song_id}/events")
+async def song_events(song_id: str, request: Request):
+    """Server-sent events with the song's analysis stages as they happen
+    
+    A ``stage`` event is sent for the current stage and for every change
+    (queued, running, downloading, modelling, done or failed); the stream
+    closes after done or failed. Stages are read from the local job queue,
+    so the frontend needs no status polling against the database.
+    """
+    if await asyncio.to_thread(job_queue.latest_stage, song_id) is None:
+        raise HTTPException(status_code=404, detail="No analysis job for this song")
+    
+    async def events():
+        async for progress in watch_stage(job_queue, song_id,
+                                          poll_interval=float(os.getenv("EVENTS_POLL_INTERVAL", "0.5"))):
+            if await request.is_disconnected():
+                return
+            if progress is None:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_event("stage", {
+                "song_id": song_id,
+                "stage": progress["stage"],
+                "attempt": progress["attempts"],
+                "error": progress["last_error"] if progress["stage"] == "failed" else None
+            }, event_id=f"{progress['job_id']}:{progress['stage']}")
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def report_stage(song_id: str, stage: str):
+    """Publish the analysis stage for the events stream; never fails the job"""
+    try:
+        await asyncio.to_thread(job_queue.report_stage, song_id, stage)
+    except Exception as e:
+        logger.warning(f"Could not report stage {stage} for song {song_id}: {e}")
+
 @app.post("/api/songs/analyze")
-async def analyze_song_endpoint(request: SongAnalysisRequest, background_tasks: BackgroundTasks):
+async def analyze_song_endpoint(request: SongAnalysisRequest):
     """Trigger AI analysis for a song from URL"""
     try:
         logger.info(f"Starting analysis for song {request.song_id}")
         
-        # Update song status to processing (if Supabase is available)
-        if supabase:
-            supabase.table("songs").update({
-                "processing_status": "processing"
-            }).eq("id", request.song_id).execute()
+        # Update song status to processing
+        await update_song_status(request.song_id, "processing")
         
-        # Add analysis to background task
-        background_tasks.add_task(
-            process_song_analysis, 
-            request.song_id, 
-            request.file_url, 
-            request.metadata
-        )
+        job_id = await enqueue_analysis("analyze_url", request.song_id, {
+            "file_url": request.file_url,
+            "metadata": request.metadata
+        })
         
         return {
             "message": "Analysis started",
             "song_id": request.song_id,
+            "job_id": job_id,
             "status": "processing"
         }
     except Exception as e:
@@ -100,7 +242,6 @@ async def analyze_song_endpoint(request: SongAnalysisRequest, background_tasks:
 
 @app.post("/api/songs/upload")
 async def upload_and_analyze(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     song_id: str = None,
     metadata: str = "{}"
@@ -118,26 +259,31 @@ async def upload_and_analyze(
         # Update song status to processing
         await update_song_status(song_id, "processing")
         
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        # Streamed to disk chunk by chunk; kept until its job finishes, so a
+        # retry or a restart can still read it
+        with metrics.time("stage_seconds", stage="upload"):
+            stored = await stream_upload(file, UPLOAD_DIR, f"{song_id}-{uuid.uuid4().hex[:8]}",
+                                         max_bytes=max_upload_bytes())
         
-        # Add analysis to background task
-        background_tasks.add_task(
-            process_uploaded_file_analysis,
-            song_id,
-            temp_file_path,
-            metadata_dict
-        )
+        job_id = await enqueue_analysis("analyze_upload", song_id, {
+            "file_path": stored.path,
+            "metadata": metadata_dict
+        })
         
         return {
             "message": "File uploaded and analysis started",
             "song_id": song_id,
+            "job_id": job_id,
+            "content_hash": stored.sha256,
             "status": "processing"
         }
         
+    except HTTPException:
+        raise
+    except (UploadTooLarge, UnsupportedAudioFormat) as e:
+        await update_song_status(song_id, "failed", str(e))
+        status_code = 413 if isinstance(e, UploadTooLarge) else 415
+        raise HTTPException(status_code=status_code, detail=str(e))
     except Exception as e:
         logger.error(f"Error in upload endpoint: {e}")
         if song_id:
@@ -147,70 +293,82 @@ async def upload_and_analyze(
 async def update_song_status(song_id: str, status: str, error_message: str = None):
     """Update song processing status in database"""
     try:
-        if not supabase:
-            logger.info(f"Mock mode: Song {song_id} status: {status}")
-            return
-            
         update_data = {"processing_status": status}
         if error_message:
             update_data["error_message"] = error_message
         
-        supabase.table("songs").update(update_data).eq("id", song_id).execute()
+        await song_store.update_song(song_id, update_data)
     except Exception as e:
         logger.error(f"Failed to update song status: {e}")
 
 async def download_audio_file(file_url: str) -> str:
     """Download audio file from URL to temporary file"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(file_url)
-            response.raise_for_status()
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-                temp_file.write(response.content)
-                return temp_file.name
-                
+        return await downloader.download(file_url)
     except Exception as e:
         logger.error(f"Failed to download audio file: {e}")
         raise
 
+async def handle_analysis_job(job: dict):
+    """Job handler; errors propagate so the queue retries with backoff"""
+    payload = job["payload"]
+    try:
+        with metrics.time("stage_seconds", stage="total"):
+            if job["kind"] == "analyze_url":
+                await process_song_analysis(payload["song_id"], payload["file_url"], payload["metadata"])
+            elif job["kind"] == "analyze_upload":
+                await process_uploaded_file_analysis(payload["song_id"], payload["file_path"],
+                                                     payload["metadata"])
+            else:
+                raise ValueError(f"Unknown job kind: {job['kind']}")
+    except Exception:
+        metrics.inc("analysis_jobs_total", result="failed")
+        raise
+    metrics.inc("analysis_jobs_total", result="succeeded")
+
+async def on_analysis_dead(job: dict, error):
+    """Retries exhausted: mark the song failed and drop its upload"""
+    payload = job["payload"]
+    metrics.inc("analysis_jobs_total", result="dead")
+    logger.error(f"Analysis for song {payload['song_id']} failed permanently: {error}")
+    await update_song_status(payload["song_id"], "failed", str(error))
+    file_path = payload.get("file_path")
+    if file_path and os.path.exists(file_path):
+        await asyncio.to_thread(os.unlink, file_path)
+
 async def process_song_analysis(song_id: str, file_url: str, metadata: dict):
-    """Background task to process song analysis from URL"""
+    """Process song analysis from URL"""
     temp_file_path = None
     try:
         logger.info(f"Processing analysis for song {song_id}")
         
         # Download the audio file
-        temp_file_path = await download_audio_file(file_url)
+        await report_stage(song_id, "downloading")
+        with metrics.time("stage_seconds", stage="download"):
+            temp_file_path = await download_audio_file(file_url)
         
         # Process the analysis
         await run_analysis(song_id, temp_file_path, metadata)
         
-    except Exception as e:
-        logger.error(f"Analysis failed for song {song_id}: {e}")
-        await update_song_status(song_id, "failed", str(e))
     finally:
-        # Clean up temporary file
+        # Clean up temporary file; a retry downloads it again
         if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
+            await asyncio.to_thread(os.unlink, temp_file_path)
 
-async def process_uploaded_file_analysis(song_id: str, temp_file_path: str, metadata: dict):
-    """Background task to process uploaded file analysis"""
-    try:
-        logger.info(f"Processing uploaded file analysis for song {song_id}")
-        await run_analysis(song_id, temp_file_path, metadata)
-        
-    except Exception as e:
-        logger.error(f"Analysis failed for song {song_id}: {e}")
-        await update_song_status(song_id, "failed", str(e))
-    finally:
-        # Clean up temporary file
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
+async def process_uploaded_file_analysis(song_id: str, file_path: str, metadata: dict):
+    """Process uploaded file analysis; the upload is removed once it succeeds"""
+    logger.info(f"Processing uploaded file analysis for song {song_id}")
+    await run_analysis(song_id, file_path, metadata)
+    
+    if os.path.exists(file_path):
+        await asyncio.to_thread(os.unlink, file_path)
 
 async def run_analysis(song_id: str, audio_file_path: str, metadata: dict):
     """Run the actual AI analysis on the audio file"""
     try:
+        await report_stage(song_id, "modelling")
+        started = time.perf_counter()
+        
         # For now, create mock analysis results
         # TODO: Replace with actual analysis logic when dependencies are working
         mock_analysis = {
@@ -259,22 +417,12 @@ async def run_analysis(song_id: str, audio_file_path: str, metadata: dict):
             "model_version": "1.0"
         }
         
-        if supabase:
-            # Insert analysis results
-            supabase.table("analysis").insert({
-                "song_id": song_id,
-                **mock_analysis
-            }).execute()
-            
-            supabase.table("marketing_insights").insert({
-                "song_id": song_id,
-                **mock_insights
-            }).execute()
-        else:
-            logger.info(f"Mock mode: Analysis complete for song {song_id}")
+        metrics.observe("stage_seconds", time.perf_counter() - started, stage="analysis")
         
-        # Update song status to completed
-        await update_song_status(song_id, "completed")
+        # Analysis, insights and the completed status in one round trip
+        await song_store.save_analysis_results(song_id, mock_analysis, mock_insights, {
+            "processing_status": "completed"
+        })
         
         logger.info(f"Analysis completed for song {song_id}")
         
@@ -0,0 +1,207 @@
+# metrics.py
+# In-process counters and histograms served in the Prometheus text format
+
+import time
+import bisect
+import inspect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency buckets; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Counters and latency histograms for one process, plus scrape-time collectors.
+
+    ``inc`` and ``observe`` are cheap and thread-safe, so they can be
+    called on hot paths and from worker threads. Values that other
+    objects already keep (pool sizes, cache hit counts, queue depth) are
+    read only when scraped, through ``collect`` callbacks. ``render``
+    produces the Prometheus text exposition format; every metric name is
+    prefixed with ``namespace``.
+    """
+
+    def __init__(self, namespace='song_nerd', buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+        return self
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            entry['counts'][index] += 1
+            entry['sum'] += seconds
+            entry['count'] += 1
+
+    def observe_timings(self, name, timings, label='stage', **labels):
+        """observe() each {label value: seconds} of a timings dict"""
+        for value, seconds in timings.items():
+            self.observe(name, seconds, **{label: value}, **labels)
+
+    def time(self, name, **labels):
+        """Context manager observing the block's duration"""
+        return _Timer(self, name, labels)
+
+    def collect(self, name, source, kind='gauge', label=None):
+        """Read a value from ``source()`` (sync or async) at scrape time
+
+        ``source`` returns a number, or a dict of them keyed by the value of
+        ``label``. With kind='histogram' it returns a StageHistograms-style
+        snapshot ({label value: {'buckets', 'sum', 'count'}}).
+        """
+        self._collectors.append((name, source, kind, label))
+        return self
+
+    async def render(self):
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: dict(entry, counts=list(entry['counts']))
+                                 for key, entry in series.items()}
+                          for name, series in self._histograms.items()}
+
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, 'counter')
+            for key, value in sorted(series.items()):
+                lines.append(f'{self._full(name)}{_format_labels(key)} {_format_value(value)}')
+
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, 'histogram')
+            for key, entry in sorted(series.items()):
+                cumulative = 0
+                bounds = [*map(_format_value, self.buckets), '+Inf']
+                for bound, count in zip(bounds, entry['counts']):
+                    cumulative += count
+                    self._histogram_line(lines, name, key, bound, cumulative)
+                self._histogram_totals(lines, name, key, entry['sum'], entry['count'])
+
+        for name, source, kind, label in self._collectors:
+            try:
+                value = source()
+                if inspect.isawaitable(value):
+                    value = await value
+            except Exception as e:
+                logger.warning(f"Metric {name} could not be collected: {e}")
+                continue
+            if value is None:
+                continue
+            self._header(lines, name, kind)
+            if kind == 'histogram':
+                self._render_snapshot(lines, name, label or 'stage', value)
+            elif isinstance(value, dict):
+                for label_value, number in sorted(value.items()):
+                    if number is not None:
+                        key = ((label, str(label_value)),)
+                        lines.append(f'{self._full(name)}{_format_labels(key)} {_format_value(number)}')
+            else:
+                lines.append(f'{self._full(name)} {_format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
+
+    def _full(self, name):
+        return f'{self.namespace}_{name}' if self.namespace else name
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append(f'# HELP {self._full(name)} {self._help[name]}')
+        lines.append(f'# TYPE {self._full(name)} {kind}')
+
+    def _histogram_line(self, lines, name, key, bound, cumulative):
+        lines.append(f'{self._full(name)}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+
+    def _histogram_totals(self, lines, name, key, total, count):
+        lines.append(f'{self._full(name)}_sum{_format_labels(key)} {_format_value(float(total))}')
+        lines.append(f'{self._full(name)}_count{_format_labels(key)} {count}')
+
+    def _render_snapshot(self, lines, name, label, snapshot):
+        for label_value, entry in sorted(snapshot.items()):
+            key = ((label, str(label_value)),)
+            for bound, cumulative in entry['buckets'].items():
+                self._histogram_line(lines, name, key, bound, cumulative)
+            self._histogram_totals(lines, name, key, entry['sum'], entry['count'])
+
+
+class _Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def instrument_app(app, metrics):
+    """Count an app's requests by handler and status code, and unhandled errors"""
+    metrics.describe('http_requests_total', 'HTTP requests by handler and status code')
+    metrics.describe('http_request_seconds', 'Time to the start of the response, by handler')
+
+    @app.middleware('http')
+    async def count_requests(request, call_next):
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        except Exception:
+            metrics.inc('http_requests_total', handler=_handler(request), status='500')
+            raise
+        handler = _handler(request)
+        metrics.inc('http_requests_total', handler=handler, status=str(response.status_code))
+        metrics.observe('http_request_seconds', time.perf_counter() - start, handler=handler)
+        return response
+
+    return app
+
+
+def _handler(request):
+    endpoint = request.scope.get('endpoint')
+    return getattr(endpoint, '__name__', 'unmatched')
@@ -0,0 +1,318 @@
+# song_store.py
+# Data access for songs, analysis and marketing insights
+
+import json
+import time
+import base64
+import asyncio
+import logging
+import threading
+import functools
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Postgres function that writes analysis + insights + song status in one
+# transaction (supabase/save_song_analysis.sql)
+SAVE_ANALYSIS_RPC = 'save_song_analysis'
+
+
+def encode_cursor(song):
+    """Opaque keyset cursor for the song a page ended on"""
+    key = json.dumps([song['upload_timestamp'], song['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(upload_timestamp, id) from encode_cursor; ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, song_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if not isinstance(timestamp, str) or not isinstance(song_id, str):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return timestamp, song_id
+
+
+def _quote(value):
+    """Value inside a PostgREST or=() filter, where , . : ( ) are reserved"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+# Columns that belong to the row rather than to the analysis it holds
+_ROW_IDENTITY = ('id', 'song_id', 'created_at')
+
+
+def _copy_row(row):
+    """An analysis or insights row without its identity, for saving under another song"""
+    return {key: value for key, value in row.items() if key not in _ROW_IDENTITY}
+
+
+def _is_missing_function(error):
+    """PostgREST reports an unknown RPC as PGRST202"""
+    return getattr(error, 'code', None) == 'PGRST202' or 'PGRST202' in str(error)
+
+
+class SupabaseSongStore:
+    """Synchronous store on one shared Supabase client.
+
+    The client keeps its HTTP connections open, so every call reuses them.
+    Analysis results are saved with one RPC round trip; if the database
+    does not have the function yet, the store falls back to upserts keyed
+    on song_id (three round trips), which are still safe to repeat when a
+    job is retried.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._rpc_available = True
+
+    def ping(self):
+        self.client.table('songs').select('id').limit(1).execute()
+        return True
+
+    def count_songs(self, filters=None):
+        # count='exact' with limit(1) returns the count without the rows
+        query = self.client.table('songs').select('id', count='exact')
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        result = query.limit(1).execute()
+        return result.count or 0
+
+    def insert_song(self, song):
+        result = self.client.table('songs').insert(song).execute()
+        return result.data[0] if result.data else song
+
+    def get_song(self, song_id, columns='*'):
+        result = self.client.table('songs').select(columns).eq('id', song_id).execute()
+        return result.data[0] if result.data else None
+
+    def update_song(self, song_id, fields):
+        self.client.table('songs').update(fields).eq('id', song_id).execute()
+
+    def list_songs(self, limit=None, cursor=None, columns='*', filters=None):
+        """Newest songs first; ``cursor`` is the (upload_timestamp, id) to continue after
+
+        Paging is by key rather than offset, so a page costs the same
+        however deep it is (given an index on upload_timestamp, id).
+        """
+        query = self.client.table('songs').select(columns)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+        if cursor:
+            timestamp, song_id = cursor
+            query = query.or_(f"upload_timestamp.lt.{_quote(timestamp)},"
+                              f"and(upload_timestamp.eq.{_quote(timestamp)},id.lt.{_quote(song_id)})")
+        query = query.order('upload_timestamp', desc=True).order('id', desc=True)
+        if limit:
+            query = query.limit(limit)
+        return query.execute().data
+
+    def get_analysis(self, song_id):
+        """(analysis row, insights row); either may be None"""
+        analysis = self.client.table('analysis').select('*').eq('song_id', song_id).execute()
+        insights = self.client.table('marketing_insights').select('*').eq('song_id', song_id).execute()
+        return (analysis.data[0] if analysis.data else None,
+                insights.data[0] if insights.data else None)
+
+    def find_analysed_song(self, content_hash, analysis_version):
+        """Most recent completed song with this audio and analysis version; None if none"""
+        result = (self.client.table('songs').select('id,duration,file_path')
+                  .eq('content_hash', content_hash)
+                  .eq('analysis_version', analysis_version)
+                  .eq('processing_status', 'completed')
+                  .order('upload_timestamp', desc=True).limit(1).execute())
+        return result.data[0] if result.data else None
+
+    def clone_analysis(self, source_song_id, song_id, song_fields=None):
+        """Save a copy of another song's analysis and insights; False if it has none"""
+        analysis, insights = self.get_analysis(source_song_id)
+        if analysis is None:
+            return False
+        self.save_analysis_results(song_id, _copy_row(analysis),
+                                   _copy_row(insights) if insights else None, song_fields)
+        return True
+
+    def save_analysis_results(self, song_id, analysis, insights=None, song_fields=None):
+        """Write analysis, insights and the song's status together"""
+        if self._rpc_available:
+            try:
+                self.client.rpc(SAVE_ANALYSIS_RPC, {
+                    'p_song_id': song_id,
+                    'p_analysis': analysis,
+                    'p_insights': insights,
+                    'p_song': song_fields or {}
+                }).execute()
+                return
+            except Exception as e:
+                if not _is_missing_function(e):
+                    raise
+                logger.warning(f"{SAVE_ANALYSIS_RPC} is not installed, "
+                               f"falling back to separate upserts")
+                self._rpc_available = False
+
+        self.client.table('analysis').upsert(
+            {**analysis, 'song_id': song_id}, on_conflict='song_id').execute()
+        if insights:
+            self.client.table('marketing_insights').upsert(
+                {**insights, 'song_id': song_id}, on_conflict='song_id').execute()
+        if song_fields:
+            self.update_song(song_id, song_fields)
+
+
+class InMemorySongStore:
+    """Local stand-in with the same interface, for tests and running without Supabase.
+
+    State lives in this process only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.songs = {}
+        self.analysis = {}
+        self.insights = {}
+
+    @staticmethod
+    def _now():
+        return datetime.utcnow().isoformat()
+
+    def ping(self):
+        return True
+
+    def count_songs(self, filters=None):
+        with self._lock:
+            return sum(1 for song in self.songs.values()
+                       if all(song.get(column) == value for column, value in (filters or {}).items()))
+
+    def insert_song(self, song):
+        with self._lock:
+            if song['id'] in self.songs:
+                raise ValueError(f"Duplicate song id: {song['id']}")
+            row = {'upload_timestamp': self._now(), **song}
+            self.songs[song['id']] = row
+            return dict(row)
+
+    def get_song(self, song_id, columns='*'):
+        with self._lock:
+            song = self.songs.get(song_id)
+            if song is None:
+                return None
+            if columns == '*':
+                return dict(song)
+            return {c.strip(): song.get(c.strip()) for c in columns.split(',')}
+
+    def update_song(self, song_id, fields):
+        with self._lock:
+            if song_id in self.songs:
+                self.songs[song_id].update(fields)
+
+    def list_songs(self, limit=None, cursor=None, columns='*', filters=None):
+        with self._lock:
+            songs = [dict(song) for song in self.songs.values()
+                     if all(song.get(column) == value for column, value in (filters or {}).items())]
+        songs.sort(key=lambda s: (s.get('upload_timestamp') or '', s['id']), reverse=True)
+        if cursor:
+            songs = [s for s in songs if (s.get('upload_timestamp') or '', s['id']) < tuple(cursor)]
+        if limit:
+            songs = songs[:limit]
+        if columns != '*':
+            names = [c.strip() for c in columns.split(',')]
+            songs = [{name: song.get(name) for name in names} for song in songs]
+        return songs
+
+    def get_analysis(self, song_id):
+        with self._lock:
+            analysis = self.analysis.get(song_id)
+            insights = self.insights.get(song_id)
+        return (dict(analysis) if analysis else None, dict(insights) if insights else None)
+
+    def find_analysed_song(self, content_hash, analysis_version):
+        matches = [song for song in self.list_songs()
+                   if song.get('content_hash') == content_hash
+                   and song.get('analysis_version') == analysis_version
+                   and song.get('processing_status') == 'completed']
+        if not matches:
+            return None
+        return {'id': matches[0]['id'], 'duration': matches[0].get('duration'),
+                'file_path': matches[0].get('file_path')}
+
+    def clone_analysis(self, source_song_id, song_id, song_fields=None):
+        analysis, insights = self.get_analysis(source_song_id)
+        if analysis is None:
+            return False
+        self.save_analysis_results(song_id, _copy_row(analysis),
+                                   _copy_row(insights) if insights else None, song_fields)
+        return True
+
+    def save_analysis_results(self, song_id, analysis, insights=None, song_fields=None):
+        with self._lock:
+            created_at = self.analysis.get(song_id, {}).get('created_at', self._now())
+            self.analysis[song_id] = {**analysis, 'song_id': song_id, 'created_at': created_at}
+            if insights:
+                self.insights[song_id] = {**insights, 'song_id': song_id}
+            if song_fields and song_id in self.songs:
+                self.songs[song_id].update(song_fields)
+
+
+class AsyncSongStore:
+    """Awaitable wrapper that runs a synchronous store on a small thread pool.
+
+    Keeps blocking HTTP calls off the event loop; ``max_concurrency``
+    bounds the number of database calls in flight from this process.
+    ``on_call(method, seconds, failed)``, if given, is told about every
+    call (for latency metrics); the time includes waiting for a thread.
+    """
+
+    def __init__(self, store, max_concurrency=8, on_call=None):
+        self.store = store
+        self.on_call = on_call
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix='song-store')
+
+    async def _call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await loop.run_in_executor(
+                self._executor, functools.partial(getattr(self.store, method), *args, **kwargs))
+            failed = False
+            return result
+        finally:
+            if self.on_call is not None:
+                self.on_call(method, time.perf_counter() - start, failed)
+
+    async def ping(self):
+        return await self._call('ping')
+
+    async def count_songs(self, filters=None):
+        return await self._call('count_songs', filters)
+
+    async def insert_song(self, song):
+        return await self._call('insert_song', song)
+
+    async def get_song(self, song_id, columns='*'):
+        return await self._call('get_song', song_id, columns)
+
+    async def update_song(self, song_id, fields):
+        return await self._call('update_song', song_id, fields)
+
+    async def list_songs(self, limit=None, cursor=None, columns='*', filters=None):
+        return await self._call('list_songs', limit, cursor, columns, filters)
+
+    async def get_analysis(self, song_id):
+        return await self._call('get_analysis', song_id)
+
+    async def save_analysis_results(self, song_id, analysis, insights=None, song_fields=None):
+        return await self._call('save_analysis_results', song_id, analysis, insights, song_fields)
+
+    async def find_analysed_song(self, content_hash, analysis_version):
+        return await self._call('find_analysed_song', content_hash, analysis_version)
+
+    async def clone_analysis(self, source_song_id, song_id, song_fields=None):
+        return await self._call('clone_analysis', source_song_id, song_id, song_fields)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
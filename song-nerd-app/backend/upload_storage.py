@@ -0,0 +1,123 @@
+# upload_storage.py
+# Streams uploaded audio to disk in fixed-size chunks
+
+import os
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+# Container formats recognised from their first bytes, with the extension
+# the stored file gets (the client's filename is not trusted for this)
+AUDIO_EXTENSIONS = {
+    'mp3': '.mp3',
+    'wav': '.wav',
+    'flac': '.flac',
+    'ogg': '.ogg',
+    'm4a': '.m4a'
+}
+HEADER_BYTES = 12
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeds the configured size limit"""
+
+
+class UnsupportedAudioFormat(ValueError):
+    """The upload's header bytes are not a supported audio container"""
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+    format: str
+
+
+def sniff_audio_format(header: bytes) -> Optional[str]:
+    """Audio container from the first HEADER_BYTES of a file; None if unknown"""
+    if header.startswith(b'ID3'):
+        return 'mp3'
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return 'wav'
+    if header.startswith(b'fLaC'):
+        return 'flac'
+    if header.startswith(b'OggS'):
+        return 'ogg'
+    if header[4:8] == b'ftyp':
+        return 'm4a'
+    # Bare MPEG audio frame: 11-bit sync word and a non-reserved layer
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0 and header[1] & 0x06:
+        return 'mp3'
+    return None
+
+
+def max_upload_bytes() -> int:
+    """Upload size limit from MAX_UPLOAD_MB"""
+    return int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+
+
+def _write_chunk(out, digest, chunk):
+    # Both release the GIL for large buffers, so this runs on a thread
+    digest.update(chunk)
+    out.write(chunk)
+
+
+async def stream_upload(upload_file, dest_dir: str, name: str,
+                        max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+                        allowed_formats=tuple(AUDIO_EXTENSIONS),
+                        chunk_size: int = CHUNK_SIZE) -> StoredUpload:
+    """Copy an UploadFile to ``dest_dir/name<ext>`` one chunk at a time.
+
+    Memory use is one chunk regardless of the upload's size. The SHA-256
+    of the content is computed while writing, the size limit is enforced
+    as bytes arrive (and up front when the client declared a size), and
+    the format is sniffed from the first chunk. The data goes to a
+    ``.part`` file that is renamed only once the upload is complete and
+    valid, so a rejected or interrupted upload leaves nothing behind.
+    """
+    declared = getattr(upload_file, 'size', None)
+    if declared is not None and declared > max_bytes:
+        raise UploadTooLarge(f"File too large: {declared / (1024 * 1024):.1f}MB "
+                             f"(max: {max_bytes / (1024 * 1024):g}MB)")
+
+    os.makedirs(dest_dir, exist_ok=True)
+    part_path = os.path.join(dest_dir, f"{name}.part")
+    digest = hashlib.sha256()
+    size = 0
+    audio_format = None
+
+    out = await asyncio.to_thread(open, part_path, 'wb')
+    try:
+        while True:
+            chunk = await upload_file.read(chunk_size)
+            if not chunk:
+                break
+
+            if audio_format is None:
+                audio_format = sniff_audio_format(chunk[:HEADER_BYTES])
+                if audio_format not in allowed_formats:
+                    raise UnsupportedAudioFormat(
+                        f"Unsupported format: {audio_format or 'unrecognised audio header'}")
+
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"File too large: over {max_bytes / (1024 * 1024):g}MB")
+
+            await asyncio.to_thread(_write_chunk, out, digest, chunk)
+
+        if size == 0:
+            raise UnsupportedAudioFormat("Empty upload")
+    except BaseException:
+        await asyncio.to_thread(out.close)
+        await asyncio.to_thread(os.unlink, part_path)
+        raise
+
+    await asyncio.to_thread(out.close)
+    path = os.path.join(dest_dir, f"{name}{AUDIO_EXTENSIONS[audio_format]}")
+    await asyncio.to_thread(os.replace, part_path, path)
+    return StoredUpload(path=path, size=size, sha256=digest.hexdigest(), format=audio_format)
@@ -0,0 +1,19 @@
+# backend_path.py
+# Puts backend/ on sys.path for the modules both APIs share
+#
+# backend/ is deployed on its own (see backend/railway.toml), so the
+# modules both APIs use (job_queue, song_store, upload_storage,
+# metrics) live there and api_supabase imports them from it rather
+# than keeping a copy. Import this module before any of them:
+#
+#     import backend_path  # noqa: F401
+
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+# Appended, so the app's own modules win over backend's copies of
+# integrated_analyzer, supabase_config and the model adapters
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
@@ -8,6 +8,7 @@ from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
 import os
+from forest_inference import compile_forest
 
 class DemographicsPredictor:
     def __init__(self):
@@ -17,8 +18,13 @@ class DemographicsPredictor:
         self.scaler = StandardScaler()
         self.label_encoders = {}
         
-    def prepare_features(self, df):
-        """Prepare features using actual data structure"""
+    def prepare_features(self, df, fill_values=None):
+        """Prepare features using actual data structure
+
+        Missing audio features are filled from ``fill_values`` ({feature:
+        value}) where given, otherwise with the median of df.
+        """
+        fill_values = fill_values or {}
         # Audio features from master dataset
         audio_features = ['danceability', 'energy', 'valence', 'acousticness', 
                          'instrumentalness', 'liveness', 'speechiness']
@@ -45,13 +51,14 @@ class DemographicsPredictor:
         all_features = audio_features + additional_features + platform_features
         
         # Handle missing values
+        missing = set(df.columns[df.isna().any()])
         for feature in audio_features:
-            if feature in df.columns:
-                df[feature] = df[feature].fillna(df[feature].median())
+            if feature in missing:
+                df[feature] = df[feature].fillna(fill_values.get(feature, df[feature].median()))
         
         for feature in additional_features:
-            if feature in df.columns and feature != 'genre_encoded':
-                df[feature] = df[feature].fillna(df[feature].median())
+            if feature in missing and feature != 'genre_encoded':
+                df[feature] = df[feature].fillna(fill_values.get(feature, df[feature].median()))
         
         return df[all_features]
     
@@ -116,20 +123,47 @@ class DemographicsPredictor:
     
     def predict(self, audio_features):
         """Predict demographics for new song"""
-        X = self.prepare_features(audio_features)
+        return self.predict_batch(audio_features)[0]
+    
+    def predict_batch(self, audio_features):
+        """Predict demographics for every row of audio_features; one result per row
+
+        Missing values are filled with the training means, so a row's
+        prediction does not depend on the other rows. audio_features is
+        not modified.
+        """
+        X = self.prepare_features(audio_features.copy(), fill_values=self._training_means())
+        if 'genre_encoded' in X.columns and len(X) > 1:
+            # A single song refits the genre encoder on its own genre, which
+            # always encodes as 0; match that so batch rows equal predict()
+            X = X.assign(genre_encoded=0)
         X_scaled = self.scaler.transform(X)
         
-        # Get predictions with probabilities
-        age_probs = self.age_model.predict_proba(X_scaled)[0]
+        # Get predictions with probabilities, each model once for all rows
+        all_age_probs = self.age_model.predict_proba(X_scaled)
         age_classes = self.age_model.classes_
         
-        region_probs = self.region_model.predict_proba(X_scaled)[0]
+        all_region_probs = self.region_model.predict_proba(X_scaled)
         region_classes = self.region_model.classes_
         
-        platform_probs = self.platform_pref_model.predict_proba(X_scaled)[0]
+        all_platform_probs = self.platform_pref_model.predict_proba(X_scaled)
         platform_classes = self.platform_pref_model.classes_
         
-        # Format results
+        return [
+            self._format_prediction(age_probs, age_classes, region_probs, region_classes,
+                                    platform_probs, platform_classes)
+            for age_probs, region_probs, platform_probs
+            in zip(all_age_probs, all_region_probs, all_platform_probs)
+        ]
+    
+    def _training_means(self):
+        """{feature: mean} the scaler was fitted with; empty if it saw no column names"""
+        names = getattr(self.scaler, 'feature_names_in_', None)
+        return {} if names is None else dict(zip(names, self.scaler.mean_))
+    
+    def _format_prediction(self, age_probs, age_classes, region_probs, region_classes,
+                           platform_probs, platform_classes):
+        """Result dict for one song from its class probabilities"""
         demographics = {
             'age_groups': {
                 age_classes[i]: float(age_probs[i]) 
@@ -195,9 +229,10 @@ class DemographicsPredictor:
     def load_model(self, filepath):
         """Load trained model"""
         model_data = joblib.load(filepath)
-        self.age_model = model_data['age_model']
-        self.region_model = model_data['region_model']
-        self.platform_pref_model = model_data['platform_pref_model']
+        # Compiled for fast single-song prediction (see forest_inference)
+        self.age_model = compile_forest(model_data['age_model'])
+        self.region_model = compile_forest(model_data['region_model'])
+        self.platform_pref_model = compile_forest(model_data['platform_pref_model'])
         self.scaler = model_data['scaler']
         self.label_encoders = model_data['label_encoders']
         return self
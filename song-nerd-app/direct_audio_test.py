@@ -3,6 +3,10 @@ import os
 import numpy as np
 import pandas as pd
 
+import features_path  # noqa: F401  (scripts/features modules below)
+from audio_processor import AudioFeatureExtractor
+from excerpt_policy import ExcerptPolicy
+
 def find_audio_file():
     """Find any audio file in current directory"""
     audio_extensions = ['.mp3', '.wav', '.m4a', '.flac']
@@ -12,91 +16,50 @@ def find_audio_file():
             return file
     return None
 
-def extract_audio_features_direct(audio_path):
-    """Extract features directly using librosa (no pydub needed)"""
-    import librosa
-    
+# Analyse the first 60 seconds unless a caller asks for another excerpt
+DEFAULT_DIRECT_EXCERPT = 'first:60'
+
+def extract_audio_features_direct(audio_path, cache=None, excerpt=None, features=None,
+                                  on_stage=None):
+    """Extract features directly using librosa (no pydub needed)
+
+    Formulas come from the shared feature engine, so results match
+    AudioFeatureExtractor and carry its extractor_version. If a
+    FeatureCache is passed, features for previously seen audio are
+    returned without re-running the extraction. ``excerpt`` is an
+    ExcerptPolicy or spec such as 'first:15', 'hook:30' or 'full';
+    ``features`` optionally limits extraction to a subset (e.g. 'model').
+    ``on_stage`` is called with 'decoding' and then 'extracting' as the
+    work moves on, for progress reporting.
+
+    Returns None if the audio cannot be decoded or analysed. A bad
+    ``excerpt`` or ``features`` argument raises, since retrying the same
+    call would never succeed.
+    """
     print(f"Loading audio file: {audio_path}")
     
+    policy = ExcerptPolicy.from_spec(excerpt or DEFAULT_DIRECT_EXCERPT)
+    extractor = AudioFeatureExtractor(cache=cache, excerpt=policy, features=features)
+    
     try:
-        # Load audio directly with librosa (handles MP3, WAV, etc.)
-        y, sr = librosa.load(audio_path, sr=22050, duration=60)  # Load first 60 sec
-        
-        print(f"Audio loaded successfully")
-        print(f"   Duration: {len(y)/sr:.1f} seconds")
-        print(f"   Sample rate: {sr} Hz")
-        print(f"   Audio shape: {y.shape}")
-        
-        # Extract all the features that the ML models need
-        features = {}
-        
         print(f"\n Extracting audio features...")
+        print(f"   Excerpt: {policy}")
         
-        # Basic features
-        features['duration'] = len(y) / sr
-        
-        # Energy and loudness
-        rms = librosa.feature.rms(y=y)[0]
-        features['energy'] = min(1.0, np.mean(rms) * 10)
-        features['loudness'] = -60 + 60 * np.mean(rms)
-        
-        # Tempo and rhythm
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-        features['tempo'] = float(tempo)
-        
-        # Danceability (beat consistency and strength)
-        onset_strength = librosa.onset.onset_strength(y=y, sr=sr)
-        features['danceability'] = min(1.0, np.var(onset_strength) / 100 + 0.1)
-        
-        # Spectral features
-        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-        
-        # Valence (positivity) - based on spectral characteristics
-        brightness = np.mean(spectral_centroids) / (sr/2)
-        features['valence'] = min(1.0, max(0.1, brightness * 0.8 + 0.2))
-        
-        # Acousticness (inverse of spectral complexity)
-        features['acousticness'] = max(0.0, min(1.0, 1 - np.mean(spectral_bandwidth) / 4000))
-        
-        # Speechiness (zero crossing rate)
-        zcr = librosa.feature.zero_crossing_rate(y)[0]
-        features['speechiness'] = min(1.0, np.mean(zcr) * 5)
-        
-        # Instrumentalness (vocal detection)
-        harmonic, percussive = librosa.effects.hpss(y)
-        vocal_strength = np.mean(librosa.feature.spectral_centroid(y=harmonic, sr=sr))
-        features['instrumentalness'] = max(0.0, min(1.0, 1 - vocal_strength / 3000))
-        
-        # Liveness (reverb and room characteristics)
-        spectral_flatness = librosa.feature.spectral_flatness(y=y)[0]
-        features['liveness'] = min(1.0, np.mean(spectral_flatness) * 8)
-        
-        # Key and mode
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        key = np.argmax(np.sum(chroma, axis=1))
-        features['key'] = int(key)
-        
-        # Mode detection (major vs minor)
-        chroma_mean = np.mean(chroma, axis=1)
-        major_profile = np.array([1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1])
-        minor_profile = np.array([1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0])
-        
-        major_corr = np.corrcoef(chroma_mean, major_profile)[0, 1]
-        minor_corr = np.corrcoef(chroma_mean, minor_profile)[0, 1]
-        features['mode'] = 1 if major_corr > minor_corr else 0
-        
-        # Time signature (simplified)
-        features['time_signature'] = 4  # Default to 4/4
+        # Loads only the excerpt we analyse (handles MP3, WAV, etc.)
+        if on_stage is None:
+            extracted = extractor.extract_features(audio_path)
+        else:
+            # Same steps as extract_features, with a report between them
+            on_stage('decoding')
+            y, sr = policy.load(audio_path, sr=extractor.sample_rate)
+            on_stage('extracting')
+            extracted = extractor.extract_features_from_signal(y, sr)
         
-        # Audio appeal (quality score)
-        dynamic_range = np.max(rms) - np.min(rms)
-        freq_balance = 1 - np.std(np.mean(np.abs(librosa.stft(y)), axis=1)) / np.mean(np.abs(librosa.stft(y)))
-        clarity = np.mean(rms) / (np.std(rms) + 1e-8)
-        features['audio_appeal'] = min(100, max(0, dynamic_range * 40 + freq_balance * 30 + clarity * 30))
+        print(f"   Analysed: {extracted.get('duration', 0):.1f} seconds")
+        print(f"   Extractor: {extracted['extractor_version']}")
         
         # Add required features for ML models
+        features = dict(extracted)
         features['normalized_popularity'] = 0.5  # Default for new songs
         features['genre_clean'] = 'pop'  # Default genre
         features['spotify'] = 0  # Default platform scores
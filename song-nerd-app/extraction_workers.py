@@ -0,0 +1,107 @@
+# extraction_workers.py
+# Process pool that runs song analysis away from the API event loop
+
+import os
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class WorkerPoolFull(Exception):
+    """Raised when the pool already holds max_pending jobs"""
+
+
+class ExtractionWorkerPool:
+    """Runs CPU-heavy analysis jobs in worker processes.
+
+    The API only enqueues: ``submit`` hands the job to a process pool and
+    returns immediately, so librosa and model inference never hold the
+    event loop or the GIL of the API process. Concurrency is set by
+    ``max_workers`` (processes), and ``max_pending`` bounds running plus
+    queued jobs; past that, ``submit`` raises WorkerPoolFull. Uploads are
+    admitted (or refused with 503 + Retry-After) by the durable job queue,
+    whose runner submits at most ``max_workers`` jobs at a time.
+
+    Workers are started with 'spawn' so they do not inherit the API's
+    threads or event loop; ``initializer`` runs once per worker, which is
+    where models and caches are loaded.
+    """
+
+    def __init__(self, job, max_workers=None, max_pending=None, initializer=None, initargs=()):
+        self.job = job
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_pending = max_pending or self.max_workers * 4
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp.get_context('spawn'),
+            initializer=self.initializer,
+            initargs=self.initargs
+        )
+        return self
+
+    async def shutdown(self, wait=True):
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+    @property
+    def pending(self):
+        """Jobs running or waiting for a worker"""
+        return self._in_flight
+
+    @property
+    def is_full(self):
+        return self.pending >= self.max_pending
+
+    def submit(self, *args):
+        """Hand a job to the pool; returns an asyncio future for its result"""
+        if self._executor is None:
+            raise RuntimeError("Worker pool is not started")
+        if self.is_full:
+            raise WorkerPoolFull(f"{self.pending} analysis jobs pending (max {self.max_pending})")
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        future = loop.run_in_executor(executor, self.job, *args)
+        # Only count the job once the executor has accepted it
+        self._in_flight += 1
+        future.add_done_callback(lambda f: self._on_done(f, executor))
+        return future
+
+    def _on_done(self, future, executor):
+        self._in_flight -= 1
+        if future.cancelled():
+            self.failed += 1
+            return
+
+        error = future.exception()
+        if error is None:
+            self.completed += 1
+            return
+
+        self.failed += 1
+        print(f"Analysis job failed: {error!r}")
+        # A worker died (e.g. OOM on a huge file); replace the broken pool
+        # once, not once per job that was queued on it
+        if isinstance(error, BrokenProcessPool) and executor is self._executor:
+            print("Extraction worker pool broken, restarting it")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.start()
+
+    def stats(self):
+        return {
+            'workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'in_flight': self._in_flight,
+            'completed': self.completed,
+            'failed': self.failed
+        }
@@ -0,0 +1,18 @@
+# features_path.py
+# Puts scripts/features on sys.path for the app modules that use it
+#
+# The feature extraction modules (audio_processor, feature_cache,
+# excerpt_policy, extraction_profiler, ...) live in scripts/features and
+# import each other as top-level modules, since they are also run as
+# scripts. Import this module before any of them:
+#
+#     import features_path  # noqa: F401
+
+import os
+import sys
+
+FEATURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts', 'features')
+
+# Appended, so nothing on the path already (the app's own modules) is shadowed
+if FEATURES_DIR not in sys.path:
+    sys.path.append(FEATURES_DIR)
@@ -0,0 +1,100 @@
+# forest_inference.py
+# Array-based prediction for fitted scikit-learn random forests
+
+import numpy as np
+
+# Above this many rows the forest's own (compiled, per-tree) predict is
+# faster than walking all trees at once
+MAX_COMPILED_ROWS = 128
+
+
+class CompiledForest:
+    """A fitted RandomForestClassifier/Regressor flattened into node arrays.
+
+    scikit-learn predicts tree by tree, dispatching each through joblib;
+    for one or a few rows that per-tree overhead is nearly all the cost
+    (about 0.15 ms per tree, and the analyzer runs ~1200 trees per song).
+    Here every tree's nodes live in one set of arrays and all trees are
+    walked together, one level per step, for all rows at once, so a
+    prediction costs ``max_depth`` vectorised lookups however many trees
+    there are.
+
+    Larger batches (over MAX_COMPILED_ROWS) go to the forest itself, whose
+    per-tree overhead is amortised by then. Results match the forest's own
+    predict/predict_proba either way. Anything else (classes_,
+    feature_importances_, ...) is read from the wrapped forest.
+    """
+
+    def __init__(self, forest):
+        self.forest = forest
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise ValueError("Only single-output forests can be compiled")
+
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        self.roots = offsets
+        self.max_depth = max(tree.max_depth for tree in trees)
+        self.is_classifier = hasattr(forest, 'classes_')
+
+        left, right, feature, threshold, value = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            # Leaves point back at themselves, so rows that reach a leaf
+            # early just stay there for the remaining steps
+            left.append(np.where(is_leaf, nodes, tree.children_left + offset))
+            right.append(np.where(is_leaf, nodes, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+
+            node_values = tree.value[:, 0, :]
+            if self.is_classifier:
+                # Per-tree class probabilities, as in DecisionTreeClassifier.predict_proba
+                totals = node_values.sum(axis=1, keepdims=True)
+                node_values = node_values / np.where(totals == 0, 1, totals)
+            value.append(node_values)
+
+        self.left = np.concatenate(left)
+        self.right = np.concatenate(right)
+        self.feature = np.concatenate(feature)
+        self.threshold = np.concatenate(threshold)
+        self.value = np.concatenate(value)
+
+    def __getattr__(self, name):
+        # Only called for attributes not set in __init__
+        if name == 'forest':
+            raise AttributeError(name)
+        return getattr(self.forest, name)
+
+    def _leaf_values(self, X):
+        """Mean leaf value over trees: (n_rows, n_classes), or (n_rows, 1) for regression"""
+        X = np.asarray(X, dtype=np.float32)  # sklearn compares float32 inputs
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.value[nodes].mean(axis=1)
+
+    def predict_proba(self, X):
+        if len(X) > MAX_COMPILED_ROWS:
+            return self.forest.predict_proba(X)
+        return self._leaf_values(X)
+
+    def predict(self, X):
+        if len(X) > MAX_COMPILED_ROWS:
+            return self.forest.predict(X)
+        values = self._leaf_values(X)
+        if self.is_classifier:
+            return self.forest.classes_[np.argmax(values, axis=1)]
+        return values[:, 0]
+
+
+def compile_forest(forest):
+    """CompiledForest for a fitted forest; anything else (or None) is returned as is"""
+    if forest is None or isinstance(forest, CompiledForest) or not hasattr(forest, 'estimators_'):
+        return forest
+    return CompiledForest(forest)
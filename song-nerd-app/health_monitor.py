@@ -0,0 +1,98 @@
+# health_monitor.py
+# Background database checks and stats, so health probes do no I/O
+
+import time
+import asyncio
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Pings the database and gathers detailed stats on a timer.
+
+    Orchestrators probe every few seconds; answering each probe with a
+    live query (let alone a full-table count) multiplies database load by
+    the number of replicas. Here one task pings every ``ping_interval``
+    seconds and refreshes the ``stats`` callbacks (name -> sync or async
+    function; sync ones run in a worker thread) every ``stats_interval``
+    seconds, and probes only read the results.
+
+    ``database_ready(max_age)`` is False when the last ping failed or is
+    older than ``max_age``, e.g. because the monitor itself is stuck.
+    """
+
+    def __init__(self, store, ping_interval=10.0, stats_interval=60.0, stats=None):
+        self.store = store
+        self.ping_interval = ping_interval
+        self.stats_interval = stats_interval
+        self.stats_sources = dict(stats or {})
+        self.db_ok = False
+        self.db_error = None
+        self.db_latency = None
+        self.db_checked_at = None
+        self.stats = {}
+        self.stats_updated_at = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            await self.check_database()
+            if self.stats_updated_at is None or time.time() - self.stats_updated_at >= self.stats_interval:
+                await self.refresh_stats()
+            await asyncio.sleep(self.ping_interval)
+
+    async def check_database(self):
+        start = time.perf_counter()
+        try:
+            await self.store.ping()
+        except Exception as e:
+            if self.db_ok or self.db_checked_at is None:
+                logger.warning(f"Database ping failed: {e}")
+            self.db_ok = False
+            self.db_error = str(e)
+        else:
+            self.db_ok = True
+            self.db_error = None
+        self.db_latency = time.perf_counter() - start
+        self.db_checked_at = time.time()
+        return self.db_ok
+
+    async def refresh_stats(self):
+        stats = {}
+        for name, source in self.stats_sources.items():
+            try:
+                if inspect.iscoroutinefunction(source):
+                    value = await source()
+                else:
+                    # Sync sources (e.g. SQLite counts) must not block the loop
+                    value = await asyncio.to_thread(source)
+                    if inspect.isawaitable(value):
+                        value = await value
+                stats[name] = value
+            except Exception as e:
+                logger.warning(f"Health stat {name} failed: {e}")
+                stats[name] = self.stats.get(name)
+        self.stats = stats
+        self.stats_updated_at = time.time()
+
+    def ping_age(self):
+        return None if self.db_checked_at is None else time.time() - self.db_checked_at
+
+    def database_ready(self, max_age):
+        age = self.ping_age()
+        return self.db_ok and age is not None and age <= max_age
@@ -1,23 +1,51 @@
 # integrated_analyzer.py
+import time
+import hashlib
 import pandas as pd
 import numpy as np
 from demographics_model_adapted import DemographicsPredictor
 from robust_platform_model import RobustPlatformRecommender
 from similar_artists_adapted import SimilarArtistFinder
 
+REQUIRED_FEATURES = ['danceability', 'energy', 'valence', 'acousticness',
+                     'instrumentalness', 'liveness', 'speechiness']
+
+def _files_digest(paths):
+    """Short SHA-256 over the contents of the given files, in order"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def _lap(timings, stage, start):
+    """Add the time since start to timings[stage] (if collecting); returns now"""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
 class MusicMarketingAnalyzer:
     def __init__(self):
         self.demographics_model = DemographicsPredictor()
         self.platform_model = RobustPlatformRecommender()
         self.similar_artists_model = SimilarArtistFinder()
         self.models_loaded = False
+        # Digest of the loaded model files, so stored results can tell
+        # which models produced them
+        self.model_version = None
         
     def load_models(self, models_dir='models/'):
         """Load all trained models"""
+        paths = [f'{models_dir}demographics_predictor.pkl',
+                 f'{models_dir}robust_platform_recommender.pkl',
+                 f'{models_dir}similar_artists.pkl']
         try:
-            self.demographics_model.load_model(f'{models_dir}demographics_predictor.pkl')
-            self.platform_model.load_model(f'{models_dir}robust_platform_recommender.pkl')
-            self.similar_artists_model.load_model(f'{models_dir}similar_artists.pkl')
+            self.demographics_model.load_model(paths[0])
+            self.platform_model.load_model(paths[1])
+            self.similar_artists_model.load_model(paths[2])
+            self.model_version = _files_digest(paths)
             self.models_loaded = True
             print("All models loaded successfully!")
         except Exception as e:
@@ -27,20 +55,88 @@ class MusicMarketingAnalyzer:
         
         return self
     
-    def analyze_song(self, audio_features, song_metadata=None):
-        """Complete marketing analysis for a song"""
+    def analyze_song(self, audio_features, song_metadata=None, timings=None):
+        """Complete marketing analysis for a song
+        
+        Pass a dict as ``timings`` to have the seconds spent in each model
+        added to it ('model_demographics', 'model_platforms',
+        'model_similar_artists', 'model_insights').
+        """
         if not self.models_loaded:
             raise ValueError("Models not loaded. Call load_models() first.")
         
         # Ensure audio_features is a DataFrame
         if isinstance(audio_features, dict):
-            audio_features = pd.DataFrame([audio_features])
+            audio_features = pd.DataFrame([self._complete_features(audio_features, song_metadata)])
+        else:
+            audio_features = self._complete_frame(audio_features, song_metadata)
+        
+        try:
+            return self._analyze_frame(audio_features, [song_metadata], timings=timings)[0]
+        except Exception as e:
+            print(f"Error during analysis: {e}")
+            return self._generate_fallback_analysis(audio_features, song_metadata, str(e))
+    
+    def analyze_batch(self, features_list, metadata_list=None, timings=None):
+        """Marketing analysis for many songs at once
+        
+        Each model runs once on the stacked feature matrix instead of once
+        per song; results are the same as analyze_song on each song. If the
+        batch cannot be scored as a whole, songs fall back to analyze_song
+        one by one. ``timings`` is filled as in analyze_song, for the batch.
+        """
+        if not self.models_loaded:
+            raise ValueError("Models not loaded. Call load_models() first.")
+        
+        if metadata_list is None:
+            metadata_list = [None] * len(features_list)
+        if len(metadata_list) != len(features_list):
+            raise ValueError("metadata_list must have one entry per song")
+        if not features_list:
+            return []
+        
+        songs = [
+            self._complete_features(features, song_metadata)
+            for features, song_metadata in zip(features_list, metadata_list)
+        ]
+        audio_features = pd.DataFrame(songs)
+        if 'tempo' in audio_features.columns:
+            # The platform model estimates tempo from energy when a song has
+            # none; keep that for the songs that left it out of the batch
+            audio_features['tempo'] = audio_features['tempo'].fillna(audio_features['energy'] * 140)
+        
+        try:
+            return self._analyze_frame(audio_features, metadata_list, songs, timings)
+        except Exception as e:
+            print(f"Error during batch analysis: {e}")
+            return [self.analyze_song(features, song_metadata, timings)
+                    for features, song_metadata in zip(features_list, metadata_list)]
+    
+    def _complete_features(self, audio_features, song_metadata=None):
+        """Add the features the models expect but one song's dict lacks"""
+        features = dict(audio_features)
+        
+        for feature in REQUIRED_FEATURES:
+            features.setdefault(feature, 0.5)  # Default middle value
+        
+        if 'audio_appeal' not in features:
+            # Calculate audio appeal based on features
+            features['audio_appeal'] = (
+                features['energy'] * 0.3 +
+                features['valence'] * 0.3 +
+                features['danceability'] * 0.4
+            ) * 100
+        
+        features.setdefault('normalized_popularity', 0.5)  # Default
         
-        # Add required features if missing
-        required_features = ['danceability', 'energy', 'valence', 'acousticness', 
-                           'instrumentalness', 'liveness', 'speechiness']
+        if 'genre_clean' not in features:
+            features['genre_clean'] = (song_metadata or {}).get('genre', 'pop')  # Default genre
         
-        for feature in required_features:
+        return features
+    
+    def _complete_frame(self, audio_features, song_metadata=None):
+        """_complete_features for a DataFrame of songs sharing one metadata dict"""
+        for feature in REQUIRED_FEATURES:
             if feature not in audio_features.columns:
                 audio_features[feature] = 0.5  # Default middle value
         
@@ -61,49 +157,69 @@ class MusicMarketingAnalyzer:
         elif 'genre_clean' not in audio_features.columns:
             audio_features['genre_clean'] = 'pop'  # Default genre
         
-        try:
-            # Get demographics predictions 
-            demographics = self.demographics_model.predict(audio_features)
-            
-            # Get platform recommendations
-            platforms = self.platform_model.predict(audio_features)
-            
-            # Get similar artists
-            input_dict = audio_features.iloc[0].to_dict()
-            similar_artists = self.similar_artists_model.find_similar_artists(
-                input_dict, top_k=8
-            )
-            
-            # Generate marketing insights
-            marketing_insights = self._generate_marketing_insights(
-                demographics, platforms, similar_artists, audio_features.iloc[0]
-            )
-            
-            # Compile complete analysis
-            analysis = {
-                'song_info': song_metadata or {},
-                'audio_features': audio_features.iloc[0].to_dict(),
-                'target_demographics': demographics,
-                'platform_recommendations': platforms,
-                'similar_artists': similar_artists,
-                'marketing_insights': marketing_insights,
-                'confidence_scores': {
-                    'demographics': {
-                        'age': demographics['confidence_scores']['age'],
-                        'region': demographics['confidence_scores']['region']
-                    },
-                    'platforms': platforms['top_score'] / 100,
-                    'platform_success': platforms['ranked_recommendations'][0]['success_probability'],
-                    'similar_artists': similar_artists['similar_artists'][0]['similarity_score'] if similar_artists['similar_artists'] else 0
+        return audio_features
+    
+    def _analyze_frame(self, audio_features, metadata_list, songs=None, timings=None):
+        """Run every model once over all rows, then assemble one analysis per row
+        
+        ``songs`` are the per-song input dicts when the frame was stacked
+        from them; each analysis then reports only its own song's features.
+        """
+        input_columns = set(audio_features.columns)
+        start = time.perf_counter()
+        
+        # Get demographics predictions
+        demographics = self.demographics_model.predict_batch(audio_features)
+        start = _lap(timings, 'model_demographics', start)
+        
+        # Get platform recommendations
+        platforms = self.platform_model.predict_batch(audio_features)
+        start = _lap(timings, 'model_platforms', start)
+        
+        # Get similar artists
+        rows = audio_features.to_dict('records')
+        if songs is not None:
+            added = [column for column in audio_features.columns if column not in input_columns]
+            rows = [{**song, **{column: row[column] for column in added}}
+                    for song, row in zip(songs, rows)]
+        similar_artists = self.similar_artists_model.find_similar_artists_batch(rows, top_k=8)
+        start = _lap(timings, 'model_similar_artists', start)
+        
+        analyses = [
+            self._compile_analysis(*song)
+            for song in zip(rows, metadata_list, demographics, platforms, similar_artists)
+        ]
+        _lap(timings, 'model_insights', start)
+        return analyses
+    
+    def _compile_analysis(self, features, song_metadata, demographics, platforms, similar_artists):
+        """Complete analysis for one song from its model outputs"""
+        # Generate marketing insights
+        marketing_insights = self._generate_marketing_insights(
+            demographics, platforms, similar_artists, features
+        )
+        
+        # Compile complete analysis
+        analysis = {
+            'song_info': song_metadata or {},
+            'audio_features': features,
+            'target_demographics': demographics,
+            'platform_recommendations': platforms,
+            'similar_artists': similar_artists,
+            'marketing_insights': marketing_insights,
+            'confidence_scores': {
+                'demographics': {
+                    'age': demographics['confidence_scores']['age'],
+                    'region': demographics['confidence_scores']['region']
                 },
-                'analysis_summary': self._generate_summary(demographics, platforms, similar_artists)
-            }
-            
-            return analysis
-            
-        except Exception as e:
-            print(f"Error during analysis: {e}")
-            return self._generate_fallback_analysis(audio_features, song_metadata)
+                'platforms': platforms['top_score'] / 100,
+                'platform_success': platforms['ranked_recommendations'][0]['success_probability'],
+                'similar_artists': similar_artists['similar_artists'][0]['similarity_score'] if similar_artists['similar_artists'] else 0
+            },
+            'analysis_summary': self._generate_summary(demographics, platforms, similar_artists)
+        }
+        
+        return analysis
     
     def _generate_marketing_insights(self, demographics, platforms, similar_artists, audio_features):
         """Generate comprehensive marketing insights"""
@@ -0,0 +1,191 @@
+# response_cache.py
+# Read-through cache of serialised API responses, with ETags
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag for a response body"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag) -> bool:
+    """True if an If-None-Match header covers etag (weak comparison, as RFC 9110 asks)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU + TTL cache of response bodies, in process with an optional shared file.
+
+    Entries are ``(etag, body)`` pairs keyed by a string (e.g. a song id).
+    The in-process tier holds at most ``max_entries`` and drops entries
+    ``ttl`` seconds after they were stored. With ``shared_path``, entries
+    are also written to a SQLite file so other processes on the host
+    (more API workers, analysis workers) can read them, and an
+    ``invalidate`` in any process is recorded there and honoured by every
+    process's in-process tier on its next read. Without it, an invalidate
+    only reaches the process that calls it and other processes' copies
+    live until their TTL.
+
+    Cache failures are logged and treated as misses, never raised.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600.0, shared_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_path = shared_path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        if shared_path:
+            directory = os.path.dirname(shared_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS responses (
+                        cache_key TEXT PRIMARY KEY,
+                        etag TEXT NOT NULL,
+                        body BLOB NOT NULL,
+                        stored_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS invalidations (
+                        cache_key TEXT PRIMARY KEY,
+                        invalidated_at REAL NOT NULL
+                    )
+                ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.shared_path, timeout=5)
+
+    def get(self, key):
+        """(etag, body) for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+
+        if entry is not None and self.shared_path and self._invalidated_since(key, entry[1]):
+            with self._lock:
+                self._entries.pop(key, None)
+            entry = None
+
+        if entry is None and self.shared_path:
+            entry = self._shared_get(key, now)
+            if entry is not None:
+                self._store_local(key, entry)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[2], entry[3]
+
+    def put(self, key, body: bytes, etag=None):
+        """Store a response body; returns its ETag"""
+        etag = etag or make_etag(body)
+        now = time.time()
+        entry = (now + self.ttl, now, etag, body)
+        self._store_local(key, entry)
+        if self.shared_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('''
+                        INSERT OR REPLACE INTO responses
+                            (cache_key, etag, body, stored_at, expires_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (key, etag, body, now, now + self.ttl))
+            except sqlite3.Error as e:
+                logger.warning(f"Shared response cache write failed: {e}")
+        return etag
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self.invalidations += 1
+        if self.shared_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('DELETE FROM responses WHERE cache_key = ?', (key,))
+                    conn.execute('INSERT OR REPLACE INTO invalidations VALUES (?, ?)',
+                                 (key, time.time()))
+                    # Tombstones only matter for entries that could still be alive
+                    conn.execute('DELETE FROM invalidations WHERE invalidated_at < ?',
+                                 (time.time() - self.ttl,))
+            except sqlite3.Error as e:
+                logger.warning(f"Shared response cache invalidation failed: {e}")
+
+    def _store_local(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _shared_get(self, key, now):
+        try:
+            with self._connect() as conn:
+                row = conn.execute('''
+                    SELECT expires_at, stored_at, etag, body FROM responses
+                    WHERE cache_key = ? AND expires_at > ?
+                ''', (key, now)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared response cache read failed: {e}")
+            return None
+        return (row[0], row[1], row[2], bytes(row[3])) if row else None
+
+    def _invalidated_since(self, key, stored_at):
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT invalidated_at FROM invalidations WHERE cache_key = ?',
+                                   (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared response cache read failed: {e}")
+            return True
+        return row is not None and row[0] >= stored_at
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'shared': bool(self.shared_path),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations
+        }
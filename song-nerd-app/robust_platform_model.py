@@ -6,6 +6,7 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, mean_absolute_error, r2_score
 from sklearn.model_selection import train_test_split
 import joblib
+from forest_inference import compile_forest
 
 class RobustPlatformRecommender:
     def __init__(self):
@@ -18,10 +19,13 @@ class RobustPlatformRecommender:
         
     def engineer_platform_features(self, df):
         """Create robust platform-specific features"""
-        features = df.copy()
+        features = df
+        # New columns are collected and added in one step; assigning them
+        # one at a time dominates the cost of predicting a single song
+        new = {}
         
         # Core platform affinity scores
-        features['spotify_fit'] = (
+        new['spotify_fit'] = (
             features['valence'] * 0.25 +           # Mood-based playlists
             features['energy'] * 0.2 +             # Energy-based playlists  
             features['acousticness'] * 0.2 +       # Acoustic playlists
@@ -29,14 +33,14 @@ class RobustPlatformRecommender:
             (features['audio_appeal'] / 100) * 0.15     # Quality factor
         )
         
-        features['tiktok_fit'] = (
+        new['tiktok_fit'] = (
             features['danceability'] * 0.4 +       # Dance content
             features['energy'] * 0.3 +             # High energy
             (features['speechiness'] > 0.1).astype(float) * 0.15 +  # Some vocal/rap
             features['valence'] * 0.15             # Positive mood
         )
         
-        features['youtube_fit'] = (
+        new['youtube_fit'] = (
             features['energy'] * 0.3 +             # Engaging content
             (1 - features['instrumentalness']) * 0.25 +  # Vocal content
             features['valence'] * 0.2 +            # Positive/engaging
@@ -58,7 +62,7 @@ class RobustPlatformRecommender:
         # Apply genre compatibility
         for platform in self.platform_names:
             col_name = f'genre_{platform}_fit'
-            features[col_name] = features['genre_clean'].map(
+            new[col_name] = features['genre_clean'].map(
                 lambda x: genre_compatibility.get(
                     x.lower() if isinstance(x, str) else 'pop', 
                     {'spotify': 0.7, 'tiktok': 0.7, 'youtube': 0.7}
@@ -66,25 +70,26 @@ class RobustPlatformRecommender:
             )
         
         # Viral potential indicators
-        features['hook_strength'] = (
+        new['hook_strength'] = (
             features['danceability'] * features['energy'] * 
             (1 - features['instrumentalness'])
         )
         
-        features['mood_appeal'] = np.where(
+        new['mood_appeal'] = np.where(
             features['valence'] > 0.6, 
             features['valence'] * features['energy'],
             features['valence'] * 0.5  # Penalty for sad songs
         )
         
         # Platform-specific thresholds
-        features['tempo_tiktok_sweet_spot'] = np.where(
+        new['tempo_tiktok_sweet_spot'] = np.where(
             (features.get('tempo', features['energy'] * 140) >= 100) & 
             (features.get('tempo', features['energy'] * 140) <= 140), 
             1.0, 0.5
         )
         
-        return features
+        return pd.concat([df.drop(columns=list(new), errors='ignore'),
+                          pd.DataFrame(new, index=df.index)], axis=1)
     
     def prepare_training_data(self, df, use_synthetic=True):
         """Prepare training data with option to use synthetic scores"""
@@ -239,6 +244,14 @@ class RobustPlatformRecommender:
     
     def predict(self, audio_features):
         """Predict platform performance using two-stage approach"""
+        return self.predict_batch(audio_features)[0]
+    
+    def predict_batch(self, audio_features):
+        """Two-stage platform prediction for every row of audio_features; one result per row
+
+        Missing values are filled with the training means, so a row's
+        prediction does not depend on the other rows.
+        """
         
         # Engineer features
         df_featured = self.engineer_platform_features(audio_features)
@@ -255,6 +268,12 @@ class RobustPlatformRecommender:
         
         quality_cols = ['audio_appeal']
         
+        training_means = self._training_means()
+        if 'genre_encoded' in training_means:
+            # A single song refits the genre encoder on its own genre, which
+            # always encodes as 0
+            df_featured['genre_encoded'] = 0
+        
         if 'genre_encoded' in df_featured.columns:
             platform_cols.append('genre_encoded')
         
@@ -262,43 +281,61 @@ class RobustPlatformRecommender:
         X = df_featured[feature_cols].copy()
         
         # Handle missing values
-        for col in feature_cols:
-            if col in X.columns:
-                if X[col].dtype in ['float64', 'int64']:
-                    X[col] = X[col].fillna(X[col].median() if not X[col].empty else 0)
-                else:
-                    X[col] = X[col].fillna(0)
+        for col in X.columns[X.isna().any()]:
+            if X[col].dtype in ['float64', 'int64'] and col in training_means:
+                X[col] = X[col].fillna(training_means[col])
+            else:
+                X[col] = X[col].fillna(0)
         
         # Scale
         X_scaled = self.scaler.transform(X)
         
-        # Predict for each platform
-        platform_results = {}
+        # Predict for each platform, each model once for all rows
+        success_probs = {}
+        final_scores = {}
         
         for platform in self.platform_names:
             if platform in self.success_models:
                 # Predict success probability
-                success_prob = self.success_models[platform].predict_proba(X_scaled)[0][1]
+                success_prob = self.success_models[platform].predict_proba(X_scaled)[:, 1]
                 
-                # Predict score if likely to be successful
-                if self.score_models[platform] is not None and success_prob > 0.3:
-                    predicted_score = self.score_models[platform].predict(X_scaled)[0]
-                    # Weight by success probability
-                    final_score = predicted_score * success_prob
-                else:
-                    # Use simple scoring based on success probability and platform fit
-                    platform_fit = df_featured[f'{platform}_fit'].iloc[0]
-                    final_score = success_prob * platform_fit * 100
+                # Use simple scoring based on success probability and platform fit
+                platform_fit = df_featured[f'{platform}_fit'].to_numpy()
+                final_score = success_prob * platform_fit * 100
                 
-                # Ensure reasonable bounds
-                final_score = max(0, min(100, final_score))
+                # Predicted score, weighted by success probability, where success is likely
+                if self.score_models[platform] is not None:
+                    predicted_score = self.score_models[platform].predict(X_scaled)
+                    final_score = np.where(success_prob > 0.3, predicted_score * success_prob, final_score)
                 
-                platform_results[platform] = {
-                    'score': float(final_score),
-                    'success_probability': float(success_prob),
-                    'confidence': self._calculate_confidence(final_score, success_prob),
-                    'recommendation': self._generate_recommendation(platform, final_score, success_prob)
-                }
+                success_probs[platform] = success_prob
+                # Ensure reasonable bounds
+                final_scores[platform] = np.clip(final_score, 0, 100)
+        
+        return [
+            self._format_prediction({
+                platform: (final_scores[platform][i], success_probs[platform][i])
+                for platform in success_probs
+            })
+            for i in range(len(X_scaled))
+        ]
+    
+    def _training_means(self):
+        """{feature: mean} the scaler was fitted with; empty if it saw no column names"""
+        names = getattr(self.scaler, 'feature_names_in_', None)
+        return {} if names is None else dict(zip(names, self.scaler.mean_))
+    
+    def _format_prediction(self, predictions):
+        """Ranked recommendations for one song from {platform: (score, success_prob)}"""
+        platform_results = {}
+        
+        for platform, (final_score, success_prob) in predictions.items():
+            platform_results[platform] = {
+                'score': float(final_score),
+                'success_probability': float(success_prob),
+                'confidence': self._calculate_confidence(final_score, success_prob),
+                'recommendation': self._generate_recommendation(platform, final_score, success_prob)
+            }
         
         # Rank platforms
         sorted_platforms = sorted(
@@ -422,8 +459,9 @@ class RobustPlatformRecommender:
     def load_model(self, filepath):
         """Load the robust two-stage model"""
         model_data = joblib.load(filepath)
-        self.success_models = model_data['success_models']
-        self.score_models = model_data['score_models']
+        # Compiled for fast single-song prediction (see forest_inference)
+        self.success_models = {p: compile_forest(m) for p, m in model_data['success_models'].items()}
+        self.score_models = {p: compile_forest(m) for p, m in model_data['score_models'].items()}
         self.scaler = model_data['scaler']
         self.platform_names = model_data['platform_names']
         self.label_encoders = model_data['label_encoders']
@@ -2,14 +2,17 @@
 
 from audio_processor import AudioFeatureExtractor
 from file_handler import AudioFileHandler
+from feature_cache import FeatureCache
 from integrated_analyzer import MusicMarketingAnalyzer
 import os
 import json
 
 class CompleteAudioPipeline:
-    def __init__(self):
+    def __init__(self, feature_cache=None):
         self.file_handler = AudioFileHandler()
-        self.feature_extractor = AudioFeatureExtractor()
+        # Re-uploads of the same audio are served from the cache
+        self.feature_cache = feature_cache or FeatureCache()
+        self.feature_extractor = AudioFeatureExtractor(cache=self.feature_cache)
         self.marketing_analyzer = MusicMarketingAnalyzer()
         
         self.marketing_analyzer.load_models()
@@ -26,26 +29,22 @@ class CompleteAudioPipeline:
         }
         
         try:
-            # Validate file
-            print("🔍 Validating uploaded file...")
-            is_valid, validation_errors = self.file_handler.validate_file(file_path)
+            # Validate and decode once; everything below works on this buffer
+            print("🔍 Validating and decoding uploaded file...")
+            sample_rate = self.feature_extractor.sample_rate
+            y, validation_errors = self.file_handler.load_validated(file_path, sample_rate)
             
-            if not is_valid:
+            if y is None:
                 results['errors'] = validation_errors
                 return results
             
             print("File validation passed")
             
-            # Convert to standard format
-            print("Converting to standard format...")
-            processed_path, file_metadata = self.file_handler.convert_to_standard_format(file_path)
-            results['file_info'] = file_metadata
-            
-            print("File conversion completed")
+            results['file_info'] = self.file_handler.describe_audio(file_path, y, sample_rate)
             
             # Extract audio features
             print("🎵 Extracting audio features...")
-            audio_features = self.feature_extractor.process_file(processed_path, metadata)
+            audio_features = self.feature_extractor.process_signal(y, sample_rate, metadata)
             results['audio_features'] = audio_features
             
             print("Audio feature extraction completed")
@@ -67,9 +66,6 @@ class CompleteAudioPipeline:
             
             results['success'] = True
             
-            # Cleanup temporary files
-            self.file_handler.cleanup_temp_files()
-            
             return results
             
         except Exception as e:
@@ -4,141 +4,394 @@ import librosa
 import numpy as np
 import pandas as pd
 from scipy import stats
+import scipy.signal
 import warnings
+import contextlib
+from feature_cache import audio_content_hash, file_content_hash
+from extraction_profiler import StageProfiler, STAGE_HISTOGRAMS, profile_stage
+from excerpt_policy import ExcerptPolicy
+from key_estimation import estimate_key
+from feature_engine import (AudioAnalysisContext, AGGREGATIONS, CHROMA_BACKENDS, FEATURES,
+                            FEATURE_ENGINE_VERSION, beat_sequence, compute_chroma,
+                            encode_beat_sequence, resolve_feature_names)
 warnings.filterwarnings('ignore')
 
+# Formulas live in the feature engine; the preview tier has its own surrogates
+EXTRACTOR_VERSION = FEATURE_ENGINE_VERSION
+PREVIEW_EXTRACTOR_VERSION = 'preview-1.0'
+
+
+class StreamingFeatureAccumulator:
+    """Running statistics for every feature, updated one block at a time.
+
+    Blocks must be framed without centring (see
+    AudioFeatureExtractor.extract_features_streaming) so consecutive blocks
+    produce the same frames as one continuous STFT. Only per-frame sums,
+    extrema and the onset envelope (one float per frame) are retained, so
+    memory does not grow with the size of the decoded audio.
+    """
+
+    def __init__(self, sr, n_fft=2048, hop_length=512, chroma_backend='cqt'):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.chroma_backend = chroma_backend
+        self.mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft)
+
+        self.n_samples = 0
+        self.n_frames = 0
+        self.n_chroma_frames = 0
+        self.rms_sum = 0.0
+        self.rms_max = -np.inf
+        self.rms_min = np.inf
+        self.zcr_sum = 0.0
+        self.centroid_sum = 0.0
+        self.bandwidth_sum = 0.0
+        self.flatness_sum = 0.0
+        self.harmonic_centroid_sum = 0.0
+        self.spectral_rms_sum = 0.0
+        self.harmonic_rms_sum = 0.0
+        self.magnitude_bin_sum = np.zeros(1 + n_fft // 2)
+        self.chroma_sum = np.zeros(12)
+        self._onset_blocks = []
+        self._prev_mel_db = None
+
+    def update(self, block):
+        """Fold one block of samples (a whole number of frames) into the statistics"""
+        sr, n_fft, hop = self.sr, self.n_fft, self.hop_length
+
+        magnitude = np.abs(librosa.stft(block, n_fft=n_fft, hop_length=hop, center=False))
+        harmonic, _ = librosa.decompose.hpss(magnitude)
+
+        rms = librosa.feature.rms(y=block, frame_length=n_fft, hop_length=hop, center=False)[0]
+        self.rms_sum += rms.sum()
+        self.rms_max = max(self.rms_max, rms.max())
+        self.rms_min = min(self.rms_min, rms.min())
+
+        self.zcr_sum += librosa.feature.zero_crossing_rate(
+            block, frame_length=n_fft, hop_length=hop, center=False)[0].sum()
+
+        self.centroid_sum += librosa.feature.spectral_centroid(S=magnitude, sr=sr)[0].sum()
+        self.bandwidth_sum += librosa.feature.spectral_bandwidth(S=magnitude, sr=sr)[0].sum()
+        self.flatness_sum += librosa.feature.spectral_flatness(S=magnitude)[0].sum()
+        self.harmonic_centroid_sum += librosa.feature.spectral_centroid(S=harmonic, sr=sr)[0].sum()
+        self.spectral_rms_sum += librosa.feature.rms(S=magnitude, frame_length=n_fft)[0].sum()
+        self.harmonic_rms_sum += librosa.feature.rms(S=harmonic, frame_length=n_fft)[0].sum()
+        self.magnitude_bin_sum += magnitude.sum(axis=1)
+
+        chroma = compute_chroma(self.chroma_backend, block, sr, magnitude=magnitude, hop_length=hop)
+        self.chroma_sum += chroma.sum(axis=1)
+        self.n_chroma_frames += chroma.shape[1]
+
+        # Onset strength is a first difference over time, so carry the last
+        # mel frame across the block boundary
+        mel_db = librosa.power_to_db(self.mel_basis @ magnitude ** 2)
+        if self._prev_mel_db is None:
+            previous = mel_db[:, :1]
+        else:
+            previous = self._prev_mel_db
+        reference = np.concatenate([previous, mel_db[:, :-1]], axis=1)
+        self._onset_blocks.append(np.maximum(0.0, mel_db - reference).mean(axis=0))
+        self._prev_mel_db = mel_db[:, -1:]
+
+        self.n_frames += magnitude.shape[1]
+
+    def _tempogram_mean(self, onset_envelope, win_length, chunk_frames=4096):
+        """Per-lag mean of the centred tempogram, computed a chunk of frames at a time"""
+        n = len(onset_envelope)
+        padded = np.pad(onset_envelope, (win_length // 2, win_length // 2),
+                        mode='linear_ramp', end_values=[0, 0])
+        total = np.zeros(win_length)
+        for start in range(0, n, chunk_frames):
+            stop = min(n, start + chunk_frames)
+            total += librosa.feature.tempogram(
+                onset_envelope=padded[start:stop + win_length - 1], sr=self.sr,
+                hop_length=self.hop_length, win_length=win_length, center=False).sum(axis=1)
+        return total / n
+
+    def finalize(self):
+        """Turn the accumulated statistics into the extractor's feature dict"""
+        if self.n_frames == 0:
+            raise ValueError("No audio frames were decoded")
+
+        sr = self.sr
+        n = self.n_frames
+        rms_mean = self.rms_sum / n
+        zcr_mean = self.zcr_sum / n
+
+        # A full tempogram is (win_length x frames); only its per-lag mean is
+        # needed, for both danceability and the tempo estimate beat_track uses
+        onset_envelope = np.concatenate(self._onset_blocks)
+        tempogram_mean = self._tempogram_mean(onset_envelope, win_length=384)
+        tempo_window = int(librosa.time_to_frames(8.0, sr=sr, hop_length=self.hop_length))
+        tempo = librosa.feature.tempo(
+            tg=self._tempogram_mean(onset_envelope, win_length=tempo_window)[:, np.newaxis],
+            sr=sr, hop_length=self.hop_length, aggregate=None)
+
+        key, mode, key_confidence = estimate_key(self.chroma_sum / max(self.n_chroma_frames, 1))
+
+        magnitude_bin_mean = self.magnitude_bin_sum / n
+        freq_balance = 1 - np.std(magnitude_bin_mean) / np.mean(magnitude_bin_mean)
+        dynamic_range = self.rms_max - self.rms_min
+        clarity = (self.harmonic_rms_sum / n) / (self.spectral_rms_sum / n + 1e-8)
+
+        return {
+            'duration': self.n_samples / sr,
+            'loudness': -60 + 60 * rms_mean,
+            'zero_crossing_rate': zcr_mean,
+            'tempo': float(np.atleast_1d(tempo)[0]),
+            'key': key,
+            'mode': mode,
+            'key_confidence': key_confidence,
+            'time_signature': 4,
+            'danceability': min(1.0, np.mean(tempogram_mean) * 2),
+            'energy': min(1.0, rms_mean * 10),
+            'valence': min(1.0, max(0.0, (self.centroid_sum / n) / (sr/2) + 0.3)),
+            'acousticness': max(0.0, min(1.0, 1 - (self.bandwidth_sum / n) / 4000)),
+            'instrumentalness': max(0.0, min(1.0, 1 - (self.harmonic_centroid_sum / n) / 3000)),
+            'liveness': min(1.0, (self.flatness_sum / n) * 10),
+            'speechiness': min(1.0, zcr_mean * 5),
+            'audio_appeal': min(100, max(0,
+                (dynamic_range * 30 + freq_balance * 40 + clarity * 30)))
+        }
+
+
 class AudioFeatureExtractor:
-    def __init__(self, sample_rate=22050):
+    version = EXTRACTOR_VERSION
+    quality = 'full'
+    registry = FEATURES
+    
+    def __init__(self, sample_rate=22050, cache=None, streaming=False, block_seconds=10.0,
+                 excerpt='full', chroma_backend='cqt', profile=False, profile_memory=False,
+                 histograms=None, features=None, aggregation='frame', beat_sequence=False):
         self.sample_rate = sample_rate
+        self.cache = cache  # optional FeatureCache
+        # Streaming mode decodes and analyses block_seconds at a time so peak
+        # memory stays flat however long the track is
+        self.streaming = streaming
+        self.block_seconds = block_seconds
+        # Part of the track to analyse, e.g. 'full', 'first:15', 'hook:30'
+        self.excerpt = ExcerptPolicy.from_spec(excerpt)
+        # 'stft' is far cheaper than 'cqt' and suits interactive calls;
+        # chroma only feeds key and mode
+        if chroma_backend not in CHROMA_BACKENDS:
+            raise ValueError(f"Unknown chroma backend: {chroma_backend} (choose from {CHROMA_BACKENDS})")
+        self.chroma_backend = chroma_backend
+        # Profiling adds per-stage '_timings' (and '_peak_memory_mb' with
+        # profile_memory) to every result and feeds the stage histograms
+        self.profile = profile or profile_memory
+        self.profile_memory = profile_memory
+        self.histograms = histograms if histograms is not None else STAGE_HISTOGRAMS
+        # Subset of features to compute: None for all, a FEATURE_SETS name
+        # ('model', 'rhythm', ...) or a list; only the intermediates the
+        # subset needs are computed
+        self.feature_names = self.registry.validate(resolve_feature_names(features))
+        # 'beat' pools frame-level intermediates per beat before reducing;
+        # beat_sequence also returns the compact per-beat feature matrix
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation: {aggregation} (choose from {AGGREGATIONS})")
+        if streaming and (aggregation != 'frame' or beat_sequence):
+            raise ValueError("Beat aggregation and beat sequences need the in-memory path, "
+                             "not streaming")
+        self.aggregation = aggregation
+        self.beat_sequence = beat_sequence
         
     def extract_features(self, audio_path):
         """Extract all audio features needed by your ML models"""
+        # Excerpts are short by construction, so only full tracks need streaming
+        if self.streaming and self.excerpt.is_full:
+            return self.extract_features_streaming(audio_path)
+        
+        profiler = self._new_profiler()
         try:
-            y, sr = librosa.load(audio_path, sr=self.sample_rate)
-
-            features = {}
-            
-            features.update(self._extract_basic_features(y, sr))
-            
-            features.update(self._extract_spotify_features(y, sr))
-            
-            features.update(self._extract_quality_features(y, sr))
-            
-            return features
-            
+            with profiler or contextlib.nullcontext():
+                with profile_stage(profiler, 'decode'):
+                    y, sr = self.excerpt.load(audio_path, sr=self.sample_rate)
+                features = self._extract_from_signal(y, sr, profiler)
         except Exception as e:
             raise Exception(f"Error processing audio: {str(e)}")
-    
-    def _extract_basic_features(self, y, sr):
-        """Extract basic audio characteristics"""
-        features = {}
-        
-        features['duration'] = len(y) / sr
         
-        # RMS (loudness proxy)
-        rms = librosa.feature.rms(y=y)[0]
-        features['loudness'] = -60 + 60 * np.mean(rms)  # Convert to dB-like scale
-        
-        # Zero crossing rate (speechiness proxy)
-        zcr = librosa.feature.zero_crossing_rate(y)[0]
-        features['zero_crossing_rate'] = np.mean(zcr)
+        return self._record_profile(features, profiler)
+    
+    def extract_features_from_signal(self, y, sr):
+        """Extract features from an already decoded mono signal, with no file I/O"""
+        profiler = self._new_profiler()
+        with profiler or contextlib.nullcontext():
+            features = self._extract_from_signal(y, sr, profiler)
+        return self._record_profile(features, profiler)
+    
+    def _extract_from_signal(self, y, sr, profiler=None):
+        if sr != self.sample_rate:
+            with profile_stage(profiler, 'resample'):
+                y = librosa.resample(y, orig_sr=sr, target_sr=self.sample_rate)
+            sr = self.sample_rate
+        
+        # No-op when the signal was loaded through the same policy
+        y = self.excerpt.apply(y, sr)
+        
+        cache_key = None
+        if self.cache is not None:
+            with profile_stage(profiler, 'cache_lookup'):
+                cache_key = self.cache.make_key(audio_content_hash(y, sr), self._cache_version())
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        # Every feature below reads from this shared context
+        ctx = AudioAnalysisContext(y, sr, chroma_backend=self.chroma_backend, profiler=profiler,
+                                   aggregation=self.aggregation)
+        
+        # Intermediates are timed as their own stages, so 'features' is
+        # only the time spent in the feature formulas themselves
+        with profile_stage(profiler, 'features'):
+            features = self._select(self._compute_features(ctx))
+        
+        features['excerpt_policy'] = str(self.excerpt)
+        features['chroma_backend'] = self.chroma_backend
+        features['feature_quality'] = self.quality
+        features['extractor_version'] = self.version
+        features['aggregation'] = self.aggregation
+        
+        if self.beat_sequence:
+            with profile_stage(profiler, 'beat_sequence'):
+                features['beat_sequence'] = encode_beat_sequence(*beat_sequence(ctx))
+        
+        if cache_key is not None:
+            with profile_stage(profiler, 'cache_write'):
+                self.cache.put(cache_key, features)
         
         return features
     
-    def _extract_spotify_features(self, y, sr):
-        """Extract Spotify-like audio features"""
-        features = {}
-        
-        # Tempo and beat tracking
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-        features['tempo'] = float(tempo)
-        
-        # Key and mode
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        key = np.argmax(np.sum(chroma, axis=1))
-        features['key'] = int(key)
-        
-        # Mode (major=1, minor=0) - simplified approach
-        major_profile = [1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1]
-        minor_profile = [1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0]
-        
-        chroma_mean = np.mean(chroma, axis=1)
-        major_correlation = np.corrcoef(chroma_mean, major_profile)[0, 1]
-        minor_correlation = np.corrcoef(chroma_mean, minor_profile)[0, 1]
-        
-        features['mode'] = 1 if major_correlation > minor_correlation else 0
-        
-        # Time signature (simplified)
-        features['time_signature'] = 4  # Default to 4/4
-        
-        # Danceability (based on beat strength and regularity)
-        beat_strength = librosa.feature.tempogram(y=y, sr=sr)
-        features['danceability'] = min(1.0, np.mean(beat_strength) * 2)
-        
-        # Energy (based on spectral characteristics)
-        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        rms_energy = librosa.feature.rms(y=y)[0]
-        features['energy'] = min(1.0, np.mean(rms_energy) * 10)
-        
-        # Valence (positivity - simplified approach using spectral features)
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-        
-        # Combine features that correlate with perceived positivity
-        brightness = np.mean(spectral_centroids) / (sr/2)  # Normalized brightness
-        rhythm_strength = np.std(beats) if len(beats) > 1 else 0
-        
-        features['valence'] = min(1.0, max(0.0, brightness + 0.3))
-        
-        # Acousticness (inverse of spectral energy in higher frequencies)
-        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-        features['acousticness'] = max(0.0, min(1.0, 1 - np.mean(spectral_bandwidth) / 4000))
-        
-        # Instrumentalness (based on vocal detection)
-        # Look for harmonic content that suggests vocals
-        harmonic, percussive = librosa.effects.hpss(y)
-        vocal_likelihood = np.mean(librosa.feature.spectral_centroid(y=harmonic, sr=sr))
-        features['instrumentalness'] = max(0.0, min(1.0, 1 - vocal_likelihood / 3000))
-        
-        # Liveness (based on spectral characteristics and reverb)
-        spectral_flatness = librosa.feature.spectral_flatness(y=y)[0]
-        features['liveness'] = min(1.0, np.mean(spectral_flatness) * 10)
-        
-        # Speechiness (based on zero crossing rate and spectral characteristics)
-        features['speechiness'] = min(1.0, features['zero_crossing_rate'] * 5)
-        
+    def _new_profiler(self):
+        return StageProfiler(track_memory=self.profile_memory) if self.profile else None
+    
+    def _record_profile(self, features, profiler):
+        """Attach the stage report (never cached) and update the histograms"""
+        if profiler is None:
+            return features
+        report = profiler.report()
+        self.histograms.observe_timings(report['_timings'])
+        features.update(report)
         return features
     
-    def _extract_quality_features(self, y, sr):
-        """Extract audio quality and appeal metrics"""
-        features = {}
-        
-        # Audio appeal (composite quality score)
-        # Based on dynamic range, frequency balance, and clarity
-        
-        # Dynamic range
-        rms = librosa.feature.rms(y=y)[0]
-        dynamic_range = np.max(rms) - np.min(rms)
-        
-        # Frequency balance (how well distributed energy is across spectrum)
-        stft = librosa.stft(y)
-        magnitude = np.abs(stft)
-        freq_balance = 1 - np.std(np.mean(magnitude, axis=1)) / np.mean(magnitude)
-        
-        # Clarity (inverse of noise)
-        harmonic, percussive = librosa.effects.hpss(y)
-        clarity = np.mean(librosa.feature.rms(y=harmonic)) / (np.mean(librosa.feature.rms(y=y)) + 1e-8)
+    def _compute_features(self, ctx):
+        return self.registry.compute(ctx, self.feature_names)
+    
+    def _select(self, features):
+        """Keep only the requested features (for paths that compute them all)"""
+        if self.feature_names is None:
+            return features
+        return {name: features[name] for name in self.feature_names}
+    
+    def _cache_version(self, streaming=False):
+        """Everything besides the audio that changes the extracted features"""
+        mode = f"{self.version}-stream" if streaming else self.version
+        excerpt = 'full' if streaming else self.excerpt
+        version = f"{mode}|{excerpt}|chroma={self.chroma_backend}"
+        if self.feature_names is not None:
+            version += f"|features={','.join(sorted(self.feature_names))}"
+        if self.aggregation != 'frame':
+            version += f"|agg={self.aggregation}"
+        if self.beat_sequence:
+            version += "|beat_sequence"
+        return version
+    
+    def _iter_decoded_blocks(self, audio_path, read_frames=65536):
+        """Decode audio_path incrementally as mono float32 at self.sample_rate"""
+        import soundfile as sf
+        import soxr
+        
+        with sf.SoundFile(audio_path) as f:
+            resampler = None
+            if f.samplerate != self.sample_rate:
+                resampler = soxr.ResampleStream(f.samplerate, self.sample_rate, 1, dtype='float32')
+            
+            while True:
+                data = f.read(read_frames, dtype='float32', always_2d=True)
+                last = len(data) < read_frames
+                mono = data.mean(axis=1)
+                if resampler is not None:
+                    mono = resampler.resample_chunk(mono, last=last)
+                if len(mono):
+                    yield mono
+                if last:
+                    break
+    
+    def extract_features_streaming(self, audio_path, n_fft=2048, hop_length=512):
+        """Extract the same features as extract_features in constant memory"""
+        profiler = self._new_profiler()
+        try:
+            with profiler or contextlib.nullcontext():
+                features = self._extract_streaming(audio_path, n_fft, hop_length, profiler)
+        except Exception as e:
+            raise Exception(f"Error processing audio: {str(e)}")
         
-        # Combine into appeal score (0-100)
-        features['audio_appeal'] = min(100, max(0, 
-            (dynamic_range * 30 + freq_balance * 40 + clarity * 30)))
+        return self._record_profile(features, profiler)
+    
+    def _extract_streaming(self, audio_path, n_fft, hop_length, profiler=None):
+        cache_key = None
+        if self.cache is not None:
+            # Keyed on the file's bytes, not the decoded signal: hashing the
+            # signal would mean decoding the whole track once just to look
+            # it up and again to analyse it
+            with profile_stage(profiler, 'cache_lookup'):
+                audio_hash = file_content_hash(audio_path, extra=self.sample_rate)
+                cache_key = self.cache.make_key(audio_hash, self._cache_version(streaming=True))
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        accumulator = StreamingFeatureAccumulator(self.sample_rate, n_fft, hop_length,
+                                                  chroma_backend=self.chroma_backend)
+        block_samples = hop_length * max(1, int(self.block_seconds * self.sample_rate) // hop_length)
+        overlap = n_fft - hop_length
+        
+        # Decoding and block analysis interleave; 'decode' is charged only
+        # the time not spent inside the nested 'block_analysis' stages
+        with profile_stage(profiler, 'decode'):
+            # pending always starts on a frame boundary; each update consumes
+            # block_samples and keeps the overlap the next frames still need
+            pending = np.zeros(0, dtype=np.float32)
+            for chunk in self._iter_decoded_blocks(audio_path):
+                accumulator.n_samples += len(chunk)
+                pending = np.concatenate([pending, chunk])
+                while len(pending) >= block_samples + overlap:
+                    with profile_stage(profiler, 'block_analysis'):
+                        accumulator.update(pending[:block_samples + overlap])
+                    pending = pending[block_samples:]
+        
+        with profile_stage(profiler, 'block_analysis'):
+            if len(pending) > 0 and (accumulator.n_frames == 0 or len(pending) > overlap):
+                if len(pending) < n_fft:
+                    pending = np.pad(pending, (0, n_fft - len(pending)))
+                accumulator.update(pending)
+        
+        with profile_stage(profiler, 'finalize'):
+            features = self._select(accumulator.finalize())
+        features['excerpt_policy'] = 'full'
+        features['chroma_backend'] = self.chroma_backend
+        features['feature_quality'] = self.quality
+        features['extractor_version'] = self.version
+        features['aggregation'] = 'frame'
+        
+        if cache_key is not None:
+            with profile_stage(profiler, 'cache_write'):
+                self.cache.put(cache_key, features)
         
         return features
     
     def process_file(self, audio_path, metadata=None):
         """Main processing function that returns ML-ready features"""
         features = self.extract_features(audio_path)
-        
+        return self._prepare_for_models(features, metadata)
+    
+    def process_signal(self, y, sr, metadata=None):
+        """process_file for audio that is already decoded in memory"""
+        features = self.extract_features_from_signal(y, sr)
+        return self._prepare_for_models(features, metadata)
+    
+    def _prepare_for_models(self, features, metadata=None):
+        """Merge metadata and fill the defaults the ML models expect"""
         # Add metadata if provided
         if metadata:
             features.update(metadata)
@@ -163,6 +416,96 @@ class AudioFeatureExtractor:
         
         return features
 
+
+class PreviewFeatureExtractor(AudioFeatureExtractor):
+    """Low-latency extractor for interactive uploads.
+
+    Returns the same keys as AudioFeatureExtractor from a short excerpt but
+    skips HPSS, the tempogram and CQT chroma. Tempo and danceability come
+    from one autocorrelation of the onset envelope, the harmonic part used
+    for instrumentalness and clarity comes from a soft mask built from
+    global (not sliding) medians, and key/mode use STFT chroma. Results are
+    marked feature_quality='preview' and are meant to be overwritten once a
+    full extraction finishes.
+    """
+    version = PREVIEW_EXTRACTOR_VERSION
+    quality = 'preview'
+    
+    def __init__(self, sample_rate=22050, cache=None, excerpt='preview', profile=False,
+                 profile_memory=False, histograms=None, features=None):
+        super().__init__(sample_rate=sample_rate, cache=cache, excerpt=excerpt,
+                         chroma_backend='stft', profile=profile,
+                         profile_memory=profile_memory, histograms=histograms,
+                         features=features)
+    
+    def _onset_autocorrelation(self, ctx, max_lag=384):
+        ac = librosa.autocorrelate(ctx.onset_envelope, max_size=max_lag)
+        return ac / (ac[0] + 1e-8)
+    
+    def _tempogram_mean_estimate(self, onset_ac):
+        """Mean of the windowed tempogram, from the global autocorrelation.
+        
+        Each tempogram frame autocorrelates a Hann-windowed slice, which scales
+        lag k by the window's own autocorrelation; applying that taper to the
+        global autocorrelation lands on the same scale.
+        """
+        window = scipy.signal.get_window('hann', len(onset_ac))
+        taper = librosa.autocorrelate(window)
+        return np.mean(onset_ac * taper / taper[0])
+    
+    def _harmonic_mask(self, magnitude):
+        """Soft harmonic mask from per-bin and per-frame medians (cheap HPSS stand-in)"""
+        harmonic = np.median(magnitude, axis=1, keepdims=True) ** 2
+        percussive = np.median(magnitude, axis=0, keepdims=True) ** 2
+        return harmonic / (harmonic + percussive + 1e-10)
+    
+    def _estimate_tempo(self, ctx, onset_ac, start_bpm=120.0, min_bpm=50.0, max_bpm=200.0):
+        """Autocorrelation peak weighted by the same log-normal prior librosa uses"""
+        lags = np.arange(1, len(onset_ac))
+        bpms = 60.0 * ctx.sr / (ctx.hop_length * lags)
+        in_range = (bpms >= min_bpm) & (bpms <= max_bpm)
+        if not np.any(in_range):
+            return start_bpm
+        prior = np.exp(-0.5 * (np.log2(bpms) - np.log2(start_bpm)) ** 2)
+        weighted = np.where(in_range, onset_ac[1:] * prior, -np.inf)
+        return float(bpms[np.argmax(weighted)])
+    
+    def _compute_features(self, ctx):
+        sr = ctx.sr
+        rms = ctx.rms
+        zcr_mean = np.mean(ctx.zero_crossing_rate)
+        onset_ac = self._onset_autocorrelation(ctx)
+        key, mode, key_confidence = estimate_key(ctx.chroma)
+        
+        magnitude = ctx.magnitude
+        harmonic = magnitude * self._harmonic_mask(magnitude)
+        harmonic_centroid = np.mean(librosa.feature.spectral_centroid(S=harmonic, sr=sr))
+        
+        freq_balance = 1 - np.std(np.mean(magnitude, axis=1)) / np.mean(magnitude)
+        dynamic_range = np.max(rms) - np.min(rms)
+        clarity = (np.mean(librosa.feature.rms(S=harmonic, frame_length=ctx.n_fft))
+                   / (np.mean(ctx.spectral_rms) + 1e-8))
+        
+        return {
+            'duration': len(ctx.y) / sr,
+            'loudness': -60 + 60 * np.mean(rms),
+            'zero_crossing_rate': zcr_mean,
+            'tempo': self._estimate_tempo(ctx, onset_ac),
+            'key': key,
+            'mode': mode,
+            'key_confidence': key_confidence,
+            'time_signature': 4,
+            'danceability': min(1.0, self._tempogram_mean_estimate(onset_ac) * 2),
+            'energy': min(1.0, np.mean(rms) * 10),
+            'valence': min(1.0, max(0.0, np.mean(ctx.spectral_centroid) / (sr/2) + 0.3)),
+            'acousticness': max(0.0, min(1.0, 1 - np.mean(ctx.spectral_bandwidth) / 4000)),
+            'instrumentalness': max(0.0, min(1.0, 1 - harmonic_centroid / 3000)),
+            'liveness': min(1.0, np.mean(ctx.spectral_flatness) * 10),
+            'speechiness': min(1.0, zcr_mean * 5),
+            'audio_appeal': min(100, max(0,
+                (dynamic_range * 30 + freq_balance * 40 + clarity * 30)))
+        }
+
 # Example use and testing
 def test_audio_processor():
     """Test the audio processor with a sample file"""
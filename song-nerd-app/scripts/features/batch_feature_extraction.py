@@ -0,0 +1,295 @@
+# batch_feature_extraction.py
+# Fan audio feature extraction out over a process pool and stream results to disk
+
+import csv
+import time
+import logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing as mp
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.flac', '.ogg')
+
+FEATURE_COLUMNS = [
+    'duration', 'loudness', 'zero_crossing_rate', 'tempo', 'key', 'mode',
+    'key_confidence', 'time_signature', 'danceability', 'energy', 'valence', 'acousticness',
+    'instrumentalness', 'liveness', 'speechiness', 'audio_appeal'
+]
+
+OUTPUT_COLUMNS = (['file_path'] + FEATURE_COLUMNS +
+                  ['excerpt_policy', 'chroma_backend', 'feature_quality', 'extractor_version',
+                   'aggregation', 'error'])
+
+STRING_COLUMNS = ('file_path', 'excerpt_policy', 'chroma_backend', 'feature_quality',
+                  'extractor_version', 'aggregation', 'error')
+
+# One extractor per worker process, created by the pool initializer
+_worker_extractor = None
+
+
+def discover_audio_files(source):
+    """Collect audio paths from a directory (recursive) or a manifest file.
+
+    A manifest is either a .csv with a ``file_path`` (or ``path``) column or a
+    plain text file with one path per line. Relative manifest paths are
+    resolved against the manifest's directory.
+    """
+    source = Path(source)
+
+    if source.is_dir():
+        return sorted(
+            str(p) for p in source.rglob('*')
+            if p.is_file() and p.suffix.lower() in AUDIO_EXTENSIONS
+        )
+
+    if not source.exists():
+        raise FileNotFoundError(f"Audio source not found: {source}")
+
+    base_dir = source.parent
+    if source.suffix.lower() == '.csv':
+        with open(source, newline='') as f:
+            reader = csv.DictReader(f)
+            column = 'file_path' if 'file_path' in (reader.fieldnames or []) else 'path'
+            if column not in (reader.fieldnames or []):
+                raise ValueError(f"Manifest {source} needs a 'file_path' or 'path' column")
+            entries = [row[column].strip() for row in reader if row.get(column)]
+    else:
+        with open(source) as f:
+            entries = [line.strip() for line in f
+                       if line.strip() and not line.startswith('#')]
+
+    return [str(p if p.is_absolute() else base_dir / p) for p in map(Path, entries)]
+
+
+def _init_worker(sample_rate, streaming, excerpt, chroma_backend, aggregation):
+    global _worker_extractor
+    from audio_processor import AudioFeatureExtractor
+    _worker_extractor = AudioFeatureExtractor(sample_rate=sample_rate, streaming=streaming,
+                                              excerpt=excerpt, chroma_backend=chroma_backend,
+                                              aggregation=aggregation)
+
+
+def _extract_one(audio_path):
+    """Worker entry point: never raises, errors are reported in the row"""
+    try:
+        features = _worker_extractor.extract_features(audio_path)
+        row = {'file_path': audio_path, 'error': None}
+        row.update(features)
+        return row
+    except Exception as e:
+        return {'file_path': audio_path, 'error': str(e)}
+
+
+def _to_scalar(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class CSVFeatureSink:
+    """Append rows to a CSV file as they arrive"""
+
+    def __init__(self, output_path, columns=None):
+        self.output_path = output_path
+        self.columns = columns or OUTPUT_COLUMNS
+        self._file = open(output_path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+        self._writer.writeheader()
+
+    def write(self, row):
+        self._writer.writerow({k: _to_scalar(row.get(k)) for k in self.columns})
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetFeatureSink:
+    """Write rows to a Parquet file in row groups of ``row_group_size``"""
+
+    def __init__(self, output_path, columns=None, row_group_size=256):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow")
+
+        self._pa = pa
+        self.output_path = output_path
+        self.columns = columns or OUTPUT_COLUMNS
+        self.row_group_size = row_group_size
+        self._schema = pa.schema([
+            (col, pa.string() if col in STRING_COLUMNS else pa.float64())
+            for col in self.columns
+        ])
+        self._writer = pq.ParquetWriter(output_path, self._schema)
+        self._buffer = []
+
+    def write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        data = {}
+        for col in self.columns:
+            values = [_to_scalar(row.get(col)) for row in self._buffer]
+            if col not in STRING_COLUMNS:
+                values = [None if v is None else float(v) for v in values]
+            data[col] = values
+        self._writer.write_table(self._pa.Table.from_pydict(data, schema=self._schema))
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_sink(output_path, columns=None):
+    """Pick a sink from the output file extension"""
+    suffix = Path(output_path).suffix.lower()
+    if suffix == '.parquet':
+        return ParquetFeatureSink(output_path, columns)
+    if suffix == '.csv':
+        return CSVFeatureSink(output_path, columns)
+    raise ValueError(f"Unsupported output format: {suffix} (use .csv or .parquet)")
+
+
+class BatchFeatureExtractor:
+    """Extract features for many files across a process pool.
+
+    At most ``max_in_flight`` files are submitted at any time, so decoded
+    audio held by workers and results waiting to be written stay bounded
+    regardless of how many files are in the batch.
+    """
+
+    def __init__(self, max_workers=None, max_in_flight=None, sample_rate=22050,
+                 streaming=False, excerpt='full', chroma_backend='cqt', aggregation='frame'):
+        self.max_workers = max_workers or max(1, mp.cpu_count() - 1)
+        self.max_in_flight = max_in_flight or self.max_workers * 2
+        self.sample_rate = sample_rate
+        self.streaming = streaming
+        self.excerpt = str(excerpt)
+        self.chroma_backend = chroma_backend
+        self.aggregation = aggregation
+
+    def iter_results(self, audio_paths):
+        """Yield one result row per path, in completion order"""
+        paths = iter(audio_paths)
+
+        with ProcessPoolExecutor(max_workers=self.max_workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.sample_rate, self.streaming,
+                                           self.excerpt, self.chroma_backend,
+                                           self.aggregation)) as executor:
+            in_flight = set()
+
+            def refill():
+                for path in paths:
+                    in_flight.add(executor.submit(_extract_one, path))
+                    if len(in_flight) >= self.max_in_flight:
+                        break
+
+            refill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    yield future.result()
+                refill()
+
+    def run(self, audio_paths, sink, log_every=100):
+        """Stream every result into ``sink``; returns a summary dict"""
+        audio_paths = list(audio_paths)
+        total = len(audio_paths)
+        succeeded = failed = 0
+        start_time = time.time()
+
+        logger.info(f"Extracting features for {total} files with {self.max_workers} workers "
+                    f"(max {self.max_in_flight} in flight)")
+
+        try:
+            for row in self.iter_results(audio_paths):
+                sink.write(row)
+                if row.get('error'):
+                    failed += 1
+                    logger.warning(f"Failed: {row['file_path']}: {row['error']}")
+                else:
+                    succeeded += 1
+
+                processed = succeeded + failed
+                if processed % log_every == 0:
+                    rate = processed / max(time.time() - start_time, 1e-9)
+                    logger.info(f"Processed {processed}/{total} files ({rate:.1f} files/s)")
+        finally:
+            sink.close()
+
+        elapsed = time.time() - start_time
+        logger.info(f"Batch completed in {elapsed:.1f}s: {succeeded} succeeded, {failed} failed")
+
+        return {
+            'total': total,
+            'succeeded': succeeded,
+            'failed': failed,
+            'elapsed_seconds': elapsed
+        }
+
+
+def extract_features_batch(source, output_path, max_workers=None, max_in_flight=None,
+                           sample_rate=22050, streaming=False, excerpt='full',
+                           chroma_backend='cqt', aggregation='frame'):
+    """Extract features for a directory or manifest and write them to output_path"""
+    audio_paths = discover_audio_files(source)
+    sink = open_sink(output_path)
+    extractor = BatchFeatureExtractor(max_workers=max_workers,
+                                      max_in_flight=max_in_flight,
+                                      sample_rate=sample_rate,
+                                      streaming=streaming,
+                                      excerpt=excerpt,
+                                      chroma_backend=chroma_backend,
+                                      aggregation=aggregation)
+    return extractor.run(audio_paths, sink)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Batch Audio Feature Extraction')
+    parser.add_argument('source', help='Directory of audio files or manifest (.csv/.txt)')
+    parser.add_argument('--output', default='audio_features.parquet',
+                        help='Output file (.parquet or .csv)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: cores - 1)')
+    parser.add_argument('--max-in-flight', type=int,
+                        help='Max files submitted at once (default: 2 x workers)')
+    parser.add_argument('--sample-rate', type=int, default=22050, help='Analysis sample rate')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Decode in blocks so per-worker memory is independent of track length')
+    parser.add_argument('--excerpt', default='full',
+                        help="Part of each track to analyse: full, first:15, spaced:3x10, hook:30 "
+                             "or a preset (preview, interactive, api, batch)")
+    parser.add_argument('--chroma-backend', default='cqt', choices=['cqt', 'stft', 'cens'],
+                        help='Chroma backend used for key/mode estimation')
+    parser.add_argument('--aggregation', default='frame', choices=['frame', 'beat'],
+                        help='Reduce frame features directly or pool them per beat first')
+    args = parser.parse_args()
+
+    summary = extract_features_batch(
+        args.source, args.output,
+        max_workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        sample_rate=args.sample_rate,
+        streaming=args.streaming,
+        excerpt=args.excerpt,
+        chroma_backend=args.chroma_backend,
+        aggregation=args.aggregation
+    )
+    print(f"Wrote {summary['total']} rows to {args.output}: {summary['succeeded']} succeeded, "
+          f"{summary['failed']} failed ({summary['elapsed_seconds']:.1f}s)")
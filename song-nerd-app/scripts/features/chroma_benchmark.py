@@ -0,0 +1,135 @@
+# chroma_benchmark.py
+# Compare chroma backends on runtime and key/mode agreement over a sample set
+
+import json
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+from audio_processor import CHROMA_BACKENDS, compute_chroma
+from batch_feature_extraction import discover_audio_files
+from excerpt_policy import ExcerptPolicy
+from key_estimation import estimate_key, key_name
+
+logger = logging.getLogger(__name__)
+
+
+def benchmark_file(audio_path, backends=CHROMA_BACKENDS, excerpt='full', sample_rate=22050,
+                   repeats=1):
+    """Time each backend on one decoded track and record its key estimate.
+
+    The stft backend is timed including its own STFT, since in the
+    extractor that cost is shared with other features but a fair
+    comparison should not assume it is free.
+    """
+    y, sr = ExcerptPolicy.from_spec(excerpt).load(audio_path, sr=sample_rate)
+    rows = []
+
+    for backend in backends:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            chroma = compute_chroma(backend, y, sr)
+            key, mode, confidence = estimate_key(chroma)
+            timings.append(time.perf_counter() - start)
+
+        rows.append({
+            'file_path': audio_path,
+            'backend': backend,
+            'seconds': float(np.median(timings)),
+            'audio_seconds': len(y) / sr,
+            'key': key,
+            'mode': mode,
+            'key_name': key_name(key, mode),
+            'key_confidence': confidence
+        })
+
+    return rows
+
+
+def summarize(results, reference='cqt'):
+    """Per-backend runtime and agreement with the reference backend"""
+    ref_rows = results[results['backend'] == reference]
+    ref = ref_rows.set_index('file_path')[['key', 'mode']]
+    ref_seconds = ref_rows['seconds'].mean()
+    summary = []
+
+    for backend, group in results.groupby('backend', sort=False):
+        group = group.set_index('file_path')
+        joined = group.join(ref, rsuffix='_ref', how='inner')
+        same_key = joined['key'] == joined['key_ref']
+        same_mode = joined['mode'] == joined['mode_ref']
+
+        summary.append({
+            'backend': backend,
+            'files': len(group),
+            'mean_seconds': group['seconds'].mean(),
+            'seconds_per_audio_minute': 60 * group['seconds'].sum() / group['audio_seconds'].sum(),
+            'speedup_vs_reference': ref_seconds / group['seconds'].mean(),
+            'key_agreement': float(same_key.mean()) if len(joined) else np.nan,
+            'key_mode_agreement': float((same_key & same_mode).mean()) if len(joined) else np.nan,
+            'mean_key_confidence': group['key_confidence'].mean()
+        })
+
+    return pd.DataFrame(summary)
+
+
+def run_benchmark(source, backends=CHROMA_BACKENDS, excerpt='full', reference='cqt',
+                  limit=None, repeats=1):
+    audio_paths = discover_audio_files(source)
+    if limit:
+        audio_paths = audio_paths[:limit]
+    if reference not in backends:
+        backends = (reference,) + tuple(backends)
+
+    logger.info(f"Benchmarking {len(backends)} chroma backends on {len(audio_paths)} files")
+
+    rows = []
+    for i, path in enumerate(audio_paths, 1):
+        try:
+            rows.extend(benchmark_file(path, backends, excerpt=excerpt, repeats=repeats))
+        except Exception as e:
+            logger.warning(f"Skipping {path}: {e}")
+        if i % 10 == 0:
+            logger.info(f"Benchmarked {i}/{len(audio_paths)} files")
+
+    if not rows:
+        raise ValueError("No files could be benchmarked")
+
+    results = pd.DataFrame(rows)
+    return results, summarize(results, reference)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Chroma Backend Benchmark')
+    parser.add_argument('source', help='Directory of audio files or manifest (.csv/.txt)')
+    parser.add_argument('--backends', nargs='+', default=list(CHROMA_BACKENDS),
+                        choices=list(CHROMA_BACKENDS), help='Backends to compare')
+    parser.add_argument('--reference', default='cqt', choices=list(CHROMA_BACKENDS),
+                        help='Backend the others are compared against')
+    parser.add_argument('--excerpt', default='full', help='Excerpt policy, e.g. first:30')
+    parser.add_argument('--limit', type=int, help='Only use the first N files')
+    parser.add_argument('--repeats', type=int, default=1, help='Timing repeats per file (median)')
+    parser.add_argument('--output', help='Write the per-file results (.csv) and summary (.json)')
+    args = parser.parse_args()
+
+    results, summary = run_benchmark(
+        args.source, backends=tuple(args.backends), excerpt=args.excerpt,
+        reference=args.reference, limit=args.limit, repeats=args.repeats
+    )
+
+    print("\nChroma Backend Benchmark")
+    print("=" * 60)
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    if args.output:
+        results.to_csv(f"{args.output}.csv", index=False)
+        with open(f"{args.output}.json", 'w') as f:
+            json.dump(summary.to_dict(orient='records'), f, indent=2, default=float)
+        print(f"\nReport saved to: {args.output}.csv / {args.output}.json")
@@ -0,0 +1,131 @@
+# excerpt_policy.py
+# Which part of a track the feature extractors analyse
+
+import numpy as np
+import librosa
+
+# Suggested policies per latency tier
+EXCERPT_PRESETS = {
+    'preview': 'first:15',
+    'interactive': 'hook:30',
+    'api': 'first:60',
+    'batch': 'full'
+}
+
+STRATEGIES = ('full', 'first', 'spaced', 'hook')
+
+
+class ExcerptPolicy:
+    """Selects the audio to analyse, trading accuracy for latency.
+
+    Policies are written as compact specs so they can be passed on the
+    command line or in env vars and stored alongside the features:
+
+        full           whole track
+        first:15       first 15 seconds
+        spaced:3x10    3 evenly spaced 10 second windows, concatenated
+        hook:30        the 30 second window with the most RMS energy
+    """
+
+    def __init__(self, strategy='full', seconds=None, n_windows=1):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown excerpt strategy: {strategy} (choose from {STRATEGIES})")
+        if strategy != 'full' and (seconds is None or seconds <= 0):
+            raise ValueError(f"Excerpt strategy '{strategy}' needs a positive length in seconds")
+        if n_windows < 1:
+            raise ValueError("n_windows must be at least 1")
+
+        self.strategy = strategy
+        self.seconds = seconds
+        self.n_windows = n_windows
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Parse 'full', 'first:15', 'spaced:3x10', 'hook:30' (or a policy, returned as is)"""
+        if isinstance(spec, ExcerptPolicy):
+            return spec
+        if spec is None:
+            return cls()
+
+        spec = EXCERPT_PRESETS.get(spec, spec).strip().lower()
+        strategy, _, arg = spec.partition(':')
+        try:
+            if strategy == 'full':
+                return cls()
+            if strategy == 'spaced':
+                n_windows, _, seconds = arg.partition('x')
+                return cls('spaced', float(seconds), int(n_windows))
+            return cls(strategy, float(arg))
+        except ValueError as e:
+            raise ValueError(f"Invalid excerpt spec '{spec}': {e}")
+
+    def __str__(self):
+        if self.strategy == 'full':
+            return 'full'
+        seconds = f"{self.seconds:g}"
+        if self.strategy == 'spaced':
+            return f"spaced:{self.n_windows}x{seconds}"
+        return f"{self.strategy}:{seconds}"
+
+    def __repr__(self):
+        return f"ExcerptPolicy('{self}')"
+
+    @property
+    def is_full(self):
+        return self.strategy == 'full'
+
+    def load(self, audio_path, sr=22050):
+        """Decode only what the policy needs where the format allows seeking"""
+        if self.strategy == 'full':
+            return librosa.load(audio_path, sr=sr)
+
+        if self.strategy == 'first':
+            return librosa.load(audio_path, sr=sr, duration=self.seconds)
+
+        if self.strategy == 'spaced':
+            total = librosa.get_duration(path=audio_path)
+            if total <= self.seconds * self.n_windows:
+                return librosa.load(audio_path, sr=sr)
+            windows = [
+                librosa.load(audio_path, sr=sr, offset=offset, duration=self.seconds)[0]
+                for offset in self._window_offsets(total)
+            ]
+            return np.concatenate(windows), sr
+
+        # hook: needs the energy curve of the whole track
+        y, sr = librosa.load(audio_path, sr=sr)
+        return self.apply(y, sr), sr
+
+    def apply(self, y, sr):
+        """Cut the excerpt out of an already decoded signal"""
+        if self.strategy == 'full':
+            return y
+
+        length = int(self.seconds * sr)
+        if len(y) <= length * self.n_windows:
+            return y
+
+        if self.strategy == 'first':
+            return y[:length]
+
+        if self.strategy == 'spaced':
+            total = len(y) / sr
+            starts = [int(offset * sr) for offset in self._window_offsets(total)]
+            return np.concatenate([y[start:start + length] for start in starts])
+
+        return y[self._hook_start(y, sr, length):][:length]
+
+    def _window_offsets(self, total_seconds):
+        """Start times of n_windows evenly spaced windows covering the track"""
+        if self.n_windows == 1:
+            return [(total_seconds - self.seconds) / 2]
+        return list(np.linspace(0, total_seconds - self.seconds, self.n_windows))
+
+    def _hook_start(self, y, sr, length, hop_length=512):
+        """Sample offset of the window with the highest summed RMS energy"""
+        rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
+        window_frames = max(1, length // hop_length)
+        if len(rms) <= window_frames:
+            return 0
+        energy = np.convolve(rms, np.ones(window_frames), mode='valid')
+        return int(np.argmax(energy)) * hop_length
@@ -0,0 +1,174 @@
+# extraction_profiler.py
+# Per-stage timing and peak-memory capture for the feature extractors
+
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+# Upper bounds (seconds) of the timing histogram buckets; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class StageProfiler:
+    """Records how long each extraction stage takes for one song.
+
+    Stages may nest (HPSS computes the STFT magnitude on first use, the
+    feature formulas pull in whatever intermediates they need), so each
+    stage is charged its *exclusive* time: nested stages are subtracted
+    from the enclosing one and the per-stage timings add up to the total.
+
+    With ``track_memory`` the peak traced allocation above the stage's
+    starting point is recorded too; unlike time, this is inclusive of any
+    nested stages. This uses tracemalloc, which numpy reports to, but
+    roughly doubles the cost of allocation-heavy code, so it is meant for
+    profiling runs rather than production.
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.timings = {}
+        self.peak_memory = {}
+        self._stack = []
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        tracing = self.track_memory and tracemalloc.is_tracing()
+        frame = {'child_seconds': 0.0, 'base': 0, 'peak': 0}
+
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent['peak'] = max(parent['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['base'] = frame['peak'] = current
+
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed - frame['child_seconds']
+            if self._stack:
+                self._stack[-1]['child_seconds'] += elapsed
+
+            if tracing:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                self.peak_memory[name] = max(self.peak_memory.get(name, 0), peak - frame['base'])
+                # The enclosing stage was running throughout, so it saw this peak too
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent['peak'] = max(parent['peak'], peak)
+
+    def report(self):
+        """Timings (seconds) and, if tracked, peak memory (MB) per stage"""
+        report = {'_timings': dict(self.timings)}
+        report['_timings']['total'] = sum(self.timings.values())
+        if self.track_memory:
+            report['_peak_memory_mb'] = {
+                name: peak / 1e6 for name, peak in self.peak_memory.items()
+            }
+        return report
+
+
+@contextmanager
+def _no_stage(name):
+    yield
+
+
+def profile_stage(profiler, name):
+    """profiler.stage(name), or a no-op when profiling is off"""
+    if profiler is None:
+        return _no_stage(name)
+    return profiler.stage(name)
+
+
+class StageHistograms:
+    """Cumulative per-stage timing histograms across many songs.
+
+    Bucket counts are kept Prometheus style (count of observations at or
+    below each upper bound) alongside count, sum and max, so memory use is
+    fixed no matter how many songs are observed. Safe to share between
+    threads.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {
+                    'counts': [0] * (len(self.buckets) + 1),
+                    'count': 0,
+                    'sum': 0.0,
+                    'max': 0.0
+                }
+            index = int(np.searchsorted(self.buckets, seconds, side='left'))
+            entry['counts'][index] += 1
+            entry['count'] += 1
+            entry['sum'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+
+    def observe_timings(self, timings):
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def _quantile(self, entry, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        rank = q * entry['count']
+        cumulative = 0
+        for bound, count in zip(self.buckets, entry['counts']):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, entry['max'])
+        return entry['max']
+
+    def snapshot(self):
+        """Per-stage dict with cumulative bucket counts and summary statistics"""
+        with self._lock:
+            stages = {name: dict(entry, counts=list(entry['counts']))
+                      for name, entry in self._stages.items()}
+
+        snapshot = {}
+        for name, entry in stages.items():
+            cumulative = np.cumsum(entry['counts']).tolist()
+            snapshot[name] = {
+                'count': entry['count'],
+                'sum': entry['sum'],
+                'mean': entry['sum'] / entry['count'],
+                'p50': self._quantile(entry, 0.5),
+                'p95': self._quantile(entry, 0.95),
+                'max': entry['max'],
+                'buckets': dict(zip([*map(str, self.buckets), '+Inf'], cumulative))
+            }
+        return snapshot
+
+
+# Process-wide histograms fed by every extractor created with profile=True
+STAGE_HISTOGRAMS = StageHistograms()
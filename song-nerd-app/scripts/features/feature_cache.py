@@ -0,0 +1,164 @@
+# feature_cache.py
+# Persistent, content-addressed cache of extracted audio features
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def audio_content_hash(y, sr):
+    """md5 of the decoded signal, so re-tagged or re-uploaded files share a key"""
+    digest = hashlib.md5(np.ascontiguousarray(y, dtype=np.float32).tobytes())
+    digest.update(str(int(sr)).encode())
+    return digest.hexdigest()
+
+
+def file_content_hash(path, extra='', chunk_size=1024 * 1024):
+    """md5 of a file's bytes (plus ``extra``), for keys that must not need a decode"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    digest.update(str(extra).encode())
+    return digest.hexdigest()
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FeatureCache:
+    """SQLite-backed feature cache with LRU eviction.
+
+    Entries are keyed by audio content hash plus extractor version, so a
+    formula change in an extractor never serves stale features. The cache is
+    bounded by ``max_entries`` and, optionally, by ``max_bytes`` of stored
+    JSON; the least recently read entries are evicted first. A fresh SQLite
+    connection is used per call so one instance is safe to share across
+    threads and worker processes.
+    """
+
+    def __init__(self, cache_dir='feature-cache', max_entries=10000, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(cache_dir, 'features.db')
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS features (
+                    cache_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_features_last_access '
+                         'ON features (last_access)')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def make_key(audio_hash, extractor_version):
+        return f"{extractor_version}:{audio_hash}"
+
+    def get(self, cache_key):
+        """Return cached features or None; a hit refreshes the entry's LRU position"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT payload FROM features WHERE cache_key = ?',
+                                   (cache_key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute('UPDATE features SET last_access = ? WHERE cache_key = ?',
+                             (time.time(), cache_key))
+            self.hits += 1
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"Feature cache read failed: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, cache_key, features):
+        payload = json.dumps(features, default=_json_default)
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO features
+                        (cache_key, payload, size_bytes, created_at, last_access)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (cache_key, payload, len(payload), now, now))
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Feature cache write failed: {e}")
+
+    def _evict(self, conn):
+        count, total_bytes = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM features').fetchone()
+
+        if self.max_entries is not None and count > self.max_entries:
+            conn.execute('''
+                DELETE FROM features WHERE cache_key IN (
+                    SELECT cache_key FROM features ORDER BY last_access ASC LIMIT ?
+                )
+            ''', (count - self.max_entries,))
+
+        if self.max_bytes is not None and total_bytes > self.max_bytes:
+            excess = total_bytes - self.max_bytes
+            freed = 0
+            stale_keys = []
+            for key, size in conn.execute(
+                    'SELECT cache_key, size_bytes FROM features ORDER BY last_access ASC'):
+                stale_keys.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany('DELETE FROM features WHERE cache_key = ?', stale_keys)
+
+    def get_or_compute(self, cache_key, compute):
+        features = self.get(cache_key)
+        if features is None:
+            features = compute()
+            if features is not None:
+                self.put(cache_key, features)
+        return features
+
+    def invalidate(self, cache_key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM features WHERE cache_key = ?', (cache_key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM features')
+
+    def stats(self):
+        with self._connect() as conn:
+            count, total_bytes = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM features').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'entries': count,
+            'size_bytes': total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,447 @@
+# feature_engine.py
+# Shared intermediates and the registry of feature formulas every extractor uses
+
+import base64
+
+import librosa
+import numpy as np
+
+from extraction_profiler import profile_stage
+from key_estimation import estimate_key
+
+# Bump whenever a registered formula or intermediate changes so cached
+# features (and the model inputs built from them) are recomputed
+FEATURE_ENGINE_VERSION = 'feature-engine-2.0'
+
+CHROMA_BACKENDS = ('cqt', 'stft', 'cens')
+
+AGGREGATIONS = ('frame', 'beat')
+
+# Frame-level intermediates that beat aggregation pools per beat. The
+# spectrogram and HPSS stay frame-level since other intermediates derive
+# from them.
+BEAT_SYNC_INTERMEDIATES = (
+    'rms', 'spectral_rms', 'harmonic_rms', 'zero_crossing_rate', 'tempogram', 'chroma',
+    'spectral_centroid', 'harmonic_spectral_centroid', 'spectral_bandwidth', 'spectral_flatness'
+)
+
+# Per-beat sequence stored for similarity search: one row per beat segment
+BEAT_SEQUENCE_COLUMNS = (
+    ('rms', 'spectral_centroid', 'spectral_bandwidth', 'spectral_flatness', 'zero_crossing_rate') +
+    tuple(f"chroma_{pitch}" for pitch in
+          ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'))
+)
+
+
+def compute_chroma(backend, y, sr, magnitude=None, hop_length=512):
+    """Chromagram with the selected backend.
+
+    'stft' folds an existing magnitude spectrogram (if given) into pitch
+    classes and is much cheaper than the constant-Q backends; 'cqt' is the
+    most accurate and 'cens' adds smoothing on top of the CQT.
+    """
+    if backend == 'cqt':
+        return librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=hop_length)
+    if backend == 'stft':
+        if magnitude is not None:
+            return librosa.feature.chroma_stft(S=magnitude ** 2, sr=sr)
+        return librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
+    if backend == 'cens':
+        return librosa.feature.chroma_cens(y=y, sr=sr, hop_length=hop_length)
+    raise ValueError(f"Unknown chroma backend: {backend} (choose from {CHROMA_BACKENDS})")
+
+
+class AudioAnalysisContext:
+    """Per-song cache of the spectral intermediates shared by every feature.
+
+    Each intermediate (STFT magnitude, HPSS split, onset envelope, chroma, ...)
+    is computed on first access and reused afterwards, so a song is only
+    transformed once no matter how many features read from it.
+
+    With ``aggregation='beat'`` the frame-level intermediates in
+    BEAT_SYNC_INTERMEDIATES are averaged per beat as soon as they are
+    computed and only the pooled arrays are kept, so features reduce over
+    a few hundred beats rather than every STFT frame.
+    """
+
+    def __init__(self, y, sr, n_fft=2048, hop_length=512, chroma_backend='cqt', profiler=None,
+                 aggregation='frame'):
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation: {aggregation} (choose from {AGGREGATIONS})")
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.chroma_backend = chroma_backend
+        self.aggregation = aggregation
+        # Optional StageProfiler; each intermediate is timed as its own stage
+        self.profiler = profiler
+        self._cache = {}
+
+    def _get(self, name, compute):
+        if name not in self._cache:
+            with profile_stage(self.profiler, name):
+                value = compute()
+                if self.aggregation == 'beat' and name in BEAT_SYNC_INTERMEDIATES:
+                    value = self._beat_sync(value)
+                self._cache[name] = value
+        return self._cache[name]
+
+    def _beat_sync(self, frames):
+        """Mean of each beat segment, including the ones before the first and after the last beat"""
+        return librosa.util.sync(frames, self.beats[1], aggregate=np.mean, pad=True)
+
+    def beat_synced(self, name):
+        """Intermediate ``name`` pooled per beat, whatever the aggregation mode"""
+        value = getattr(self, name)
+        return value if self.aggregation == 'beat' else self._beat_sync(value)
+
+    @property
+    def beat_segment_starts(self):
+        """Start time (s) of each segment returned by beat pooling"""
+        beats = librosa.util.fix_frames(self.beats[1], x_min=0)
+        return librosa.frames_to_time(beats, sr=self.sr, hop_length=self.hop_length)
+
+    @property
+    def magnitude(self):
+        """|STFT| of the full signal"""
+        return self._get('magnitude', lambda: np.abs(
+            librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length)))
+
+    @property
+    def hpss(self):
+        """Harmonic/percussive split of the magnitude spectrogram"""
+        # Median-filter masks on the magnitude are what librosa.effects.hpss
+        # does internally; skipping the istft avoids two extra transforms
+        return self._get('hpss', lambda: librosa.decompose.hpss(self.magnitude))
+
+    @property
+    def harmonic(self):
+        return self.hpss[0]
+
+    @property
+    def percussive(self):
+        return self.hpss[1]
+
+    @property
+    def rms(self):
+        # Time-domain framing is cheap and keeps the loudness/energy scale
+        return self._get('rms', lambda: librosa.feature.rms(
+            y=self.y, frame_length=self.n_fft, hop_length=self.hop_length)[0])
+
+    @property
+    def spectral_rms(self):
+        return self._get('spectral_rms', lambda: librosa.feature.rms(
+            S=self.magnitude, frame_length=self.n_fft)[0])
+
+    @property
+    def harmonic_rms(self):
+        return self._get('harmonic_rms', lambda: librosa.feature.rms(
+            S=self.harmonic, frame_length=self.n_fft)[0])
+
+    @property
+    def zero_crossing_rate(self):
+        return self._get('zero_crossing_rate', lambda: librosa.feature.zero_crossing_rate(
+            self.y, frame_length=self.n_fft, hop_length=self.hop_length)[0])
+
+    @property
+    def onset_envelope(self):
+        def compute():
+            mel = librosa.feature.melspectrogram(S=self.magnitude ** 2, sr=self.sr)
+            return librosa.onset.onset_strength(
+                S=librosa.power_to_db(mel), sr=self.sr, hop_length=self.hop_length)
+        return self._get('onset_envelope', compute)
+
+    @property
+    def beats(self):
+        """(tempo, beat frame indices) from the shared onset envelope"""
+        def compute():
+            tempo, beats = librosa.beat.beat_track(
+                onset_envelope=self.onset_envelope, sr=self.sr, hop_length=self.hop_length)
+            return float(np.atleast_1d(tempo)[0]), beats
+        return self._get('beats', compute)
+
+    @property
+    def tempogram(self):
+        return self._get('tempogram', lambda: librosa.feature.tempogram(
+            onset_envelope=self.onset_envelope, sr=self.sr, hop_length=self.hop_length))
+
+    @property
+    def chroma(self):
+        # The stft backend reuses the shared magnitude spectrogram
+        return self._get('chroma', lambda: compute_chroma(
+            self.chroma_backend, self.y, self.sr,
+            magnitude=self.magnitude if self.chroma_backend == 'stft' else None,
+            hop_length=self.hop_length))
+
+    @property
+    def spectral_centroid(self):
+        return self._get('spectral_centroid', lambda: librosa.feature.spectral_centroid(
+            S=self.magnitude, sr=self.sr)[0])
+
+    @property
+    def harmonic_spectral_centroid(self):
+        return self._get('harmonic_spectral_centroid', lambda: librosa.feature.spectral_centroid(
+            S=self.harmonic, sr=self.sr)[0])
+
+    @property
+    def spectral_bandwidth(self):
+        return self._get('spectral_bandwidth', lambda: librosa.feature.spectral_bandwidth(
+            S=self.magnitude, sr=self.sr)[0])
+
+    @property
+    def spectral_flatness(self):
+        return self._get('spectral_flatness', lambda: librosa.feature.spectral_flatness(
+            S=self.magnitude)[0])
+
+
+# Intermediates on AudioAnalysisContext and the intermediates each one is
+# derived from. chroma only reads the magnitude for the stft backend and
+# pulls it in lazily when it does.
+INTERMEDIATES = {
+    'magnitude': (),
+    'hpss': ('magnitude',),
+    'rms': (),
+    'spectral_rms': ('magnitude',),
+    'harmonic_rms': ('hpss',),
+    'zero_crossing_rate': (),
+    'onset_envelope': ('magnitude',),
+    'beats': ('onset_envelope',),
+    'tempogram': ('onset_envelope',),
+    'chroma': (),
+    'spectral_centroid': ('magnitude',),
+    'harmonic_spectral_centroid': ('hpss',),
+    'spectral_bandwidth': ('magnitude',),
+    'spectral_flatness': ('magnitude',)
+}
+
+
+class FeatureDefinition:
+    def __init__(self, outputs, requires, compute):
+        self.outputs = tuple(outputs)
+        self.requires = tuple(requires)
+        self.compute = compute
+
+    def __repr__(self):
+        return f"FeatureDefinition({', '.join(self.outputs)} <- {', '.join(self.requires) or '-'})"
+
+
+class FeatureRegistry:
+    """Feature formulas keyed by output name, with their declared intermediates.
+
+    A formula is registered for one or more outputs that are always
+    computed together (key, mode and key confidence come from one
+    correlation) and declares which context intermediates it reads. The
+    registry can then tell which intermediates a subset of features needs
+    and compute exactly those, so asking for ``['tempo']`` never runs HPSS
+    or chroma.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self._definitions = []
+        self._by_output = {}
+
+    def register(self, *outputs, requires=()):
+        unknown = [name for name in requires if name not in INTERMEDIATES]
+        if unknown:
+            raise ValueError(f"Unknown intermediates for {outputs}: {unknown}")
+
+        def decorator(func):
+            definition = FeatureDefinition(outputs, requires, func)
+            for output in outputs:
+                if output in self._by_output:
+                    raise ValueError(f"Feature already registered: {output}")
+                self._by_output[output] = definition
+            self._definitions.append(definition)
+            return func
+        return decorator
+
+    @property
+    def outputs(self):
+        return [output for definition in self._definitions for output in definition.outputs]
+
+    def validate(self, names):
+        """None (all features) or the requested names, checked against the registry"""
+        if names is None:
+            return None
+        unknown = [name for name in names if name not in self._by_output]
+        if unknown:
+            raise ValueError(f"Unknown features: {unknown} (available: {self.outputs})")
+        return tuple(names)
+
+    def resolve(self, names=None):
+        """Definitions needed for ``names``, in registration order"""
+        if names is None:
+            return list(self._definitions)
+        needed = {id(self._by_output[name]) for name in self.validate(names)}
+        return [d for d in self._definitions if id(d) in needed]
+
+    def plan(self, names=None):
+        """Intermediates needed for ``names``, each listed after its inputs"""
+        order = []
+
+        def visit(name):
+            if name in order:
+                return
+            for dependency in INTERMEDIATES[name]:
+                visit(dependency)
+            order.append(name)
+
+        for definition in self.resolve(names):
+            for name in definition.requires:
+                visit(name)
+        return order
+
+    def compute(self, ctx, names=None):
+        """Compute ``names`` (default: every feature) from an AudioAnalysisContext"""
+        definitions = self.resolve(names)
+
+        # Warm intermediates in dependency order so each is timed on its own
+        for name in self.plan(names):
+            getattr(ctx, name)
+
+        features = {}
+        for definition in definitions:
+            features.update(definition.compute(ctx))
+
+        if names is not None:
+            features = {name: features[name] for name in names}
+        return features
+
+
+FEATURES = FeatureRegistry(FEATURE_ENGINE_VERSION)
+
+
+def beat_sequence(ctx):
+    """(segment start times, float16 matrix of BEAT_SEQUENCE_COLUMNS per beat segment)"""
+    chroma = ctx.beat_synced('chroma')
+    chroma = chroma / (chroma.max(axis=0, keepdims=True) + 1e-8)
+    matrix = np.vstack([ctx.beat_synced(name) for name in BEAT_SEQUENCE_COLUMNS[:5]] + [chroma])
+    return ctx.beat_segment_starts, matrix.T.astype(np.float16)
+
+
+def encode_beat_sequence(starts, matrix):
+    """JSON-friendly form of a beat sequence: float16 values as base64"""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float16)
+    return {
+        'columns': list(BEAT_SEQUENCE_COLUMNS),
+        'segment_starts': [round(float(t), 3) for t in starts],
+        'dtype': 'float16',
+        'shape': list(matrix.shape),
+        'data': base64.b64encode(matrix.tobytes()).decode('ascii')
+    }
+
+
+def decode_beat_sequence(encoded):
+    """Inverse of encode_beat_sequence: (columns, segment starts, float16 matrix)"""
+    matrix = np.frombuffer(base64.b64decode(encoded['data']), dtype=encoded['dtype'])
+    return (encoded['columns'], np.asarray(encoded['segment_starts']),
+            matrix.reshape(encoded['shape']))
+
+# Named subsets callers can ask for instead of listing features
+FEATURE_SETS = {
+    'all': None,
+    'model': ('danceability', 'energy', 'valence', 'acousticness', 'instrumentalness',
+              'liveness', 'speechiness', 'audio_appeal', 'tempo'),
+    'rhythm': ('tempo', 'danceability'),
+    'tonal': ('key', 'mode', 'key_confidence')
+}
+
+
+def resolve_feature_names(features):
+    """None, a set name from FEATURE_SETS, 'a,b,c' or a list of names -> tuple or None"""
+    if features is None:
+        return None
+    if isinstance(features, str):
+        if features in FEATURE_SETS:
+            return FEATURE_SETS[features]
+        features = [name.strip() for name in features.split(',') if name.strip()]
+    return tuple(features)
+
+
+@FEATURES.register('duration')
+def _duration(ctx):
+    return {'duration': len(ctx.y) / ctx.sr}
+
+
+@FEATURES.register('loudness', requires=('rms',))
+def _loudness(ctx):
+    # RMS (loudness proxy) on a dB-like scale
+    return {'loudness': -60 + 60 * np.mean(ctx.rms)}
+
+
+@FEATURES.register('zero_crossing_rate', requires=('zero_crossing_rate',))
+def _zero_crossing_rate(ctx):
+    return {'zero_crossing_rate': np.mean(ctx.zero_crossing_rate)}
+
+
+@FEATURES.register('tempo', requires=('beats',))
+def _tempo(ctx):
+    return {'tempo': ctx.beats[0]}
+
+
+@FEATURES.register('key', 'mode', 'key_confidence', requires=('chroma',))
+def _key(ctx):
+    # Key and mode (major=1, minor=0) against all 24 Krumhansl profiles
+    key, mode, key_confidence = estimate_key(ctx.chroma)
+    return {'key': key, 'mode': mode, 'key_confidence': key_confidence}
+
+
+@FEATURES.register('time_signature')
+def _time_signature(ctx):
+    return {'time_signature': 4}  # Default to 4/4
+
+
+@FEATURES.register('danceability', requires=('tempogram',))
+def _danceability(ctx):
+    # Beat strength and regularity
+    return {'danceability': min(1.0, np.mean(ctx.tempogram) * 2)}
+
+
+@FEATURES.register('energy', requires=('rms',))
+def _energy(ctx):
+    return {'energy': min(1.0, np.mean(ctx.rms) * 10)}
+
+
+@FEATURES.register('valence', requires=('spectral_centroid',))
+def _valence(ctx):
+    # Positivity, approximated by normalised brightness
+    brightness = np.mean(ctx.spectral_centroid) / (ctx.sr / 2)
+    return {'valence': min(1.0, max(0.0, brightness + 0.3))}
+
+
+@FEATURES.register('acousticness', requires=('spectral_bandwidth',))
+def _acousticness(ctx):
+    # Inverse of spectral energy in higher frequencies
+    return {'acousticness': max(0.0, min(1.0, 1 - np.mean(ctx.spectral_bandwidth) / 4000))}
+
+
+@FEATURES.register('instrumentalness', requires=('harmonic_spectral_centroid',))
+def _instrumentalness(ctx):
+    # Harmonic content in the vocal range suggests vocals
+    vocal_likelihood = np.mean(ctx.harmonic_spectral_centroid)
+    return {'instrumentalness': max(0.0, min(1.0, 1 - vocal_likelihood / 3000))}
+
+
+@FEATURES.register('liveness', requires=('spectral_flatness',))
+def _liveness(ctx):
+    return {'liveness': min(1.0, np.mean(ctx.spectral_flatness) * 10)}
+
+
+@FEATURES.register('speechiness', requires=('zero_crossing_rate',))
+def _speechiness(ctx):
+    return {'speechiness': min(1.0, np.mean(ctx.zero_crossing_rate) * 5)}
+
+
+@FEATURES.register('audio_appeal', requires=('rms', 'magnitude', 'harmonic_rms', 'spectral_rms'))
+def _audio_appeal(ctx):
+    # Composite quality score (0-100) from dynamic range, frequency balance
+    # and clarity
+    rms = ctx.rms
+    dynamic_range = np.max(rms) - np.min(rms)
+    magnitude = ctx.magnitude
+    freq_balance = 1 - np.std(np.mean(magnitude, axis=1)) / np.mean(magnitude)
+    clarity = np.mean(ctx.harmonic_rms) / (np.mean(ctx.spectral_rms) + 1e-8)
+    return {'audio_appeal': min(100, max(0,
+        (dynamic_range * 30 + freq_balance * 40 + clarity * 30)))}
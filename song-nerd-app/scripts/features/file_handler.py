@@ -5,10 +5,13 @@ import tempfile
 from pathlib import Path
 import magic  # python-magic for file type detection
 from pydub import AudioSegment
+import librosa
+import numpy as np
 import hashlib
 
 class AudioFileHandler:
-    def __init__(self, max_file_size_mb=50, supported_formats=None):
+    def __init__(self, max_file_size_mb=50, supported_formats=None,
+                 min_duration_seconds=5, max_duration_seconds=600):
         self.max_file_size = max_file_size_mb * 1024 * 1024  # Convert to bytes
         self.supported_formats = supported_formats or [
             'audio/mpeg',      # MP3
@@ -19,16 +22,18 @@ class AudioFileHandler:
             'audio/flac',      # FLAC
             'audio/ogg'        # OGG
         ]
+        self.min_duration = min_duration_seconds
+        self.max_duration = max_duration_seconds
         self.temp_dir = tempfile.mkdtemp(prefix='audio_processing_')
     
-    def validate_file(self, file_path):
-        """Validate uploaded audio file"""
+    def _check_container(self, file_path):
+        """Checks that need no decoding: existence, size and file type"""
         errors = []
         
         # Check if file exists
         if not os.path.exists(file_path):
             errors.append("File does not exist")
-            return False, errors
+            return errors
         
         # Check file size
         file_size = os.path.getsize(file_path)
@@ -43,22 +48,73 @@ class AudioFileHandler:
         except Exception as e:
             errors.append(f"Could not determine file type: {e}")
         
+        return errors
+    
+    def _check_duration(self, duration_seconds, truncated=False):
+        """Duration limits (5 seconds minimum, 10 minutes maximum by default)"""
+        if duration_seconds < self.min_duration:
+            return [f"Track too short: {duration_seconds:.1f}s (minimum: {self.min_duration}s)"]
+        if truncated or duration_seconds > self.max_duration:
+            shown = f">{self.max_duration/60:g}" if truncated else f"{duration_seconds/60:.1f}"
+            return [f"Track too long: {shown}min (maximum: {self.max_duration/60:g}min)"]
+        return []
+    
+    def validate_file(self, file_path):
+        """Validate uploaded audio file"""
+        errors = self._check_container(file_path)
+        if not os.path.exists(file_path):
+            return False, errors
+        
         # Try to load as audio
         try:
             audio = AudioSegment.from_file(file_path)
-            
-            # Check duration (5 seconds minimum, 10 minutes maximum)
-            duration_seconds = len(audio) / 1000
-            if duration_seconds < 5:
-                errors.append(f"Track too short: {duration_seconds:.1f}s (minimum: 5s)")
-            elif duration_seconds > 600:  # 10 minutes
-                errors.append(f"Track too long: {duration_seconds/60:.1f}min (maximum: 10min)")
-            
+            errors.extend(self._check_duration(len(audio) / 1000))
         except Exception as e:
             errors.append(f"Invalid audio file: {e}")
         
         return len(errors) == 0, errors
     
+    def load_validated(self, file_path, sample_rate=22050):
+        """Validate and decode once to a mono float32 buffer.
+        
+        Returns (y, errors); y is None when validation fails. Cheap checks run
+        before decoding, and decoding stops just past the maximum duration so
+        an over-long upload is never decoded in full.
+        """
+        errors = self._check_container(file_path)
+        if errors:
+            return None, errors
+        
+        try:
+            y, _ = librosa.load(file_path, sr=sample_rate, mono=True, dtype=np.float32,
+                                duration=self.max_duration + 1)
+        except Exception as e:
+            return None, [f"Invalid audio file: {e}"]
+        
+        duration_seconds = len(y) / sample_rate
+        errors = self._check_duration(duration_seconds,
+                                      truncated=duration_seconds > self.max_duration)
+        if errors:
+            return None, errors
+        
+        return y, []
+    
+    def describe_audio(self, file_path, y, sr):
+        """File info for a decoded buffer (same keys as convert_to_standard_format)"""
+        file_hash = hashlib.md5()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(block)
+        
+        return {
+            'original_format': Path(file_path).suffix,
+            'duration_seconds': len(y) / sr,
+            'sample_rate': sr,
+            'channels': 1,
+            'file_size_mb': os.path.getsize(file_path) / (1024*1024),
+            'file_hash': file_hash.hexdigest()
+        }
+    
     def convert_to_standard_format(self, input_path, output_format='wav'):
         """Convert audio file to standard format for processing"""
         try:
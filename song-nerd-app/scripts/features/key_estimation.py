@@ -0,0 +1,77 @@
+# key_estimation.py
+# Krumhansl-Schmuckler key finding against all 24 major/minor keys
+
+import numpy as np
+
+# Krumhansl-Kessler probe-tone profiles, tonic first
+KRUMHANSL_MAJOR = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+KRUMHANSL_MINOR = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+PITCH_CLASSES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+
+def _build_key_profiles():
+    """(24, 12) matrix: rows 0-11 are C..B major, rows 12-23 are C..B minor.
+
+    Rows are mean-centred and unit-norm, so a dot product with a centred,
+    unit-norm chroma vector is exactly the Pearson correlation.
+    """
+    profiles = np.vstack(
+        [np.roll(KRUMHANSL_MAJOR, tonic) for tonic in range(12)] +
+        [np.roll(KRUMHANSL_MINOR, tonic) for tonic in range(12)]
+    )
+    profiles = profiles - profiles.mean(axis=1, keepdims=True)
+    return profiles / np.linalg.norm(profiles, axis=1, keepdims=True)
+
+
+KEY_PROFILES = _build_key_profiles()
+
+
+def key_correlations(chroma):
+    """Correlate chroma against every key in one matrix product.
+
+    ``chroma`` is a 12-vector or a (12, n_windows) array; the result is
+    (24,) or (n_windows, 24) Pearson correlations.
+    """
+    chroma = np.asarray(chroma, dtype=float)
+    vectors = chroma.T if chroma.ndim == 2 else chroma
+    centred = vectors - vectors.mean(axis=-1, keepdims=True)
+    norms = np.linalg.norm(centred, axis=-1, keepdims=True)
+    # Silent windows have a flat chroma and correlate with nothing
+    centred = np.divide(centred, norms, out=np.zeros_like(centred), where=norms > 1e-12)
+    return centred @ KEY_PROFILES.T
+
+
+def estimate_key_windows(chroma):
+    """Vectorised key estimate for (12, n_windows) chroma.
+
+    Returns (keys, modes, confidences) arrays of length n_windows, with
+    key as pitch class 0-11, mode 1 for major / 0 for minor and confidence
+    the winning correlation clipped to [0, 1].
+    """
+    chroma = np.asarray(chroma, dtype=float)
+    if chroma.ndim == 1:
+        chroma = chroma[:, np.newaxis]
+    correlations = key_correlations(chroma)
+    best = np.argmax(correlations, axis=1)
+    keys = best % 12
+    modes = (best < 12).astype(int)
+    confidences = np.clip(correlations[np.arange(len(best)), best], 0.0, 1.0)
+    return keys, modes, confidences
+
+
+def estimate_key(chroma):
+    """Key, mode and confidence for a whole track.
+
+    ``chroma`` may be a 12-vector (already averaged) or a (12, n_frames)
+    chromagram, which is averaged over time first.
+    """
+    chroma = np.asarray(chroma, dtype=float)
+    if chroma.ndim == 2:
+        chroma = chroma.mean(axis=1)
+    keys, modes, confidences = estimate_key_windows(chroma)
+    return int(keys[0]), int(modes[0]), float(confidences[0])
+
+
+def key_name(key, mode):
+    return f"{PITCH_CLASSES[key]} {'major' if mode == 1 else 'minor'}"
@@ -0,0 +1,127 @@
+# profile_extraction.py
+# Profile feature extraction over a folder of tracks and break the time down by stage
+
+import json
+import logging
+
+import pandas as pd
+
+from audio_processor import AudioFeatureExtractor, PreviewFeatureExtractor, CHROMA_BACKENDS
+from batch_feature_extraction import discover_audio_files
+from extraction_profiler import StageHistograms
+
+logger = logging.getLogger(__name__)
+
+
+def profile_files(audio_paths, extractor):
+    """Run the extractor on each file; one row of stage timings per file"""
+    timing_rows = []
+    memory_rows = []
+
+    for i, path in enumerate(audio_paths, 1):
+        try:
+            features = extractor.extract_features(path)
+        except Exception as e:
+            logger.warning(f"Skipping {path}: {e}")
+            continue
+
+        timing_rows.append({'file_path': path, 'duration': features.get('duration'),
+                            **features['_timings']})
+        if '_peak_memory_mb' in features:
+            memory_rows.append({'file_path': path, **features['_peak_memory_mb']})
+
+        if i % 10 == 0:
+            logger.info(f"Profiled {i}/{len(audio_paths)} files")
+
+    return pd.DataFrame(timing_rows), pd.DataFrame(memory_rows)
+
+
+def stage_breakdown(timings, memory=None):
+    """Per-stage mean/p50/p95/total seconds and share of the total time"""
+    stages = [c for c in timings.columns if c not in ('file_path', 'duration', 'total')]
+    grand_total = timings['total'].sum()
+    rows = []
+
+    for stage in stages:
+        seconds = timings[stage].dropna()
+        row = {
+            'stage': stage,
+            'files': len(seconds),
+            'mean_s': seconds.mean(),
+            'p50_s': seconds.quantile(0.5),
+            'p95_s': seconds.quantile(0.95),
+            'total_s': seconds.sum(),
+            'share': seconds.sum() / grand_total if grand_total else 0.0
+        }
+        if memory is not None and stage in memory.columns:
+            row['mean_peak_mb'] = memory[stage].mean()
+            row['max_peak_mb'] = memory[stage].max()
+        rows.append(row)
+
+    return pd.DataFrame(rows).sort_values('total_s', ascending=False)
+
+
+def run_profile(source, limit=None, excerpt='full', chroma_backend='cqt', streaming=False,
+                memory=False, preview=False):
+    audio_paths = discover_audio_files(source)
+    if limit:
+        audio_paths = audio_paths[:limit]
+    if not audio_paths:
+        raise ValueError(f"No audio files found in {source}")
+
+    histograms = StageHistograms()
+    if preview:
+        extractor = PreviewFeatureExtractor(excerpt=excerpt if excerpt != 'full' else 'preview',
+                                            profile=True, profile_memory=memory,
+                                            histograms=histograms)
+    else:
+        extractor = AudioFeatureExtractor(streaming=streaming, excerpt=excerpt,
+                                          chroma_backend=chroma_backend, profile=True,
+                                          profile_memory=memory, histograms=histograms)
+
+    logger.info(f"Profiling {extractor.version} on {len(audio_paths)} files")
+    timings, peak_memory = profile_files(audio_paths, extractor)
+    if timings.empty:
+        raise ValueError("No files could be profiled")
+
+    breakdown = stage_breakdown(timings, peak_memory if memory else None)
+    return timings, breakdown, histograms.snapshot()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Feature Extraction Profiler')
+    parser.add_argument('source', help='Directory of audio files or manifest (.csv/.txt)')
+    parser.add_argument('--limit', type=int, help='Only profile the first N files')
+    parser.add_argument('--excerpt', default='full', help='Excerpt policy, e.g. first:30')
+    parser.add_argument('--chroma-backend', default='cqt', choices=list(CHROMA_BACKENDS),
+                        help='Chroma backend used for key/mode estimation')
+    parser.add_argument('--streaming', action='store_true', help='Profile the streaming path')
+    parser.add_argument('--preview', action='store_true', help='Profile the preview extractor')
+    parser.add_argument('--memory', action='store_true',
+                        help='Also record peak memory per stage (slower)')
+    parser.add_argument('--output', help='Write per-file timings (.csv) and histograms (.json)')
+    args = parser.parse_args()
+
+    timings, breakdown, histograms = run_profile(
+        args.source, limit=args.limit, excerpt=args.excerpt,
+        chroma_backend=args.chroma_backend, streaming=args.streaming,
+        memory=args.memory, preview=args.preview
+    )
+
+    audio_minutes = timings['duration'].sum() / 60
+    print("\nFeature Extraction Profile")
+    print("=" * 60)
+    print(f"Files: {len(timings)}  Audio: {audio_minutes:.1f} min  "
+          f"Total: {timings['total'].sum():.2f}s  "
+          f"({timings['total'].sum() / max(audio_minutes, 1e-9):.2f}s per audio minute)")
+    print(breakdown.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    if args.output:
+        timings.to_csv(f"{args.output}.csv", index=False)
+        with open(f"{args.output}.json", 'w') as f:
+            json.dump(histograms, f, indent=2)
+        print(f"\nProfile saved to: {args.output}.csv / {args.output}.json")
@@ -12,6 +12,8 @@ class SimilarArtistFinder:
         self.artist_profiles = None
         self.scaler = StandardScaler()
         self.pca = PCA(n_components=0.95)
+        self._artist_vectors = None
+        self._artist_records = None
         
     def build_artist_database(self, master_data):
         """Build artist profile database from your master dataset"""
@@ -52,6 +54,8 @@ class SimilarArtistFinder:
         # Store processed data
         self.artist_profiles = artist_profiles.copy()
         self.artist_profiles['feature_vector'] = list(pca_features)
+        self._artist_vectors = None
+        self._artist_records = None
         
         print(f"Built artist database with {len(self.artist_profiles)} artists")
         print(f"Feature dimensions after PCA: {pca_features.shape[1]}")
@@ -60,27 +64,41 @@ class SimilarArtistFinder:
     
     def find_similar_artists(self, input_features, top_k=10, same_tier_only=False, exclude_self=True):
         """Find similar artists based on audio features"""
+        return self.find_similar_artists_batch(
+            [input_features], top_k=top_k, same_tier_only=same_tier_only, exclude_self=exclude_self
+        )[0]
+    
+    def find_similar_artists_batch(self, inputs, top_k=10, same_tier_only=False, exclude_self=True):
+        """find_similar_artists for many songs, with one similarity matrix for all of them"""
         
         # Prepare input features
         audio_feature_names = ['danceability', 'energy', 'valence', 'acousticness', 
                               'instrumentalness', 'liveness', 'speechiness']
         
-        input_vector = np.array([[
-            input_features.get(feature, 0) 
-            for feature in audio_feature_names
-        ]])
+        input_vectors = np.array([
+            [input_features.get(feature, 0) for feature in audio_feature_names]
+            for input_features in inputs
+        ])
         
         # Scale and transform input
-        input_scaled = self.scaler.transform(input_vector)
+        input_scaled = self.scaler.transform(input_vectors)
         input_pca = self.pca.transform(input_scaled)
         
         # Calculate similarities
-        artist_vectors = np.vstack(self.artist_profiles['feature_vector'].values)
-        similarities = cosine_similarity(input_pca, artist_vectors)[0]
+        similarities = cosine_similarity(input_pca, self.artist_vectors())
         
-        # Add similarity scores to dataframe
-        results = self.artist_profiles.copy()
-        results['similarity_score'] = similarities
+        return [
+            self._top_similar(input_features, row, audio_feature_names, top_k, same_tier_only, exclude_self)
+            for input_features, row in zip(inputs, similarities)
+        ]
+    
+    def _top_similar(self, input_features, similarities, audio_feature_names, top_k,
+                     same_tier_only, exclude_self):
+        """Filter, rank and format the artists for one song"""
+        # Filters are applied as a row mask and the top k artists are read
+        # from prebuilt records, rather than copying the artist table per call
+        profiles = self.artist_profiles
+        keep = np.ones(len(profiles), dtype=bool)
         
         # Filter by popularity tier if requested
         if same_tier_only and 'normalized_popularity' in input_features:
@@ -97,23 +115,26 @@ class SimilarArtistFinder:
                 target_tier = 'superstar'
             
             # Filter to same tier
-            if 'popularity_tier' in results.columns:
-                results = results[results['popularity_tier'] == target_tier]
+            if 'popularity_tier' in profiles.columns:
+                keep &= (profiles['popularity_tier'] == target_tier).to_numpy()
         
         # Exclude self if artist name provided
         if exclude_self and 'artist_name' in input_features:
             input_artist = input_features['artist_name']
-            results = results[results['artist_name_clean'] != input_artist]
+            keep &= (profiles['artist_name_clean'] != input_artist).to_numpy()
         
-        # Sort by similarity and return top k
-        top_similar = results.nlargest(top_k, 'similarity_score')
+        # Sort by similarity and return top k (ties keep table order, as nlargest does)
+        candidates = np.flatnonzero(keep)
+        order = np.argsort(-similarities[candidates], kind='stable')[:top_k]
+        records = self.artist_records()
         
         # Format results
         similar_artists = []
-        for _, artist in top_similar.iterrows():
+        for index in candidates[order]:
+            artist = records[index]
             similar_artists.append({
                 'artist_name': artist['artist_name_clean'],
-                'similarity_score': float(artist['similarity_score']),
+                'similarity_score': float(similarities[index]),
                 'genre': artist['genre_clean'],
                 'genre_category': artist['genre_category'],
                 'popularity': float(artist['normalized_popularity']),
@@ -226,7 +247,21 @@ class SimilarArtistFinder:
         self.artist_profiles = model_data['artist_profiles']
         self.scaler = model_data['scaler']
         self.pca = model_data['pca']
+        self._artist_vectors = None
+        self._artist_records = None
         return self
+    
+    def artist_vectors(self):
+        """PCA vectors of all artists as one matrix, built once"""
+        if self._artist_vectors is None:
+            self._artist_vectors = np.vstack(self.artist_profiles['feature_vector'].values)
+        return self._artist_vectors
+    
+    def artist_records(self):
+        """Artist profiles as a list of dicts (same order as artist_vectors), built once"""
+        if self._artist_records is None:
+            self._artist_records = self.artist_profiles.drop(columns='feature_vector').to_dict('records')
+        return self._artist_records
 
 # Build and save similar artists database
 def build_similar_artists_database():
@@ -0,0 +1,10 @@
+-- preview_features.sql
+-- Lets the analysis table hold the preview-quality row that
+-- api_supabase upload_song stores with ?preview=true. Run once in the
+-- Supabase SQL editor before deploying.
+--
+-- feature_quality is 'preview' until the song's full analysis overwrites
+-- the row (analysis is keyed on song_id) with 'full'. Rows written before
+-- this column existed are full analyses.
+
+alter table analysis add column if not exists feature_quality text not null default 'full';
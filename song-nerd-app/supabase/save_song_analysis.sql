@@ -0,0 +1,60 @@
+-- save_song_analysis.sql
+-- Writes a song's analysis, marketing insights and status in one call and
+-- one transaction (used by song_store.SupabaseSongStore). Run once in the
+-- Supabase SQL editor.
+--
+-- Rows are keyed on song_id so a retried analysis job overwrites its
+-- previous result instead of adding a second row.
+
+create unique index if not exists analysis_song_id_key on analysis (song_id);
+create unique index if not exists marketing_insights_song_id_key on marketing_insights (song_id);
+
+-- Upsert one row given as jsonb; only the keys present are written, so
+-- column defaults (id, created_at) still apply on insert
+create or replace function upsert_by_song_id(p_table regclass, p_row jsonb)
+returns void
+language plpgsql
+as $$
+declare
+    cols text;
+    updates text;
+begin
+    select string_agg(quote_ident(key), ', '),
+           string_agg(format('%1$I = excluded.%1$I', key), ', ')
+      into cols, updates
+      from jsonb_object_keys(p_row) as key;
+
+    execute format(
+        'insert into %1$s (%2$s) select %2$s from jsonb_populate_record(null::%1$s, $1) '
+        'on conflict (song_id) do update set %3$s',
+        p_table, cols, updates
+    ) using p_row;
+end;
+$$;
+
+create or replace function save_song_analysis(
+    p_song_id uuid,
+    p_analysis jsonb,
+    p_insights jsonb default null,
+    p_song jsonb default '{}'::jsonb
+)
+returns void
+language plpgsql
+as $$
+begin
+    perform upsert_by_song_id('analysis',
+                              p_analysis || jsonb_build_object('song_id', p_song_id));
+
+    if p_insights is not null then
+        perform upsert_by_song_id('marketing_insights',
+                                  p_insights || jsonb_build_object('song_id', p_song_id));
+    end if;
+
+    if p_song is not null and p_song <> '{}'::jsonb then
+        update songs
+           set processing_status = coalesce(p_song->>'processing_status', processing_status),
+               duration = coalesce((p_song->>'duration')::double precision, duration)
+         where id = p_song_id;
+    end if;
+end;
+$$;
@@ -0,0 +1,16 @@
+-- songs_list_indexes.sql
+-- Indexes behind GET /api/songs: keyset pages ordered by
+-- (upload_timestamp, id) newest first, optionally filtered by status,
+-- artist or genre. Run once in the Supabase SQL editor.
+
+create index if not exists songs_upload_timestamp_id_idx
+    on songs (upload_timestamp desc, id desc);
+
+create index if not exists songs_status_upload_timestamp_id_idx
+    on songs (processing_status, upload_timestamp desc, id desc);
+
+create index if not exists songs_artist_upload_timestamp_id_idx
+    on songs (artist_name, upload_timestamp desc, id desc);
+
+create index if not exists songs_genre_upload_timestamp_id_idx
+    on songs (genre, upload_timestamp desc, id desc);
@@ -0,0 +1,55 @@
+-- upload_dedup.sql
+-- Lets an upload reuse the analysis of identical audio (api_supabase
+-- upload_song). Run once in the Supabase SQL editor before deploying,
+-- after save_song_analysis.sql.
+--
+-- content_hash is the SHA-256 of the uploaded bytes; analysis_version
+-- identifies the models, extractor and excerpt that produced a song's
+-- analysis, so results are only reused while those are unchanged.
+
+alter table songs add column if not exists content_hash text;
+alter table songs add column if not exists analysis_version text;
+
+create index if not exists songs_completed_content_hash_idx
+    on songs (content_hash, analysis_version, upload_timestamp desc)
+    where processing_status = 'completed';
+
+-- save_song_analysis (save_song_analysis.sql, which must be run first) only
+-- copied processing_status and duration from p_song, so analysis_version
+-- never reached the row and no later upload could match it. This version
+-- writes every key present in p_song, like upsert_by_song_id does.
+create or replace function save_song_analysis(
+    p_song_id uuid,
+    p_analysis jsonb,
+    p_insights jsonb default null,
+    p_song jsonb default '{}'::jsonb
+)
+returns void
+language plpgsql
+as $$
+declare
+    updates text;
+begin
+    perform upsert_by_song_id('analysis',
+                              p_analysis || jsonb_build_object('song_id', p_song_id));
+
+    if p_insights is not null then
+        perform upsert_by_song_id('marketing_insights',
+                                  p_insights || jsonb_build_object('song_id', p_song_id));
+    end if;
+
+    if p_song is not null and p_song <> '{}'::jsonb then
+        select string_agg(format('%1$I = r.%1$I', key), ', ')
+          into updates
+          from jsonb_object_keys(p_song - 'id') as key;
+
+        if updates is not null then
+            execute format(
+                'update songs set %s from jsonb_populate_record(null::songs, $1) as r '
+                'where songs.id = $2',
+                updates
+            ) using p_song, p_song_id;
+        end if;
+    end if;
+end;
+$$;
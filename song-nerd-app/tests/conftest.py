@@ -0,0 +1,101 @@
+# conftest.py
+# Run from song-nerd-app: python -m pytest -q
+
+import os
+import sys
+import types
+from unittest import mock
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+import features_path  # noqa: F401,E402  (scripts/features modules)
+import backend_path  # noqa: F401,E402  (modules shared with backend/)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+AUDIO_FEATURES = ['danceability', 'energy', 'valence', 'acousticness',
+                  'instrumentalness', 'liveness', 'speechiness']
+PLATFORMS = ['spotify', 'tiktok', 'youtube']
+
+
+@pytest.fixture(scope='session')
+def training_data():
+    """Small random training set with every column the models are trained on"""
+    rng = np.random.default_rng(0)
+    n = 400
+    df = pd.DataFrame(rng.random((n, len(AUDIO_FEATURES))), columns=AUDIO_FEATURES)
+    df['audio_appeal'] = rng.random(n) * 100
+    df['normalized_popularity'] = rng.random(n)
+    df['tempo'] = rng.uniform(60, 180, n)
+    df['genre_clean'] = rng.choice(['pop', 'rock', 'hip hop', 'indie'], n)
+    df['age_group'] = rng.choice(['13-17', '18-24', '25-34', '35+'], n)
+    df['region'] = rng.choice(['NA', 'EU', 'LATAM'], n)
+    df['preferred_platform'] = rng.choice(PLATFORMS, n)
+    for platform in PLATFORMS:
+        df[platform] = rng.random(n) * 50
+        df[f'{platform}_synthetic'] = rng.random(n) * 60
+    df['artist_name_clean'] = [f'artist{i % 60}' for i in range(n)]
+    df['track_name_clean'] = [f'track{i}' for i in range(n)]
+    df['genre_category'] = df['genre_clean']
+    df['popularity_tier'] = rng.choice(['emerging', 'growing', 'established'], n)
+    df['primary_platform'] = df['preferred_platform']
+    df['platform_count'] = 1
+    df['is_multi_platform'] = False
+    return df
+
+
+@pytest.fixture(scope='session')
+def models_dir(training_data, tmp_path_factory):
+    """Directory of models trained on training_data, laid out as load_models expects"""
+    from demographics_model_adapted import DemographicsPredictor
+    from robust_platform_model import RobustPlatformRecommender
+    from similar_artists_adapted import SimilarArtistFinder
+
+    path = tmp_path_factory.mktemp('models')
+    DemographicsPredictor().train(training_data.copy()).save_model(
+        str(path / 'demographics_predictor.pkl'))
+    RobustPlatformRecommender().train(training_data.copy()).save_model(
+        str(path / 'robust_platform_recommender.pkl'))
+    SimilarArtistFinder().build_artist_database(training_data.copy()).save_model(
+        str(path / 'similar_artists.pkl'))
+    return f'{path}/'
+
+
+@pytest.fixture
+def songs():
+    """Feature rows for a few new songs, one with a missing value"""
+    rng = np.random.default_rng(1)
+    rows = []
+    for i in range(6):
+        row = dict(zip(AUDIO_FEATURES, rng.random(len(AUDIO_FEATURES))))
+        row.update(audio_appeal=float(rng.random() * 100), normalized_popularity=0.5,
+                   tempo=float(rng.uniform(60, 180)),
+                   genre_clean=['pop', 'rock', 'hip hop'][i % 3],
+                   spotify=0, tiktok=0, youtube=0)
+        rows.append(row)
+    rows[2]['valence'] = np.nan
+    return rows
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """api_supabase against a fake Supabase client, keeping its files under tmp_path"""
+    pytest.importorskip('uvicorn')
+    client = mock.MagicMock()
+    config = types.ModuleType('supabase_config')
+    config.get_supabase_client = lambda: client
+    config.get_admin_client = lambda: client
+    monkeypatch.setitem(sys.modules, 'supabase_config', config)
+    monkeypatch.setenv('FEATURE_CACHE_DIR', str(tmp_path / 'feature-cache'))
+    monkeypatch.setenv('EXTRACTION_WORKERS', '1')
+    monkeypatch.setenv('JOB_QUEUE_DB', str(tmp_path / 'jobs.db'))
+    monkeypatch.setenv('UPLOAD_DIR', str(tmp_path / 'uploads'))
+    monkeypatch.delitem(sys.modules, 'api_supabase', raising=False)
+
+    import api_supabase
+    yield api_supabase
+    sys.modules.pop('api_supabase', None)
@@ -0,0 +1,13 @@
+# test_app_startup.py
+# api_supabase imports and runs its lifespan against a fake Supabase client
+
+from fastapi.testclient import TestClient
+
+
+def test_lifespan_starts_and_stops(api):
+    with TestClient(api.app) as client:
+        response = client.get('/')
+        assert client.get('/health/live').json() == {'status': 'alive'}
+        assert client.get('/health/ready').json()['database'] == 'supabase-connected'
+    assert response.status_code == 200
+    assert response.json()['status'] == 'running'
@@ -0,0 +1,77 @@
+# test_batch_feature_extraction.py
+# Finding audio files and extracting them over the process pool
+
+import csv
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import batch_feature_extraction
+from audio_processor import AudioFeatureExtractor
+from batch_feature_extraction import (BatchFeatureExtractor, CSVFeatureSink, FEATURE_COLUMNS,
+                                      discover_audio_files)
+
+SR = 22050
+
+
+def write_tone(path, frequency, seconds=3.0):
+    t = np.arange(int(SR * seconds)) / SR
+    y = 0.3 * np.sin(2 * np.pi * frequency * t) * (1 + np.sin(2 * np.pi * 2 * t)) / 2
+    sf.write(str(path), y.astype(np.float32), SR)
+    return str(path)
+
+
+def test_discover_directory_and_manifests(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    for name in ('b.wav', 'a.MP3', 'sub/c.flac', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+    assert discover_audio_files(tmp_path) == [
+        str(tmp_path / 'a.MP3'), str(tmp_path / 'b.wav'), str(tmp_path / 'sub' / 'c.flac')]
+
+    (tmp_path / 'list.txt').write_text('# catalogue\nb.wav\n\n/abs/x.mp3\n')
+    assert discover_audio_files(tmp_path / 'list.txt') == [str(tmp_path / 'b.wav'), '/abs/x.mp3']
+
+    (tmp_path / 'list.csv').write_text('path,title\nsub/c.flac,C\n')
+    assert discover_audio_files(tmp_path / 'list.csv') == [str(tmp_path / 'sub' / 'c.flac')]
+
+    (tmp_path / 'bad.csv').write_text('title\nC\n')
+    with pytest.raises(ValueError):
+        discover_audio_files(tmp_path / 'bad.csv')
+    with pytest.raises(FileNotFoundError):
+        discover_audio_files(tmp_path / 'missing.txt')
+
+
+def test_batch_rows_match_single_file_extraction(tmp_path):
+    paths = [write_tone(tmp_path / 'low.wav', 220.0), write_tone(tmp_path / 'high.wav', 660.0)]
+    broken = tmp_path / 'broken.wav'
+    broken.write_bytes(b'RIFF not really audio')
+    output = tmp_path / 'features.csv'
+
+    summary = BatchFeatureExtractor(max_workers=2, max_in_flight=2).run(
+        [*paths, str(broken)], CSVFeatureSink(str(output)), log_every=1)
+    assert (summary['total'], summary['succeeded'], summary['failed']) == (3, 2, 1)
+
+    with open(output, newline='') as f:
+        rows = {row['file_path']: row for row in csv.DictReader(f)}
+    assert rows[str(broken)]['error']
+
+    extractor = AudioFeatureExtractor(excerpt='full')
+    for path in paths:
+        expected = extractor.extract_features(path)
+        assert not rows[path]['error']
+        for column in FEATURE_COLUMNS:
+            assert float(rows[path][column]) == pytest.approx(float(expected[column]), rel=1e-6)
+
+
+def test_import_leaves_logging_unconfigured():
+    # Only the CLI configures logging; an importing app keeps its own setup
+    code = ('import logging, sys; sys.path.insert(0, sys.argv[1]); '
+            'import batch_feature_extraction; print(len(logging.getLogger().handlers))')
+    features_dir = os.path.dirname(batch_feature_extraction.__file__)
+    result = subprocess.run([sys.executable, '-c', code, features_dir],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '0'
@@ -0,0 +1,100 @@
+# test_batch_predictors.py
+# Each batch predictor returns, row for row, what it returns for one song
+
+import math
+
+import pandas as pd
+import pytest
+
+from demographics_model_adapted import DemographicsPredictor
+from robust_platform_model import RobustPlatformRecommender
+from similar_artists_adapted import SimilarArtistFinder
+from integrated_analyzer import MusicMarketingAnalyzer
+
+
+def assert_same(batch, single, path=''):
+    """Equal structures, with floats compared to rounding error"""
+    if isinstance(single, dict):
+        assert batch.keys() == single.keys(), path
+        for key in single:
+            assert_same(batch[key], single[key], f'{path}/{key}')
+    elif isinstance(single, (list, tuple)):
+        assert len(batch) == len(single), path
+        for i, (b, s) in enumerate(zip(batch, single)):
+            assert_same(b, s, f'{path}[{i}]')
+    elif isinstance(single, float):
+        assert math.isclose(batch, single, rel_tol=1e-9, abs_tol=1e-12), path
+    else:
+        assert batch == single, path
+
+
+@pytest.fixture(scope='module')
+def demographics(models_dir):
+    return DemographicsPredictor().load_model(f'{models_dir}demographics_predictor.pkl')
+
+
+@pytest.fixture(scope='module')
+def platforms(models_dir):
+    return RobustPlatformRecommender().load_model(f'{models_dir}robust_platform_recommender.pkl')
+
+
+def test_demographics_batch_matches_single(demographics, songs):
+    batch = demographics.predict_batch(pd.DataFrame(songs))
+    single = [demographics.predict(pd.DataFrame([song])) for song in songs]
+    assert_same(batch, single)
+
+
+def test_demographics_batch_leaves_input_unchanged(demographics, songs):
+    frame = pd.DataFrame(songs)
+    before = frame.copy()
+    demographics.predict_batch(frame)
+    pd.testing.assert_frame_equal(frame, before)
+
+
+def test_platform_batch_matches_single(platforms, songs):
+    batch = platforms.predict_batch(pd.DataFrame(songs))
+    single = [platforms.predict(pd.DataFrame([song])) for song in songs]
+    assert_same(batch, single)
+
+
+def test_missing_values_do_not_depend_on_other_rows(demographics, platforms, songs):
+    # The song with a missing value gets the same result whatever it is batched with
+    others = [song for i, song in enumerate(songs) if i != 2]
+    for model in (demographics, platforms):
+        alone = model.predict_batch(pd.DataFrame([songs[2]]))[0]
+        with_first = model.predict_batch(pd.DataFrame([songs[2], *others[:2]]))[0]
+        with_rest = model.predict_batch(pd.DataFrame([songs[2], *others[2:]]))[0]
+        assert_same(with_first, alone)
+        assert_same(with_rest, alone)
+
+
+@pytest.fixture
+def complete_songs(songs):
+    # Similar-artist search has no fill for missing values; drop the gap
+    return [{k: v for k, v in song.items() if not (isinstance(v, float) and math.isnan(v))}
+            for song in songs]
+
+
+def test_similar_artists_batch_matches_single(models_dir, complete_songs):
+    finder = SimilarArtistFinder().load_model(f'{models_dir}similar_artists.pkl')
+    batch = finder.find_similar_artists_batch(complete_songs, top_k=5)
+    single = [finder.find_similar_artists(song, top_k=5) for song in complete_songs]
+    assert_same(batch, single)
+    assert all(len(result['similar_artists']) == 5 for result in batch)
+
+
+def test_analyze_batch_matches_analyze_song(models_dir, complete_songs, capsys):
+    analyzer = MusicMarketingAnalyzer().load_models(models_dir)
+    assert analyzer.models_loaded
+    # One song relies on the analyzer's defaults for a feature and the genre
+    complete_songs[1].pop('valence')
+    complete_songs[1].pop('genre_clean')
+    metadata = [{'track_name': f'Track {i}', 'artist_name': 'Someone', 'genre': 'rock'}
+                for i in range(len(complete_songs))]
+
+    batch = analyzer.analyze_batch(complete_songs, metadata)
+    # Scored as one batch, not by falling back to one song at a time
+    assert 'Error during batch analysis' not in capsys.readouterr().out
+    single = [analyzer.analyze_song(song, meta) for song, meta in zip(complete_songs, metadata)]
+    assert all('error' not in analysis for analysis in single)
+    assert_same(batch, single)
@@ -0,0 +1,67 @@
+# test_feature_cache.py
+# FeatureCache hits, misses and least-recently-read eviction
+
+import itertools
+
+import numpy as np
+import pytest
+
+import feature_cache
+from feature_cache import FeatureCache, audio_content_hash, file_content_hash
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Every call sees a later time, so LRU order does not hinge on clock resolution
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(feature_cache.time, 'time', lambda: float(next(ticks)))
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    assert cache.get('v1:a') is None
+    cache.put('v1:a', {'tempo': np.float64(120.0), 'chroma': np.arange(3)})
+    assert cache.get('v1:a') == {'tempo': 120.0, 'chroma': [0, 1, 2]}
+    assert cache.stats()['entries'] == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_read_by_count(tmp_path):
+    cache = FeatureCache(str(tmp_path), max_entries=2)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    cache.get('a')
+    cache.put('c', {'n': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+    assert cache.get('c') == {'n': 3}
+    assert cache.stats()['entries'] == 2
+
+
+def test_evicts_by_bytes(tmp_path):
+    payload = {'x': 'y' * 90}
+    size = len(feature_cache.json.dumps(payload))
+    cache = FeatureCache(str(tmp_path), max_entries=None, max_bytes=size * 2)
+    for key in 'abc':
+        cache.put(key, payload)
+
+    assert cache.get('a') is None
+    assert cache.stats()['size_bytes'] <= size * 2
+    assert cache.get('b') == payload and cache.get('c') == payload
+
+
+def test_content_hash_depends_on_signal_and_rate():
+    y = np.linspace(-1, 1, 1000, dtype=np.float32)
+    assert audio_content_hash(y, 22050) == audio_content_hash(y.astype(np.float64), 22050)
+    assert audio_content_hash(y, 22050) != audio_content_hash(y, 44100)
+    assert audio_content_hash(y, 22050) != audio_content_hash(y[::-1], 22050)
+
+
+def test_file_hash_depends_on_bytes_and_extra(tmp_path):
+    a, b = tmp_path / 'a.wav', tmp_path / 'b.wav'
+    a.write_bytes(b'x' * 3000)
+    b.write_bytes(b'x' * 2999 + b'y')
+    assert file_content_hash(str(a), chunk_size=1000) == file_content_hash(str(a))
+    assert file_content_hash(str(a)) != file_content_hash(str(b))
+    assert file_content_hash(str(a), extra=22050) != file_content_hash(str(a), extra=16000)
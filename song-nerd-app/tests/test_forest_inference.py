@@ -0,0 +1,80 @@
+# test_forest_inference.py
+# CompiledForest gives the same predictions as the scikit-learn forest
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+
+from forest_inference import CompiledForest, compile_forest, MAX_COMPILED_ROWS
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 6))
+    y_class = np.array(['a', 'b', 'c'])[(X[:, 0] + X[:, 1] > 0).astype(int) + (X[:, 2] > 1)]
+    y_value = X[:, 0] * 3 + np.sin(X[:, 3]) + rng.normal(scale=0.1, size=500)
+    return X, y_class, y_value
+
+
+@pytest.fixture(scope='module')
+def rows():
+    rng = np.random.default_rng(1)
+    return rng.normal(size=(MAX_COMPILED_ROWS + 20, 6))
+
+
+@pytest.mark.parametrize('max_depth', [None, 4])
+def test_classifier_matches_sklearn(data, rows, max_depth):
+    X, y_class, _ = data
+    forest = RandomForestClassifier(n_estimators=25, max_depth=max_depth,
+                                    min_samples_leaf=3, random_state=0).fit(X, y_class)
+    compiled = compile_forest(forest)
+    assert isinstance(compiled, CompiledForest)
+
+    for batch in (rows[:1], rows[:MAX_COMPILED_ROWS], rows):
+        np.testing.assert_allclose(compiled.predict_proba(batch), forest.predict_proba(batch),
+                                   rtol=0, atol=1e-12)
+        np.testing.assert_array_equal(compiled.predict(batch), forest.predict(batch))
+
+
+def test_regressor_matches_sklearn(data, rows):
+    X, _, y_value = data
+    forest = RandomForestRegressor(n_estimators=25, max_depth=8, random_state=0).fit(X, y_value)
+    compiled = compile_forest(forest)
+    for batch in (rows[:1], rows[:MAX_COMPILED_ROWS], rows):
+        np.testing.assert_allclose(compiled.predict(batch), forest.predict(batch),
+                                   rtol=1e-12, atol=1e-12)
+
+
+def test_training_rows_match(data):
+    # Training rows sit exactly on the sides of the learnt thresholds
+    X, y_class, _ = data
+    forest = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y_class)
+    compiled = compile_forest(forest)
+    np.testing.assert_allclose(compiled.predict_proba(X[:MAX_COMPILED_ROWS]),
+                               forest.predict_proba(X[:MAX_COMPILED_ROWS]), atol=1e-12)
+
+
+def test_wraps_forest_attributes(data):
+    X, y_class, _ = data
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y_class)
+    compiled = compile_forest(forest)
+    assert list(compiled.classes_) == ['a', 'b', 'c']
+    np.testing.assert_array_equal(compiled.feature_importances_, forest.feature_importances_)
+
+
+def test_compile_forest_passes_through_other_models(data):
+    X, _, y_value = data
+    linear = LinearRegression().fit(X, y_value)
+    assert compile_forest(None) is None
+    assert compile_forest(linear) is linear
+    compiled = compile_forest(RandomForestRegressor(n_estimators=2).fit(X, y_value))
+    assert compile_forest(compiled) is compiled
+
+
+def test_multi_output_forests_are_rejected(data):
+    X, _, y_value = data
+    forest = RandomForestRegressor(n_estimators=2).fit(X, np.stack([y_value, -y_value], axis=1))
+    with pytest.raises(ValueError):
+        CompiledForest(forest)
@@ -0,0 +1,131 @@
+# test_job_queue.py
+# JobQueue leases, retries, reaping and dedupe
+
+import time
+
+import pytest
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'), visibility_timeout=60, max_attempts=2,
+                    backoff_base=0.0)
+
+
+def test_claim_leases_oldest_job_once(queue):
+    first = queue.enqueue('analyze', {'n': 1})
+    queue.enqueue('analyze', {'n': 2}, delay=0.01)
+
+    job = queue.claim('w1')
+    assert job['id'] == first and job['payload'] == {'n': 1}
+    assert job['status'] == 'running' and job['attempts'] == 1 and job['worker_id'] == 'w1'
+    assert job['lease_expires_at'] > time.time()
+
+    time.sleep(0.02)
+    second = queue.claim('w2')
+    assert second['payload'] == {'n': 2}
+    assert queue.claim('w3') is None
+
+
+def test_claim_filters_kinds_and_skips_delayed(queue):
+    queue.enqueue('other', {})
+    queue.enqueue('analyze', {}, delay=60)
+    assert queue.claim('w1', kinds=['analyze']) is None
+    assert queue.claim('w1', kinds=['other'])['kind'] == 'other'
+
+
+def test_complete_and_heartbeat_only_by_lease_holder(queue):
+    job_id = queue.enqueue('analyze', {})
+    queue.claim('w1')
+    assert not queue.heartbeat(job_id, 'w2')
+    assert queue.heartbeat(job_id, 'w1')
+    assert not queue.complete(job_id, 'w2')
+    assert queue.complete(job_id, 'w1')
+    assert queue.get(job_id)['status'] == 'succeeded'
+
+
+def test_fail_retries_then_dead_letters(queue):
+    job_id = queue.enqueue('analyze', {}, dedupe_key='song-1')
+
+    queue.claim('w1')
+    assert queue.fail(job_id, 'w1', 'boom') == 'queued'
+    job = queue.get(job_id)
+    assert job['status'] == 'queued' and job['last_error'] == 'boom'
+    assert queue.latest_stage('song-1')['stage'] == 'queued'
+
+    queue.claim('w1')
+    assert queue.fail(job_id, 'w1', 'boom again') == 'dead'
+    assert queue.get(job_id)['status'] == 'dead'
+    assert queue.latest_stage('song-1')['stage'] == 'failed'
+    assert queue.claim('w1') is None
+    assert queue.fail(job_id, 'w1', 'late') is None
+
+    assert queue.requeue(job_id)
+    assert queue.claim('w1')['attempts'] == 1
+
+
+def test_fail_backs_off_exponentially(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), max_attempts=5, backoff_base=10.0,
+                     backoff_max=25.0)
+    job_id = queue.enqueue('analyze', {})
+    queue.claim('w1')
+    before = time.time()
+    queue.fail(job_id, 'w1', 'boom')
+    assert 8.0 <= queue.get(job_id)['available_at'] - before <= 12.5
+    assert queue.claim('w1') is None
+
+    for attempts, low, high in ((2, 16.0, 24.0), (3, 20.0, 30.0), (4, 20.0, 30.0)):
+        for _ in range(20):
+            assert low <= queue._backoff(attempts) <= high
+
+
+def test_release_does_not_count_attempt(queue):
+    job_id = queue.enqueue('analyze', {})
+    queue.claim('w1')
+    assert queue.release(job_id, 'w1')
+    job = queue.claim('w2')
+    assert job['id'] == job_id and job['attempts'] == 1
+
+
+def test_expired_lease_is_reclaimed_then_reaped(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), visibility_timeout=0, max_attempts=2)
+    job_id = queue.enqueue('analyze', {}, dedupe_key='song-1')
+
+    queue.claim('w1')
+    # First attempt lost its lease: the job is claimable again, not reaped
+    assert queue.reap_expired() == []
+    job = queue.claim('w2')
+    assert job['id'] == job_id and job['attempts'] == 2
+
+    # Last attempt lost too: dead-lettered by the reaper
+    assert queue.claim('w3') is None
+    reaped = queue.reap_expired()
+    assert [job['id'] for job in reaped] == [job_id]
+    job = queue.get(job_id)
+    assert job['status'] == 'dead' and 'lease expired' in job['last_error']
+    assert queue.latest_stage('song-1')['stage'] == 'failed'
+
+
+def test_dedupe_key_allows_one_live_job(queue):
+    first = queue.enqueue('analyze', {'v': 1}, dedupe_key='song-1')
+    assert queue.enqueue('analyze', {'v': 2}, dedupe_key='song-1') == first
+    assert queue.depth() == 1
+
+    queue.claim('w1')
+    assert queue.enqueue('analyze', {}, dedupe_key='song-1') == first
+
+    queue.complete(first, 'w1')
+    second = queue.enqueue('analyze', {}, dedupe_key='song-1')
+    assert second != first
+    assert queue.latest_stage('song-1')['job_id'] == second
+    assert queue.stats()['queued'] == 1 and queue.stats()['succeeded'] == 1
+
+
+def test_report_stage_updates_running_job(queue):
+    queue.enqueue('analyze', {}, dedupe_key='song-1')
+    assert not queue.report_stage('song-1', 'extracting')
+    queue.claim('w1')
+    assert queue.report_stage('song-1', 'extracting')
+    assert queue.latest_stage('song-1')['stage'] == 'extracting'
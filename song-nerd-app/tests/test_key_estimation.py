@@ -0,0 +1,47 @@
+# test_key_estimation.py
+# Krumhansl-Schmuckler key finding
+
+import numpy as np
+import pytest
+
+from key_estimation import (KRUMHANSL_MAJOR, KRUMHANSL_MINOR, key_correlations,
+                            estimate_key, estimate_key_windows, key_name)
+
+
+@pytest.mark.parametrize('tonic', range(12))
+def test_profiles_identify_their_own_key(tonic):
+    assert estimate_key(np.roll(KRUMHANSL_MAJOR, tonic)) == (tonic, 1, pytest.approx(1.0))
+    assert estimate_key(np.roll(KRUMHANSL_MINOR, tonic)) == (tonic, 0, pytest.approx(1.0))
+
+
+def test_correlations_match_pearson():
+    rng = np.random.default_rng(0)
+    chroma = rng.random(12)
+    expected = [np.corrcoef(chroma, np.roll(profile, tonic))[0, 1]
+                for profile in (KRUMHANSL_MAJOR, KRUMHANSL_MINOR) for tonic in range(12)]
+    np.testing.assert_allclose(key_correlations(chroma), expected, atol=1e-12)
+
+
+def test_triads():
+    def chord(*pitches):
+        chroma = np.full(12, 0.1)
+        chroma[list(pitches)] = 1.0
+        return chroma
+
+    assert key_name(*estimate_key(chord(0, 4, 7))[:2]) == 'C major'
+    assert key_name(*estimate_key(chord(9, 0, 4))[:2]) == 'A minor'
+    assert key_name(*estimate_key(chord(7, 11, 2))[:2]) == 'G major'
+
+
+def test_chromagram_is_averaged_over_frames():
+    frames = np.stack([np.roll(KRUMHANSL_MINOR, 4)] * 5, axis=1)
+    assert estimate_key(frames)[:2] == (4, 0)
+
+
+def test_windows_and_silence():
+    chroma = np.stack([np.roll(KRUMHANSL_MAJOR, 2), np.zeros(12), np.roll(KRUMHANSL_MINOR, 9)],
+                      axis=1)
+    keys, modes, confidences = estimate_key_windows(chroma)
+    assert keys[0] == 2 and modes[0] == 1
+    assert confidences[1] == 0.0
+    assert keys[2] == 9 and modes[2] == 0
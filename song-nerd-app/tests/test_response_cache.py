@@ -0,0 +1,108 @@
+# test_response_cache.py
+# ResponseCache LRU, TTL, ETags and invalidation across processes
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, etag_matches, make_etag
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, 'time', clock)
+    return clock
+
+
+def test_put_get_and_etag(clock):
+    cache = ResponseCache()
+    etag = cache.put('song-1', b'{"a": 1}')
+    assert etag == make_etag(b'{"a": 1}')
+    assert cache.get('song-1') == (etag, b'{"a": 1}')
+    assert cache.get('song-2') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(ttl=10)
+    cache.put('song-1', b'x')
+    clock.now += 9.9
+    assert cache.get('song-1') is not None
+    clock.now += 0.2
+    assert cache.get('song-1') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_shared_entries_expire_after_ttl(clock, tmp_path):
+    path = str(tmp_path / 'responses.db')
+    ResponseCache(ttl=10, shared_path=path).put('song-1', b'x')
+    clock.now += 11
+    assert ResponseCache(ttl=10, shared_path=path).get('song-1') is None
+
+
+def test_lru_bound(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.put('a', b'a')
+    cache.put('b', b'b')
+    cache.get('a')
+    cache.put('c', b'c')
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_shared_tier_serves_other_instances(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    writer = ResponseCache(shared_path=path)
+    reader = ResponseCache(shared_path=path)
+    etag = writer.put('song-1', b'body')
+    assert reader.get('song-1') == (etag, b'body')
+
+
+def test_invalidate_reaches_other_instances(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    api = ResponseCache(shared_path=path)
+    worker = ResponseCache(shared_path=path)
+    api.put('song-1', b'old')
+    assert api.get('song-1') is not None
+
+    worker.invalidate('song-1')
+    # The api's in-process copy is dropped, not served until its TTL
+    assert api.get('song-1') is None
+
+    etag = api.put('song-1', b'new')
+    assert worker.get('song-1') == (etag, b'new')
+
+
+def test_invalidate_from_another_process(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    cache = ResponseCache(shared_path=path)
+    cache.put('song-1', b'old')
+
+    subprocess.run(
+        [sys.executable, '-c',
+         'import sys; from response_cache import ResponseCache; '
+         'ResponseCache(shared_path=sys.argv[1]).invalidate("song-1")', path],
+        check=True, cwd=os.path.dirname(os.path.abspath(response_cache.__file__)))
+    assert cache.get('song-1') is None
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('W/"abc"', etag)
+    assert etag_matches('"x", "abc"', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"abd"', etag)
+    assert not etag_matches(None, etag)
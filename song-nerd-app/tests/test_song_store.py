@@ -0,0 +1,133 @@
+# test_song_store.py
+# Keyset cursors, InMemorySongStore paging and the Supabase query shapes
+
+import asyncio
+from unittest import mock
+
+import pytest
+
+from song_store import (InMemorySongStore, SupabaseSongStore, AsyncSongStore,
+                        encode_cursor, decode_cursor)
+
+
+def test_cursor_round_trip():
+    song = {'upload_timestamp': '2025-01-02T03:04:05.678', 'id': 'a,b.(c)'}
+    cursor = encode_cursor(song)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == ('2025-01-02T03:04:05.678', 'a,b.(c)')
+
+
+@pytest.mark.parametrize('cursor', ['', 'not-base64!', 'WzFd', 'eyJhIjoxfQ'])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.fixture
+def store():
+    store = InMemorySongStore()
+    # Pairs of songs share a timestamp, so paging must break ties on id
+    for i in range(11):
+        store.insert_song({'id': f'song-{i:02d}', 'upload_timestamp': f'2025-01-01T00:00:{i // 2:02d}',
+                           'genre': 'rock' if i % 3 == 0 else 'pop',
+                           'processing_status': 'completed'})
+    return store
+
+
+def page_through(store, limit, **kwargs):
+    seen, cursor = [], None
+    while True:
+        page = store.list_songs(limit=limit, cursor=cursor, **kwargs)
+        seen.extend(page)
+        if len(page) < limit:
+            return seen
+        cursor = decode_cursor(encode_cursor(page[-1]))
+
+
+def test_keyset_pages_cover_every_song_once_newest_first(store):
+    everything = store.list_songs()
+    assert [s['id'] for s in everything] == [f'song-{i:02d}' for i in reversed(range(11))]
+    for limit in (1, 3, 4, 11):
+        assert page_through(store, limit) == everything
+
+
+def test_paging_with_filters_and_projection(store):
+    rock = page_through(store, 2, columns='id, upload_timestamp', filters={'genre': 'rock'})
+    assert [s['id'] for s in rock] == ['song-09', 'song-06', 'song-03', 'song-00']
+    assert set(rock[0]) == {'id', 'upload_timestamp'}
+    assert store.count_songs({'genre': 'rock'}) == 4
+    assert store.count_songs() == 11
+
+
+def test_insert_rejects_duplicate_ids(store):
+    with pytest.raises(ValueError):
+        store.insert_song({'id': 'song-00'})
+
+
+def test_get_and_update(store):
+    store.update_song('song-01', {'processing_status': 'failed'})
+    assert store.get_song('song-01', 'id,processing_status') == {
+        'id': 'song-01', 'processing_status': 'failed'}
+    assert store.get_song('missing') is None
+
+
+def test_save_analysis_keeps_first_created_at(store):
+    store.save_analysis_results('song-01', {'score': 1}, None, {'duration': 3.0})
+    created = store.get_analysis('song-01')[0]['created_at']
+    store.save_analysis_results('song-01', {'score': 2})
+    analysis, insights = store.get_analysis('song-01')
+    assert analysis == {'score': 2, 'song_id': 'song-01', 'created_at': created}
+    assert insights is None
+    assert store.get_song('song-01')['duration'] == 3.0
+
+
+def test_supabase_keyset_filter_quotes_values():
+    client = mock.MagicMock()
+    query = client.table.return_value.select.return_value
+    query.eq.return_value = query
+    query.or_.return_value = query
+    query.order.return_value = query
+    query.limit.return_value = query
+    query.execute.return_value.data = []
+
+    SupabaseSongStore(client).list_songs(limit=5, cursor=('2025-01-01T00:00:00', 'a"b'),
+                                         filters={'genre': 'pop'})
+    query.eq.assert_called_once_with('genre', 'pop')
+    query.or_.assert_called_once_with(
+        'upload_timestamp.lt."2025-01-01T00:00:00",'
+        'and(upload_timestamp.eq."2025-01-01T00:00:00",id.lt."a\\"b")')
+    assert query.order.call_args_list == [mock.call('upload_timestamp', desc=True),
+                                          mock.call('id', desc=True)]
+    query.limit.assert_called_once_with(5)
+
+
+def test_supabase_save_falls_back_without_rpc():
+    client = mock.MagicMock()
+    client.rpc.return_value.execute.side_effect = Exception("PGRST202: function not found")
+    store = SupabaseSongStore(client)
+
+    store.save_analysis_results('s1', {'score': 1}, {'tip': 'x'}, {'processing_status': 'completed'})
+    store.save_analysis_results('s2', {'score': 2})
+    assert client.rpc.call_count == 1
+    upserts = client.table.return_value.upsert.call_args_list
+    assert upserts[0] == mock.call({'score': 1, 'song_id': 's1'}, on_conflict='song_id')
+    assert upserts[1] == mock.call({'tip': 'x', 'song_id': 's1'}, on_conflict='song_id')
+    client.table.return_value.update.assert_called_once_with({'processing_status': 'completed'})
+
+
+def test_async_store_reports_calls():
+    calls = []
+    store = AsyncSongStore(InMemorySongStore(), on_call=lambda *call: calls.append(call))
+
+    async def run():
+        await store.insert_song({'id': 's1'})
+        with pytest.raises(ValueError):
+            await store.insert_song({'id': 's1'})
+        return await store.count_songs()
+
+    try:
+        assert asyncio.run(run()) == 1
+    finally:
+        store.close()
+    assert [(method, failed) for method, _, failed in calls] == [
+        ('insert_song', False), ('insert_song', True), ('count_songs', False)]
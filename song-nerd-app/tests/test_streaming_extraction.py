@@ -0,0 +1,54 @@
+# test_streaming_extraction.py
+# Streaming extraction against the in-memory path, and its cache entries
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_processor import AudioFeatureExtractor
+from feature_cache import FeatureCache
+
+SR = 22050
+
+
+@pytest.fixture
+def track(tmp_path):
+    # 25s at 44.1kHz, so streaming resamples and spans several blocks
+    sr = 44100
+    t = np.arange(int(sr * 25)) / sr
+    beat = (np.sin(2 * np.pi * 2 * t) > 0.95).astype(float)
+    y = 0.3 * np.sin(2 * np.pi * 330 * t) + 0.2 * np.sin(2 * np.pi * 440 * t) + 0.4 * beat
+    path = tmp_path / 'track.wav'
+    sf.write(str(path), (y / np.abs(y).max() * 0.8).astype(np.float32), sr)
+    return str(path)
+
+
+def test_streaming_matches_full_extraction(track):
+    full = AudioFeatureExtractor().extract_features(track)
+    streamed = AudioFeatureExtractor(streaming=True, block_seconds=4.0).extract_features(track)
+
+    assert set(streamed) == set(full)
+    for name, value in full.items():
+        assert streamed[name] == pytest.approx(value, rel=0.01, abs=1e-3), name
+
+
+def test_streaming_results_are_cached(track, tmp_path, monkeypatch):
+    cache = FeatureCache(str(tmp_path / 'cache'))
+    extractor = AudioFeatureExtractor(cache=cache, streaming=True)
+    decodes = []
+    decode = extractor._iter_decoded_blocks
+    monkeypatch.setattr(extractor, '_iter_decoded_blocks',
+                        lambda path: decodes.append(path) or decode(path))
+
+    # The lookup hashes the file itself, so a miss decodes the track once
+    first = extractor.extract_features(track)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert len(decodes) == 1
+
+    assert extractor.extract_features(track) == pytest.approx(first)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(decodes) == 1
+
+    # Other options are other entries
+    AudioFeatureExtractor(cache=cache, streaming=True, sample_rate=16000).extract_features(track)
+    assert (cache.hits, cache.misses) == (1, 2)
@@ -0,0 +1,68 @@
+# test_upload_dedup.py
+# An upload of already analysed audio finds and copies the earlier analysis
+
+from song_store import InMemorySongStore
+
+VERSION = 'models=abc;extractor=2;excerpt=first:60'
+
+
+def upload(store, song_id, content_hash='h1', file_path=None):
+    store.insert_song({'id': song_id, 'content_hash': content_hash,
+                       'file_path': file_path or f'uploads/{song_id}.mp3',
+                       'processing_status': 'pending'})
+
+
+def analyse(store, song_id, version=VERSION):
+    # The fields api_supabase.process_song_with_supabase saves with a result
+    store.save_analysis_results(song_id, {'target_demographic': '18-24'}, {'summary': 'x'},
+                                {'processing_status': 'completed', 'duration': 60.0,
+                                 'analysis_version': version})
+
+
+def test_saved_analysis_is_found_by_hash_and_version():
+    store = InMemorySongStore()
+    upload(store, 'a')
+    analyse(store, 'a')
+
+    assert store.get_song('a')['analysis_version'] == VERSION
+    assert store.find_analysed_song('h1', VERSION) == {
+        'id': 'a', 'duration': 60.0, 'file_path': 'uploads/a.mp3'}
+
+
+def test_no_match_for_other_version_hash_or_unfinished_song():
+    store = InMemorySongStore()
+    upload(store, 'a')
+    assert store.find_analysed_song('h1', VERSION) is None
+
+    analyse(store, 'a')
+    assert store.find_analysed_song('h1', 'models=new;extractor=2;excerpt=first:60') is None
+    assert store.find_analysed_song('h2', VERSION) is None
+
+
+def test_clone_round_trip():
+    store = InMemorySongStore()
+    upload(store, 'a')
+    analyse(store, 'a')
+    upload(store, 'b')
+
+    source = store.find_analysed_song('h1', VERSION)
+    fields = {'processing_status': 'completed', 'duration': source['duration'],
+              'analysis_version': VERSION, 'file_path': source['file_path']}
+    assert store.clone_analysis(source['id'], 'b', fields)
+
+    analysis, insights = store.get_analysis('b')
+    assert analysis['song_id'] == 'b' and analysis['target_demographic'] == '18-24'
+    assert insights == {'summary': 'x', 'song_id': 'b'}
+    song = store.get_song('b')
+    assert song['processing_status'] == 'completed'
+    assert song['file_path'] == 'uploads/a.mp3'
+    # The clone is itself a valid source for the next upload
+    assert store.find_analysed_song('h1', VERSION)['id'] in ('a', 'b')
+
+
+def test_clone_without_source_analysis():
+    store = InMemorySongStore()
+    upload(store, 'a')
+    upload(store, 'b')
+    assert not store.clone_analysis('a', 'b')
+    assert store.get_song('b')['processing_status'] == 'pending'
@@ -0,0 +1,44 @@
+# test_upload_preview.py
+# Preview features are stored at upload and overwritten by the full analysis
+
+import io
+
+import numpy as np
+import soundfile as sf
+from fastapi.testclient import TestClient
+
+from song_store import InMemorySongStore, AsyncSongStore
+
+
+def tone_wav(seconds=4.0, sr=22050):
+    t = np.arange(int(sr * seconds)) / sr
+    buffer = io.BytesIO()
+    sf.write(buffer, (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32), sr, format='WAV')
+    return buffer.getvalue()
+
+
+def test_preview_row_is_stored_then_overwritten(api, monkeypatch):
+    monkeypatch.setenv('JOB_DISPATCHER', 'false')
+    store = InMemorySongStore()
+    with TestClient(api.app) as client:
+        monkeypatch.setattr(api, 'song_store', AsyncSongStore(store))
+        response = client.post('/api/songs/upload', params={'preview': 'true'},
+                               files={'file': ('tone.wav', tone_wav(), 'audio/wav')})
+    assert response.status_code == 200
+    song = response.json()
+    assert song['preview_features']['feature_quality'] == 'preview'
+
+    analysis, insights = store.get_analysis(song['id'])
+    assert analysis['feature_quality'] == 'preview'
+    assert analysis['raw_features'] == song['preview_features']
+    assert insights is None
+    assert store.get_song(song['id'])['processing_status'] == 'pending'
+
+    # What the worker runs for the queued job
+    monkeypatch.setattr(api, 'get_worker_store', lambda: store)
+    api.process_song_with_supabase(song['id'], song['file_path'], {'track_name': 'tone'})
+
+    analysis, _ = store.get_analysis(song['id'])
+    assert analysis['feature_quality'] == 'full'
+    assert analysis['raw_features'] != song['preview_features']
+    assert store.get_song(song['id'])['processing_status'] == 'completed'
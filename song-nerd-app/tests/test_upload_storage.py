@@ -0,0 +1,49 @@
+# test_upload_storage.py
+# stream_upload stores valid audio and leaves nothing behind otherwise
+
+import asyncio
+import hashlib
+import io
+
+import pytest
+
+from upload_storage import stream_upload, UploadTooLarge, UnsupportedAudioFormat
+
+WAV = b'RIFF\x00\x00\x00\x00WAVE' + bytes(range(256)) * 8
+
+
+class FakeUpload:
+    """The part of UploadFile that stream_upload reads"""
+
+    def __init__(self, data, size=None):
+        self.file = io.BytesIO(data)
+        self.size = size
+
+    async def read(self, n):
+        return self.file.read(n)
+
+
+def store(tmp_path, data, **kwargs):
+    return asyncio.run(stream_upload(FakeUpload(data), str(tmp_path), 'song', chunk_size=100,
+                                     **kwargs))
+
+
+def test_stores_with_sniffed_extension_and_hash(tmp_path):
+    stored = store(tmp_path, WAV)
+    assert stored.path == str(tmp_path / 'song.wav')
+    assert (stored.size, stored.format) == (len(WAV), 'wav')
+    assert stored.sha256 == hashlib.sha256(WAV).hexdigest()
+    assert (tmp_path / 'song.wav').read_bytes() == WAV
+    assert [p.name for p in tmp_path.iterdir()] == ['song.wav']
+
+
+@pytest.mark.parametrize('data, kwargs, error', [
+    (WAV, {'max_bytes': 1000}, UploadTooLarge),
+    (b'not audio at all', {}, UnsupportedAudioFormat),
+    (b'', {}, UnsupportedAudioFormat),
+    (WAV, {'allowed_formats': ('mp3',)}, UnsupportedAudioFormat),
+])
+def test_rejected_upload_leaves_no_files(tmp_path, data, kwargs, error):
+    with pytest.raises(error):
+        store(tmp_path, data, **kwargs)
+    assert list(tmp_path.iterdir()) == []